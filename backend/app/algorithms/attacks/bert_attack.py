@@ -1,79 +1,212 @@
+import math
+
 import torch
 import numpy as np
 from typing import List, Optional
 
+from app.algorithms.utils.registry import register_attack
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.text_victim import query_victim, resolve_query_cache
+
 class BERTAttack:
     """
     BERT-Attack实现
     任务书定位：针对BERT等预训练模型的上下文感知攻击算法，用于命名实体识别（NER）等任务
+    流程：
+        1. 把每个位置替换为[MASK]的所有句子放进一个批次查询被攻击模型，得到token重要性
+        2. 对原句做一次掩码语言模型前向，同时取出所有位置的top-K替换词
+        3. 按重要性贪心替换：每一步把所有未成功句子的候选句合并成一个大批次查询被攻击模型
     """
-    
-    def __init__(self, tokenizer=None, max_perturbations=3, mask_prob=0.15):
+
+    def __init__(self, tokenizer=None, max_perturbations=3, mask_prob=0.15, mlm_model=None,
+                 top_k=48, batch_size=128, mlm_batch_size=16, max_length=512, query_cache=None,
+                 monitor=None):
         """
         Args:
-            tokenizer: BERT分词器
+            tokenizer: BERT分词器（transformers的PreTrainedTokenizer，为None时按空格分词）
             max_perturbations: 最大扰动数量
-            mask_prob: 掩码概率
+            mask_prob: 替换token数占句长的比例上限（至少允许替换1个）
+            mlm_model: 掩码语言模型（如BertForMaskedLM，为None时用[MASK]本身作为替换）
+            top_k: 每个位置的候选替换词数
+            batch_size: 查询被攻击模型时每次前向的最大句子数
+            mlm_batch_size: 掩码语言模型每次前向的最大句子数（输出为 句长×词表 大小，需单独限制）
+            max_length: 掩码语言模型的最大输入长度
+            query_cache: 被攻击模型查询缓存（None使用共享默认缓存，False禁用）
+            monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
         """
         self.tokenizer = tokenizer
         self.max_perturbations = max_perturbations
         self.mask_prob = mask_prob
-    
+        self.mlm_model = mlm_model
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.query_cache = resolve_query_cache(query_cache)
+        self.monitor = monitor
+        self.mlm_batch_size = mlm_batch_size
+        self.max_length = max_length
+        self.mask_token = getattr(tokenizer, 'mask_token', None) or '[MASK]'
+
+    def _query(self, model, texts):
+        """查询被攻击模型（计入监控的前向耗时）"""
+        with resolve_monitor(self.monitor).phase('forward'):
+            return query_victim(model, texts, self.batch_size, self.query_cache)
+
+    def _tokenize(self, text):
+        if self.tokenizer:
+            return self.tokenizer.tokenize(text)
+        return text.split()
+
+    def _detokenize(self, tokens):
+        if self.tokenizer and hasattr(self.tokenizer, 'convert_tokens_to_string'):
+            return self.tokenizer.convert_tokens_to_string(tokens)
+        return ' '.join(tokens)
+
     def attack(self, model, texts, labels=None):
         """
         执行BERT-Attack
         Args:
-            model: BERT模型
+            model: 被攻击的模型（接收文本列表，返回logits）
             texts: 输入文本列表
-            labels: 标签列表
+            labels: 标签列表（为None时使用模型对原文的预测）
         Returns:
             adv_texts: 对抗文本列表
         """
-        adv_texts = []
-        
-        for i, text in enumerate(texts):
-            label = labels[i] if labels is not None else None
-            
-            # 分词
-            if self.tokenizer:
-                tokens = self.tokenizer.tokenize(text)
-            else:
-                tokens = text.split()
-            
-            # 生成对抗文本
-            adv_text = self._generate_adversarial_text(model, tokens, label)
-            adv_texts.append(adv_text)
-        
-        return adv_texts
-    
-    def _generate_adversarial_text(self, model, tokens, label):
-        """生成对抗文本"""
-        adv_tokens = tokens.copy()
-        perturbations = 0
-        
-        for i, token in enumerate(tokens):
-            if perturbations >= self.max_perturbations:
+        resolve_monitor(self.monitor).start('BERT-Attack')
+        token_lists = [self._tokenize(text) for text in texts]
+        orig_probs = self._query(model, [self._detokenize(t) for t in token_lists])
+        if labels is None:
+            labels = orig_probs.argmax(dim=1).tolist()
+        labels = [int(label) for label in labels]
+
+        orders = self._calculate_token_importance(model, token_lists, labels, orig_probs)
+        substitutes = self._get_substitutes(token_lists)
+        return self._generate_adversarial_texts(model, token_lists, labels, orig_probs, orders, substitutes)
+
+    def _calculate_token_importance(self, model, token_lists, labels, orig_probs):
+        """
+        计算token重要性
+        所有句子的所有"单个位置掩码"变体一次批量查询，返回每个句子按重要性降序排列的位置
+        """
+        variants, owners = [], []
+        for i, tokens in enumerate(token_lists):
+            for j in range(len(tokens)):
+                variants.append(self._detokenize(tokens[:j] + [self.mask_token] + tokens[j + 1:]))
+                owners.append(i)
+        if not variants:
+            return [[] for _ in token_lists]
+
+        probs = self._query(model, variants)
+        owners = torch.tensor(owners)
+        label_tensor = torch.tensor(labels)
+        scores = orig_probs[owners, label_tensor[owners]] - probs[torch.arange(len(variants)), label_tensor[owners]]
+
+        orders = []
+        start = 0
+        for tokens in token_lists:
+            end = start + len(tokens)
+            orders.append(scores[start:end].argsort(descending=True).tolist())
+            start = end
+        return orders
+
+    def _get_substitutes(self, token_lists):
+        """
+        获取每个句子每个位置的候选替换词
+        对未掩码的原句做一次掩码语言模型前向，同时取出所有位置的top-K预测（BERT-Attack做法）
+        """
+        if self.mlm_model is None or self.tokenizer is None:
+            return [[[self.mask_token] for _ in tokens] for tokens in token_lists]
+
+        tokenizer = self.tokenizer
+        device = next(self.mlm_model.parameters()).device
+        special = set(getattr(tokenizer, 'all_special_tokens', []))
+        max_tokens = self.max_length - 2
+        substitutes = []
+
+        self.mlm_model.eval()
+        with torch.no_grad():
+            for start in range(0, len(token_lists), self.mlm_batch_size):
+                chunk = [tokens[:max_tokens] for tokens in token_lists[start:start + self.mlm_batch_size]]
+                seq_len = max((len(tokens) for tokens in chunk), default=0) + 2
+                input_ids = torch.full((len(chunk), seq_len), tokenizer.pad_token_id, dtype=torch.long)
+                attention_mask = torch.zeros((len(chunk), seq_len), dtype=torch.long)
+                for row, tokens in enumerate(chunk):
+                    ids = [tokenizer.cls_token_id] + tokenizer.convert_tokens_to_ids(tokens) + [tokenizer.sep_token_id]
+                    input_ids[row, :len(ids)] = torch.tensor(ids)
+                    attention_mask[row, :len(ids)] = 1
+
+                logits = self.mlm_model(input_ids=input_ids.to(device),
+                                        attention_mask=attention_mask.to(device)).logits
+                top_ids = logits.topk(self.top_k, dim=-1)[1].cpu()
+
+                for row, tokens in enumerate(token_lists[start:start + self.mlm_batch_size]):
+                    per_position = []
+                    for j, token in enumerate(tokens):
+                        if j >= max_tokens:
+                            per_position.append([])
+                            continue
+                        candidates = tokenizer.convert_ids_to_tokens(top_ids[row, j + 1].tolist())
+                        per_position.append([
+                            c for c in candidates
+                            if c != token and c not in special and not c.startswith('##')
+                        ])
+                    substitutes.append(per_position)
+        return substitutes
+
+    def _generate_adversarial_texts(self, model, token_lists, labels, orig_probs, orders, substitutes):
+        """
+        按重要性贪心替换
+        每一步为所有尚未成功的句子生成当前位置的全部候选句，合并为一个大批次查询；
+        出现预测翻转的候选时取排名最靠前的一个并结束该句，否则保留使原类别置信度下降最多的替换
+        """
+        adv_tokens = [list(tokens) for tokens in token_lists]
+        current_prob = [float(orig_probs[i, labels[i]]) for i in range(len(token_lists))]
+        perturbations = [0] * len(token_lists)
+        limits = [min(self.max_perturbations, max(1, math.ceil(self.mask_prob * len(tokens))))
+                  for tokens in token_lists]
+        done = [False] * len(token_lists)
+        monitor = resolve_monitor(self.monitor)
+
+        for step in range(max((len(order) for order in orders), default=0)):
+            batch_texts, owners, candidates = [], [], []
+            for i, order in enumerate(orders):
+                if done[i] or step >= len(order) or perturbations[i] >= limits[i]:
+                    continue
+                pos = order[step]
+                for word in substitutes[i][pos]:
+                    candidate = adv_tokens[i][:pos] + [word] + adv_tokens[i][pos + 1:]
+                    batch_texts.append(self._detokenize(candidate))
+                    owners.append(i)
+                    candidates.append(candidate)
+            if not batch_texts:
                 break
-            
-            # 计算token重要性
-            importance = self._calculate_token_importance(model, tokens, i, label)
-            
-            if importance > 0.5:  # 重要性阈值
-                # 尝试替换或删除
-                if torch.rand(1).item() < self.mask_prob:
-                    adv_tokens[i] = '[MASK]'
-                    perturbations += 1
-        
-        return ' '.join(adv_tokens)
-    
-    def _calculate_token_importance(self, model, tokens, token_idx, label):
-        """计算token重要性（简化实现）"""
-        # 简化实现：返回随机重要性分数
-        return torch.rand(1).item()
+
+            probs = self._query(model, batch_texts)
+            rows_by_owner = {}
+            for row, i in enumerate(owners):
+                rows_by_owner.setdefault(i, []).append(row)
+
+            for i, rows in rows_by_owner.items():
+                rows_t = torch.tensor(rows)
+                sub_probs = probs[rows_t]
+                flipped = (sub_probs.argmax(dim=1) != labels[i]).nonzero(as_tuple=False).flatten()
+                if flipped.numel() > 0:
+                    adv_tokens[i] = candidates[rows[int(flipped[0])]]
+                    done[i] = True
+                    continue
+                best = int(sub_probs[:, labels[i]].argmin())
+                if float(sub_probs[best, labels[i]]) < current_prob[i]:
+                    adv_tokens[i] = candidates[rows[best]]
+                    current_prob[i] = float(sub_probs[best, labels[i]])
+                    perturbations[i] += 1
+            monitor.record(step, success=sum(done) / len(done), active=len(rows_by_owner), queries=len(batch_texts))
+
+        return [self._detokenize(tokens) for tokens in adv_tokens]
 
 def bert_attack(model, texts, labels=None, **kwargs):
     """
     兼容性函数，保持原有接口
     """
     attacker = BERTAttack(**kwargs)
-    return attacker.attack(model, texts, labels) 
\ No newline at end of file
+    return attacker.attack(model, texts, labels)
+
+register_attack('BERT-Attack', BERTAttack)
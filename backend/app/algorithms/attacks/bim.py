@@ -1,32 +1,35 @@
-import torch
-import torch.nn as nn
+from app.algorithms.utils.iterative import IterativeAttack
+from app.algorithms.utils.registry import register_attack
 
-def bim_attack(model, images, labels, epsilon, alpha, iters, loss_fn=None):
+
+def bim_attack(model, images, labels, epsilon, alpha, iters, loss_fn=None, early_stop=False, restarts=1,
+               norm='linf', monitor=None, targeted=False, target_labels=None, memory=None,
+               compile_step=False, eot=None):
     """
     Basic Iterative Method (BIM) 攻击实现
     Args:
-        model: 被攻击的模型
+        model: 被攻击的模型（或集成攻击的源模型列表）
         images: 输入图片
         labels: 正确标签
         epsilon: 扰动上限
         alpha: 每步步长
         iters: 迭代次数
         loss_fn: 损失函数
+        early_stop: 是否逐样本早停（已攻击成功的样本不再参与后续迭代）
+        restarts: 重启次数（第一次从原图出发，其余在约束球内随机初始化，作为额外批次维度一起计算）
+        norm: 范数约束类型 ('linf', 'l2', 'l1')
+        monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+        targeted: 是否为目标攻击
+        target_labels: 目标标签（目标攻击时使用）
+        memory: 内存受限模式（MemoryPlan或其参数字典，为None时读取config.yml，为False时关闭）
+        compile_step: 是否用torch.compile编译攻击步进
+        eot: 期望变换（EOTTransform、其参数字典或采样数K，为None时只优化原始视角）
     Returns:
         adv_images: 对抗样本
     """
-    ori_images = images.clone().detach()
-    adv_images = ori_images.clone().detach()
-    if loss_fn is None:
-        loss_fn = nn.CrossEntropyLoss()
-    for i in range(iters):
-        adv_images.requires_grad = True
-        outputs = model(adv_images)
-        loss = loss_fn(outputs, labels)
-        model.zero_grad()
-        loss.backward()
-        grad = adv_images.grad.data
-        adv_images = adv_images + alpha * grad.sign()
-        eta = torch.clamp(adv_images - ori_images, min=-epsilon, max=epsilon)
-        adv_images = torch.clamp(ori_images + eta, 0, 1).detach()
-    return adv_images 
\ No newline at end of file
+    attacker = IterativeAttack(norm=norm, epsilon=epsilon, alpha=alpha, iters=iters, random_start=False,
+                               loss_fn=loss_fn, early_stop=early_stop, restarts=restarts, monitor=monitor,
+                               targeted=targeted, memory=memory, compile_step=compile_step, eot=eot)
+    return attacker.attack(model, images, labels, target_labels)
+
+register_attack('BIM', bim_attack)
\ No newline at end of file
@@ -1,38 +1,57 @@
+import functools
+
 import torch
 import torch.nn as nn
 import numpy as np
 
+from app.algorithms.utils.compiled import compiled_kernel, kernel_key
+from app.algorithms.utils.gradient_mode import input_only_gradients
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.registry import register_attack
+
 class CWAttack:
     """
     Carlini & Wagner (C&W) 攻击实现
     任务书定位：针对图像分类模型的经典攻击算法，支持目标导向攻击
     """
     
-    def __init__(self, c=1e-4, kappa=0, iters=1000, lr=0.01, targeted=False):
+    def __init__(self, c=1e-4, kappa=0, iters=1000, lr=0.01, targeted=False,
+                 binary_search_steps=1, abort_early=True, monitor=None, compile_step=False):
         """
         Args:
-            c: 置信度参数
+            c: 置信度参数（二分搜索时作为每个样本的初始值）
             kappa: 置信度阈值
-            iters: 优化迭代次数
+            iters: 每轮二分搜索的优化迭代次数
             lr: 学习率
             targeted: 是否为目标攻击
+            binary_search_steps: 逐样本二分搜索c的轮数（1表示只使用初始c）
+            abort_early: 损失不再下降时提前结束当前一轮搜索
+            monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+            compile_step: 是否用torch.compile把每步的前向、损失和反向编译为融合内核（失败时使用eager）
         """
         self.c = c
         self.kappa = kappa
         self.iters = iters
         self.lr = lr
         self.targeted = targeted
+        self.binary_search_steps = binary_search_steps
+        self.abort_early = abort_early
+        self.monitor = monitor
+        self.compile_step = compile_step
     
+    @input_only_gradients
     def attack(self, model, images, labels, target_labels=None):
         """
         执行C&W攻击
+        每轮二分搜索对整个批次一起优化，每个样本使用各自的c；
+        攻击成功的样本减小c，失败的样本增大c，并保留每个样本扰动最小的成功对抗样本
         Args:
             model: 被攻击的模型
             images: 输入图片
             labels: 正确标签
             target_labels: 目标标签（目标攻击时使用）
         Returns:
-            adv_images: 对抗样本
+            adv_images: 对抗样本（未攻击成功的样本返回最后一轮的优化结果）
         """
         device = images.device
         images = images.clone().detach().to(device)
@@ -42,50 +61,108 @@ class CWAttack:
             raise ValueError("目标攻击需要提供target_labels")
         
         batch_size = images.size(0)
+        # 用gather/scatter在模型输出上直接取真实类别与其他类别的logit，无需额外前向推断类别数
+        cls = (target_labels.to(device) if self.targeted else labels).view(-1, 1)
+        # 攻击配置在本次攻击开始时绑定为参数，共享的编译内核不持有攻击器实例
+        config = (float(self.kappa), bool(self.targeted))
+        objective = cw_objective
+        if self.compile_step:
+            key = kernel_key([model], images.shape[1:], images.dtype, device, ('C&W',) + config)
+            objective = compiled_kernel(cw_objective, key)
+        objective = functools.partial(objective, *config)
         
         # 使用tanh变换确保图像在[0,1]范围内
-        w = torch.atanh((images * 1.999999 - 1)).detach()
-        w = w.clone().detach().requires_grad_(True)
-        
-        optimizer = torch.optim.Adam([w], lr=self.lr)
-        one_hot_labels = torch.eye(model(images).size(1))[labels].to(device)
+        w0 = torch.atanh((images * 1.999999 - 1)).detach()
         
-        if self.targeted:
-            target_one_hot = torch.eye(model(images).size(1))[target_labels].to(device)
+        const = torch.full((batch_size,), float(self.c), device=device)
+        lower = torch.zeros(batch_size, device=device)
+        upper = torch.full((batch_size,), 1e10, device=device)
+        best_l2 = torch.full((batch_size,), float('inf'), device=device)
+        best_adv = images.clone()
+        check_every = max(self.iters // 10, 1)
+        monitor = resolve_monitor(self.monitor)
+        monitor.start(type(self).__name__)
         
-        def f(x):
-            outputs = model(x)
-            if self.targeted:
-                # 目标攻击：最大化目标类别的置信度
-                real = (target_one_hot * outputs).sum(1)
-                other = ((1 - target_one_hot) * outputs - target_one_hot * 10000).max(1)[0]
-                return torch.clamp(other - real + self.kappa, min=0)
-            else:
-                # 非目标攻击：最小化正确类别的置信度
-                real = (one_hot_labels * outputs).sum(1)
-                other = ((1 - one_hot_labels) * outputs - one_hot_labels * 10000).max(1)[0]
-                return torch.clamp(real - other + self.kappa, min=0)
-        
-        for step in range(self.iters):
-            adv_images = torch.tanh(w) * 0.5 + 0.5
-            l2_loss = ((adv_images - images) ** 2).view(batch_size, -1).sum(1)
-            f_loss = self.c * f(adv_images)
-            loss = l2_loss.sum() + f_loss.sum()
+        for search_step in range(self.binary_search_steps):
+            w = w0.clone().requires_grad_(True)
+            optimizer = torch.optim.Adam([w], lr=self.lr)
+            step_success = torch.zeros(batch_size, dtype=torch.bool, device=device)
+            prev_loss = float('inf')
+            
+            for step in range(self.iters):
+                with monitor.phase('forward'):
+                    loss, adv_images, l2_loss, success = objective(model, w, images, const, cls)
+                
+                with monitor.phase('backward'):
+                    optimizer.zero_grad()
+                    loss.backward()
+                
+                # 记录每个样本扰动最小的成功对抗样本（outputs对应更新前的adv_images）
+                with monitor.phase('update'):
+                    optimizer.step()
+                    with torch.no_grad():
+                        improved = success & (l2_loss < best_l2)
+                        best_l2[improved] = l2_loss[improved]
+                        best_adv[improved] = adv_images[improved]
+                        step_success |= success
+                if self.monitor is not None:
+                    monitor.record(search_step * self.iters + step, loss=loss.detach(),
+                                   success=torch.isfinite(best_l2), search_step=search_step)
+                
+                # 损失停滞时提前结束本轮搜索
+                if self.abort_early and step % check_every == 0:
+                    if loss.item() > prev_loss * 0.9999:
+                        break
+                    prev_loss = loss.item()
             
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+            # 逐样本二分更新c：成功则缩小上界，失败则提高下界（尚无上界时扩大10倍）
+            upper = torch.where(step_success, torch.min(upper, const), upper)
+            lower = torch.where(step_success, lower, torch.max(lower, const))
+            const = torch.where(step_success | (upper < 1e9), (lower + upper) / 2, const * 10)
         
-        adv_images = torch.tanh(w) * 0.5 + 0.5
-        return adv_images.detach()
+        # 未攻击成功的样本返回最后一轮的优化结果
+        with torch.no_grad():
+            last_adv = torch.tanh(w) * 0.5 + 0.5
+            found = torch.isfinite(best_l2)
+            best_adv[~found] = last_adv[~found]
+        return best_adv.detach()
     
     def set_targeted(self, targeted):
         """设置攻击类型"""
         self.targeted = targeted
 
-def cw_attack(model, images, labels, c=1e-4, kappa=0, iters=1000, lr=0.01):
+def cw_objective(kappa, targeted, model, w, images, const, cls):
+    """
+    C&W一步优化的目标函数（模块级纯函数，只包含张量运算，编译模式下由torch.compile融合）
+    Returns:
+        loss: 总损失
+        adv_images: 当前对抗样本
+        l2_loss: 逐样本L2扰动
+        success: 逐样本是否攻击成功
+    """
+    adv_images = torch.tanh(w) * 0.5 + 0.5
+    outputs = model(adv_images)
+    l2_loss = ((adv_images - images) ** 2).flatten(1).sum(1)
+    real = outputs.gather(1, cls).squeeze(1)
+    other = outputs.scatter(1, cls, float('-inf')).max(1)[0]
+    if targeted:
+        # 目标攻击：最大化目标类别的置信度
+        diff = other - real + kappa
+    else:
+        # 非目标攻击：最小化正确类别的置信度
+        diff = real - other + kappa
+    loss = l2_loss.sum() + (const * torch.clamp(diff, min=0)).sum()
+    return loss, adv_images, l2_loss, diff < 0
+
+def cw_attack(model, images, labels, c=1e-4, kappa=0, iters=1000, lr=0.01,
+              binary_search_steps=1, abort_early=True, monitor=None, compile_step=False, targeted=False,
+              target_labels=None):
     """
     兼容性函数，保持原有接口
     """
-    attacker = CWAttack(c=c, kappa=kappa, iters=iters, lr=lr)
-    return attacker.attack(model, images, labels) 
\ No newline at end of file
+    attacker = CWAttack(c=c, kappa=kappa, iters=iters, lr=lr, targeted=targeted,
+                        binary_search_steps=binary_search_steps, abort_early=abort_early, monitor=monitor,
+                        compile_step=compile_step)
+    return attacker.attack(model, images, labels, target_labels)
+
+register_attack('C&W', CWAttack)
\ No newline at end of file
@@ -1,31 +1,141 @@
 import torch
+from torchvision.ops import box_iou
 
-def dag_attack(model, images, targets, iters=10, alpha=0.01, device='cpu'):
+from app.algorithms.utils.detection import DetectionHarness
+from app.algorithms.utils.gradient_mode import input_only_gradients
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.registry import register_attack
+
+
+def _match_target_boxes(detection, target, box_active, iou_threshold, score_threshold):
+    """
+    在检测结果中找出仍被正确检测的目标框
+    Args:
+        detection: 单张图片的检测结果（boxes、labels、scores）
+        target: 单张图片的目标检测标签
+        box_active: 该图片中仍需攻击的目标框掩码
+        iou_threshold: 判定为同一目标的IoU阈值
+        score_threshold: 判定为被检测到的置信度阈值
+    Returns:
+        still_active: 更新后的目标框掩码
+        scores: 与仍被正确检测的目标框匹配的检测置信度（用于损失）
+    """
+    still_active = box_active.clone()
+    if detection['boxes'].numel() == 0:
+        still_active[:] = False
+        return still_active, detection['scores'].new_zeros(0)
+
+    idx = box_active.nonzero(as_tuple=False).flatten()
+    iou = box_iou(detection['boxes'], target['boxes'][idx])
+    same_label = detection['labels'].unsqueeze(1) == target['labels'][idx].unsqueeze(0)
+    confident = (detection['scores'] >= score_threshold).unsqueeze(1)
+    matched = (iou >= iou_threshold) & same_label & confident
+
+    still_active[idx] = matched.any(dim=0)
+    det_used = matched.any(dim=1)
+    return still_active, detection['scores'][det_used]
+
+
+def _dense_detections(output):
+    """
+    把YOLOv5等单阶段检测器的原始输出转换为检测结果字典
+    原始输出为 (n, num_anchors, 5 + num_classes)：中心点xywh、目标置信度和各类别概率（推理模式下可能附带特征图）；
+    每个候选框的置信度为目标置信度乘以最大类别概率，不做NMS（匹配时只需要可求导的置信度）
+    """
+    if isinstance(output, (tuple, list)):
+        output = output[0]
+    xy, wh = output[..., :2], output[..., 2:4]
+    boxes = torch.cat([xy - wh / 2, xy + wh / 2], dim=-1)
+    class_scores, labels = output[..., 5:].max(dim=-1)
+    scores = output[..., 4] * class_scores
+    return [{'boxes': b, 'labels': l, 'scores': s} for b, l, s in zip(boxes, labels, scores)]
+
+
+def _detect(harness, model, images):
+    """
+    一组同尺寸桶内图片的检测结果
+    图片补零为一个张量（补齐在右下方，框坐标与原图一致），torchvision检测模型接收各图片原始区域的视图列表，
+    其他模型接收补齐张量并把原始输出转换为检测结果字典
+    """
+    batch, sizes = harness.pad(images)
+    output = model(harness.inputs(batch, sizes))
+    if isinstance(output, (tuple, list)) and output and isinstance(output[0], dict):
+        return list(output)
+    return _dense_detections(output)
+
+
+@input_only_gradients
+def dag_attack(model, images, targets, iters=10, alpha=0.01, device='cpu', iou_threshold=0.5, score_threshold=0.3,
+               monitor=None, bucket_size=64):
     """
     DAG攻击实现（适用于Faster R-CNN等目标检测模型）
+    逐图片跟踪仍被正确检测的目标框，损失只包含与这些框匹配的检测结果；
+    某个框被抑制或被误分类后不再参与损失，一张图片的所有目标框都被攻破后该图片退出批次；
+    DAG的损失来自推理模式下的检测置信度，活跃图片按尺寸分桶、补齐后前向，锚框在迭代间复用
     Args:
-        model: 目标检测模型（如torchvision.models.detection.fasterrcnn_resnet50_fpn）
-        images: 输入图片 (batch, C, H, W)
+        model: 目标检测模型（torchvision检测模型如fasterrcnn_resnet50_fpn，或输出 (n, anchors, 5 + C)
+               原始预测的YOLOv5等单阶段检测器；目标标签的类别编号需与模型一致）
+        images: 输入图片 (batch, C, H, W) 或不同尺寸图片的列表
         targets: 目标检测标签（list[dict]，与torchvision格式一致）
         iters: 迭代次数
         alpha: 步长
         device: 设备
+        iou_threshold: 判定检测结果与目标框为同一目标的IoU阈值
+        score_threshold: 判定目标框仍被检测到的置信度阈值
+        monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+        bucket_size: 尺寸分桶粒度（像素）
     Returns:
-        adv_images: 对抗样本
-    """
-    model.eval()
-    adv_images = images.clone().detach().to(device)
-    adv_images.requires_grad = True
-
-    for i in range(iters):
-        adv_images.requires_grad = True
-        # 目标检测模型的损失计算
-        loss_dict = model(adv_images, targets)
-        loss = sum(loss for loss in loss_dict.values())
-        model.zero_grad()
-        loss.backward()
-        grad = adv_images.grad.data
-        adv_images = adv_images + alpha * grad.sign()
-        adv_images = torch.clamp(adv_images, 0, 1).detach()
-        adv_images.requires_grad = True
-    return adv_images.detach() 
\ No newline at end of file
+        adv_images: 对抗样本（与输入格式一致）
+    """
+    harness = DetectionHarness(model, bucket_size=bucket_size)
+    adv_images = [img.clone().detach().to(device) for img in images]
+    targets = [{k: v.to(device) for k, v in t.items()} for t in targets]
+    box_active = [torch.ones(len(t['boxes']), dtype=torch.bool, device=device) for t in targets]
+    # 没有目标框的图片不参与攻击，也不计入攻击成功率的分母
+    active = [i for i in range(len(adv_images)) if box_active[i].any()]
+    attackable = len(active)
+    monitor = resolve_monitor(monitor)
+    monitor.start('DAG')
+
+    with harness.eval_mode():
+        for i in range(iters):
+            if not active:
+                break
+            inputs = [adv_images[j].detach().requires_grad_(True) for j in active]
+            with monitor.phase('forward'):
+                detections = [None] * len(active)
+                for bucket in harness.buckets(inputs):
+                    for k, detection in zip(bucket, _detect(harness, model, [inputs[k] for k in bucket])):
+                        detections[k] = detection
+
+                losses = []
+                still = []
+                for k, j in enumerate(active):
+                    box_active[j], scores = _match_target_boxes(
+                        detections[k], targets[j], box_active[j], iou_threshold, score_threshold
+                    )
+                    if box_active[j].any():
+                        still.append(k)
+                        losses.append(scores.sum())
+            if not still:
+                monitor.record(i, success=1.0, active=0)
+                break
+
+            # 只对仍有正确检测框的图片求梯度，降低这些检测框的置信度
+            loss = sum(losses)
+            with monitor.phase('backward'):
+                grads = torch.autograd.grad(loss, [inputs[k] for k in still], allow_unused=True)
+            with monitor.phase('update'):
+                for k, grad in zip(still, grads):
+                    if grad is None:
+                        continue
+                    j = active[k]
+                    adv_images[j] = torch.clamp(adv_images[j] - alpha * grad.sign(), 0, 1).detach()
+            active = [active[k] for k in still]
+            monitor.record(i, loss=loss.detach(), success=1.0 - len(active) / attackable, active=len(active))
+
+    if isinstance(images, torch.Tensor):
+        return torch.stack(adv_images).detach()
+    return [img.detach() for img in adv_images]
+
+register_attack('DAG', dag_attack)
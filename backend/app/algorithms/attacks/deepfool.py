@@ -1,48 +1,99 @@
 import torch
 
-def deepfool_attack(model, images, labels=None, max_iter=50, overshoot=0.02, num_classes=10):
+from app.algorithms.utils.gradient_mode import input_grad, input_only_gradients
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.registry import register_attack
+
+
+def _candidate_classes(logits, labels, num_candidates):
+    """
+    选取每个样本的候选类别：第一列为原标签，其余为干净输出中得分最高的其他类别
+    """
+    scores = logits.clone()
+    scores.scatter_(1, labels.unsqueeze(1), float('inf'))
+    return scores.topk(num_candidates, dim=1)[1]
+
+
+@input_only_gradients
+def deepfool_attack(model, images, labels=None, max_iter=50, overshoot=0.02, num_classes=10, monitor=None):
     """
-    DeepFool攻击实现
+    DeepFool攻击实现（批量版本）
+    整个批次一起迭代，用活跃样本掩码跟踪尚未翻转标签的样本，标签一翻转即停止该样本；
+    每步只对top-k候选类别求logit差的梯度，并把k-1个候选复制成一个批次，一次反向传播得到全部梯度
+    Args:
+        model: 被攻击的模型
+        images: 输入图片 (batch, C, H, W)
+        labels: 正确标签（为None时使用模型对原图的预测）
+        max_iter: 最大迭代次数
+        overshoot: 越界系数
+        num_classes: 候选类别数k（包含原标签）
+        monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+    Returns:
+        adv_images: 对抗样本
     """
-    device = images.device
-    images = images.clone().detach().to(device)
-    adv_images = images.clone().detach()
-    adv_images.requires_grad = True
+    images = images.clone().detach()
     batch_size = images.size(0)
-    for b in range(batch_size):
-        image = images[b:b+1].clone().detach()
-        image.requires_grad = True
-        output = model(image)
-        _, label = torch.max(output.data, 1)
-        if labels is not None:
-            label = labels[b:b+1]
-        pert_image = image.clone().detach()
-        r_tot = torch.zeros_like(image)
-        loop_i = 0
-        x = pert_image.clone().detach().requires_grad_(True)
-        while loop_i < max_iter:
-            outputs = model(x)
-            fs = outputs.data.cpu().numpy().flatten()
-            k_i = label.item()
-            grad_orig = torch.autograd.grad(outputs[0, k_i], x, retain_graph=True)[0]
-            min_val = float('inf')
-            ri = None
-            for k in range(num_classes):
-                if k == k_i:
-                    continue
-                grad_curr = torch.autograd.grad(outputs[0, k], x, retain_graph=True)[0]
-                w_k = grad_curr - grad_orig
-                f_k = (outputs[0, k] - outputs[0, k_i]).data.cpu().numpy()
-                pert_k = abs(f_k) / (w_k.norm() + 1e-8)
-                if pert_k < min_val:
-                    min_val = pert_k
-                    ri = w_k * pert_k / (w_k.norm() + 1e-8)
-            r_tot = r_tot + ri
-            x = (image + (1 + overshoot) * r_tot).clone().detach().requires_grad_(True)
-            output = model(x)
-            k_i_new = output.data.max(1)[1].item()
-            if k_i_new != k_i:
+
+    with torch.no_grad():
+        logits = model(images)
+    if labels is None:
+        labels = logits.argmax(dim=1)
+    labels = labels.to(images.device)
+    k = min(num_classes, logits.size(1))
+    if k < 2:
+        raise ValueError("DeepFool至少需要2个候选类别")
+    candidates = _candidate_classes(logits, labels, k)
+
+    r_tot = torch.zeros_like(images)
+    adv_images = images.clone()
+    active = torch.ones(batch_size, dtype=torch.bool, device=images.device)
+    sample_dims = (1,) * (images.dim() - 1)
+    tracking = monitor is not None
+    monitor = resolve_monitor(monitor)
+    monitor.start('DeepFool')
+
+    for step in range(max_iter):
+        idx = active.nonzero(as_tuple=False).squeeze(1)
+        if idx.numel() == 0:
+            break
+        n = idx.numel()
+
+        # 复制k-1份：第j份用于计算第j个候选类别与原标签的logit差梯度
+        x_rep = adv_images[idx].repeat(k - 1, *sample_dims).requires_grad_(True)
+        with monitor.phase('forward'):
+            outputs = model(x_rep)
+            cand = candidates[idx].repeat(k - 1, 1)
+            f = outputs.gather(1, cand)
+            j = torch.arange(1, k, device=images.device).repeat_interleave(n)
+            rows = torch.arange(f.size(0), device=images.device)
+            f_diff = f[rows, j] - f[:, 0]
+        with monitor.phase('backward'):
+            grads = input_grad(f_diff.sum(), x_rep)
+
+        with torch.no_grad():
+            # 第一份的输出即当前对抗样本的预测，标签已翻转的样本停止迭代
+            still = outputs[:n].argmax(dim=1) == labels[idx]
+            active[idx[~still]] = False
+            if tracking:
+                monitor.record(step, loss=f_diff.detach().abs().mean(), success=~active.clone(), active=n)
+            if not still.any():
                 break
-            loop_i += 1
-        adv_images[b:b+1] = x.detach()
-    return torch.clamp(adv_images, 0, 1) 
\ No newline at end of file
+
+            w = grads.view(k - 1, n, -1).transpose(0, 1)
+            f_diff = f_diff.view(k - 1, n).t()
+            w_norm = w.norm(dim=2) + 1e-8
+            pert = f_diff.abs() / w_norm
+            best = pert.argmin(dim=1)
+            arange_n = torch.arange(n, device=images.device)
+            best_pert = pert[arange_n, best]
+            best_w = w[arange_n, best]
+            r_i = (best_pert / w_norm[arange_n, best]).unsqueeze(1) * best_w
+
+            with monitor.phase('update'):
+                upd = idx[still]
+                r_tot[upd] += r_i[still].view(-1, *images.shape[1:])
+                adv_images[upd] = images[upd] + (1 + overshoot) * r_tot[upd]
+
+    return torch.clamp(adv_images, 0, 1)
+
+register_attack('DeepFool', deepfool_attack)
\ No newline at end of file
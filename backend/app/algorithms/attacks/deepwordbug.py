@@ -1,15 +1,252 @@
-def deepwordbug_attack(model, texts, labels=None, **kwargs):
+import copy
+import multiprocessing
+import pickle
+import random
+import string
+import warnings
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+
+from app.algorithms.utils.registry import register_attack
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.text_victim import query_victim, resolve_query_cache
+
+
+class DeepWordBugAttack:
+    """
+    DeepWordBug攻击实现（不依赖textattack）
+    任务书定位：字符级黑盒文本攻击，通过对关键词做微小的字符编辑（交换、替换、删除、插入）欺骗文本分类模型
+    整个批次的句子只需4次批量查询：原句、逐词[UNK]替换的重要性打分、所有关键词的字符编辑候选、逐步累积编辑的结果
+    """
+
+    TRANSFORMATIONS = ('swap', 'substitute', 'delete', 'insert')
+
+    def __init__(self, max_edits=5, candidates_per_token=4, batch_size=128, unk_token='[UNK]', seed=0,
+                 query_cache=None, monitor=None):
+        """
+        Args:
+            max_edits: 每个句子最多编辑的词数
+            candidates_per_token: 每个关键词生成的字符编辑候选数
+            batch_size: 查询被攻击模型时每次前向的最大句子数
+            unk_token: 计算词重要性时用于替换的未知词
+            seed: 随机种子（字符编辑位置和替换字符；每个句子按种子和句子内容独立播种，
+                  相同输入在任意调用次数、分片方式下得到相同的对抗文本）
+            query_cache: 被攻击模型查询缓存（None使用共享默认缓存，False禁用）
+            monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+        """
+        self.max_edits = max_edits
+        self.candidates_per_token = candidates_per_token
+        self.batch_size = batch_size
+        self.query_cache = resolve_query_cache(query_cache)
+        self.monitor = monitor
+        self.unk_token = unk_token
+        self.seed = seed
+
+    def _query(self, model, texts):
+        """查询被攻击模型（计入监控的前向耗时）"""
+        with resolve_monitor(self.monitor).phase('forward'):
+            return query_victim(model, texts, self.batch_size, self.query_cache)
+
+    def _sentence_rng(self, text):
+        """句子级随机数生成器（按种子和句子内容播种，不随调用次数推进）"""
+        return random.Random(f"{self.seed}\x1f{text}")
+
+    @staticmethod
+    def _edit_word(word, transformation, rng):
+        """对单个词做一次字符编辑"""
+        letters = string.ascii_lowercase
+        if transformation == 'swap' and len(word) >= 2:
+            i = rng.randrange(len(word) - 1)
+            return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        if transformation == 'delete' and len(word) >= 2:
+            i = rng.randrange(len(word))
+            return word[:i] + word[i + 1:]
+        if transformation == 'insert':
+            i = rng.randrange(len(word) + 1)
+            return word[:i] + rng.choice(letters) + word[i:]
+        i = rng.randrange(len(word))
+        return word[:i] + rng.choice(letters.replace(word[i].lower(), '')) + word[i + 1:]
+
+    def _word_candidates(self, word, rng):
+        """生成一个词的字符编辑候选（去重且不等于原词）"""
+        candidates = []
+        for n in range(self.candidates_per_token):
+            edited = self._edit_word(word, self.TRANSFORMATIONS[n % len(self.TRANSFORMATIONS)], rng)
+            if edited != word and edited not in candidates:
+                candidates.append(edited)
+        return candidates
+
+    def attack(self, model, texts, labels=None):
+        """
+        执行DeepWordBug攻击
+        Args:
+            model: 文本分类模型（接收文本列表，返回logits）
+            texts: 输入文本列表
+            labels: 标签列表（为None时使用模型对原文的预测）
+        Returns:
+            adv_texts: 对抗文本列表
+        """
+        monitor = resolve_monitor(self.monitor)
+        monitor.start('DeepWordBug')
+        token_lists = [text.split() for text in texts]
+        orig_probs = self._query(model, [' '.join(t) for t in token_lists])
+        if labels is None:
+            labels = orig_probs.argmax(dim=1).tolist()
+        labels = [int(label) for label in labels]
+
+        # 1. 词重要性：所有句子的逐词[UNK]替换变体一次批量打分
+        variants, owners = [], []
+        for i, tokens in enumerate(token_lists):
+            for j in range(len(tokens)):
+                variants.append(' '.join(tokens[:j] + [self.unk_token] + tokens[j + 1:]))
+                owners.append(i)
+        if not variants:
+            return list(texts)
+        probs = self._query(model, variants)
+        key_tokens = []
+        start = 0
+        for i, tokens in enumerate(token_lists):
+            end = start + len(tokens)
+            scores = orig_probs[i, labels[i]] - probs[start:end, labels[i]]
+            key_tokens.append(scores.argsort(descending=True)[:self.max_edits].tolist())
+            start = end
+
+        # 2. 所有句子所有关键词的字符编辑候选一次批量打分，为每个关键词选出最有效的编辑
+        cand_texts, cand_meta = [], []
+        for i, tokens in enumerate(token_lists):
+            rng = self._sentence_rng(texts[i])
+            for j in key_tokens[i]:
+                for edited in self._word_candidates(tokens[j], rng):
+                    cand_texts.append(' '.join(tokens[:j] + [edited] + tokens[j + 1:]))
+                    cand_meta.append((i, j, edited))
+        best_edit = {}
+        if cand_texts:
+            cand_probs = self._query(model, cand_texts)
+            for row, (i, j, edited) in enumerate(cand_meta):
+                p = float(cand_probs[row, labels[i]])
+                if (i, j) not in best_edit or p < best_edit[(i, j)][1]:
+                    best_edit[(i, j)] = (edited, p)
+
+        # 3. 按重要性依次累积编辑，所有前缀一次批量打分，取最短的成功前缀
+        prefix_texts, prefix_meta = [], []
+        prefixes = []
+        for i, tokens in enumerate(token_lists):
+            adv = list(tokens)
+            sentence_prefixes = []
+            for j in key_tokens[i]:
+                if (i, j) not in best_edit:
+                    continue
+                adv[j] = best_edit[(i, j)][0]
+                sentence_prefixes.append(' '.join(adv))
+                prefix_texts.append(sentence_prefixes[-1])
+                prefix_meta.append((i, len(sentence_prefixes) - 1))
+            prefixes.append(sentence_prefixes)
+
+        adv_texts = [' '.join(tokens) for tokens in token_lists]
+        if not prefix_texts:
+            return adv_texts
+        prefix_probs = self._query(model, prefix_texts)
+        best = {}
+        for row, (i, k) in enumerate(prefix_meta):
+            flipped = int(prefix_probs[row].argmax()) != labels[i]
+            p = float(prefix_probs[row, labels[i]])
+            current = best.get(i)
+            # 优先选择成功且编辑最少的前缀（前缀按编辑数递增），都不成功时选择原类别置信度最低的前缀
+            if current is None or (not current[1] and (flipped or p < current[2])):
+                best[i] = (k, flipped, p)
+        for i, (k, _, _) in best.items():
+            adv_texts[i] = prefixes[i][k]
+        monitor.record(0, success=sum(flag for _, flag, _ in best.values()) / len(adv_texts),
+                       queries=len(texts) + len(variants) + len(cand_texts) + len(prefix_texts))
+        return adv_texts
+
+
+# 按被攻击模型缓存攻击器，重复调用时复用（模型被回收后自动释放）
+_ATTACKER_CACHE = weakref.WeakKeyDictionary()
+_WORKER_MODEL = None
+# 运行时对象（持有锁、数据库连接或回调），不参与攻击器缓存键，也不能传给工作进程
+_RUNTIME_PARAMS = ('query_cache', 'monitor')
+
+
+def _get_attacker(model, **params):
+    """获取（或创建并缓存）与模型和参数对应的攻击器；运行时对象只设置在本次调用使用的副本上"""
+    runtime = {name: params.pop(name) for name in _RUNTIME_PARAMS if name in params}
+    try:
+        key = tuple(sorted(params.items()))
+        hash(key)
+        per_model = _ATTACKER_CACHE.setdefault(model, {})
+    except TypeError:
+        # 参数不可哈希或模型无法弱引用时不缓存
+        return DeepWordBugAttack(**params, **runtime)
+    if key not in per_model:
+        per_model[key] = DeepWordBugAttack(**params)
+    attacker = per_model[key]
+    if runtime:
+        attacker = copy.copy(attacker)
+        attacker.query_cache = resolve_query_cache(runtime.get('query_cache'))
+        attacker.monitor = runtime.get('monitor')
+    return attacker
+
+
+def _init_worker(model):
+    """工作进程初始化：保存模型，并限制每个进程的线程数避免CPU超额订阅"""
+    global _WORKER_MODEL
+    _WORKER_MODEL = model
+    torch.set_num_threads(1)
+
+
+def _attack_shard(args):
+    texts, labels, params = args
+    return _get_attacker(_WORKER_MODEL, **params).attack(_WORKER_MODEL, texts, labels)
+
+
+def deepwordbug_attack(model, texts, labels=None, max_edits=5, candidates_per_token=4, batch_size=128,
+                       num_workers=0, shard_size=256, **kwargs):
     """
-    DeepWordBug攻击（需安装textattack库）
+    DeepWordBug攻击
+    Args:
+        model: 文本分类模型（接收文本列表，返回logits）
+        texts: 输入文本列表
+        labels: 标签列表
+        max_edits: 每个句子最多编辑的词数
+        candidates_per_token: 每个关键词生成的字符编辑候选数
+        batch_size: 查询被攻击模型时每次前向的最大句子数
+        num_workers: 工作进程数（大于1时把数据集分片到进程池并行攻击；工作进程以spawn方式启动，
+                     模型需要能被pickle序列化，否则回退到当前进程内攻击）
+        shard_size: 每个分片的句子数
+        kwargs: 其他DeepWordBugAttack参数（unk_token、seed、query_cache、monitor；
+                多进程分片时query_cache只能为None或False，不能传入monitor）
+    Returns:
+        adv_texts: 对抗文本列表
     """
-    from textattack.attack_recipes import DeepWordBugGao2018
-    from textattack.models.wrappers import PyTorchModelWrapper
-    from textattack.datasets import Dataset
+    kwargs.update(max_edits=max_edits, candidates_per_token=candidates_per_token, batch_size=batch_size)
+    texts = list(texts)
+    if num_workers <= 1 or len(texts) <= shard_size:
+        return _get_attacker(model, **kwargs).attack(model, texts, labels)
+
+    runtime = [name for name in _RUNTIME_PARAMS if kwargs.get(name) is not None and kwargs.get(name) is not False]
+    if runtime:
+        raise ValueError(f"{'、'.join(runtime)}无法传给工作进程，多进程分片（num_workers>1）时请不要传入")
+    kwargs = {k: v for k, v in kwargs.items() if k not in _RUNTIME_PARAMS or v is False}
+
+    shards = []
+    for start in range(0, len(texts), shard_size):
+        shard_labels = list(labels[start:start + shard_size]) if labels is not None else None
+        shards.append((texts[start:start + shard_size], shard_labels, kwargs))
+
+    # 不使用fork：torch（尤其是已初始化的CUDA）的线程和锁在fork出的子进程中处于不确定状态；
+    # spawn启动的工作进程通过initializer各自接收一份序列化的模型
+    try:
+        pickle.dumps(model)
+    except Exception as e:
+        warnings.warn(f"模型无法序列化，不使用多进程分片: {type(e).__name__}: {e}")
+        return _get_attacker(model, **kwargs).attack(model, texts, labels)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=_init_worker, initargs=(model,)) as executor:
+        results = executor.map(_attack_shard, shards)
+        return [text for shard in results for text in shard]
 
-    model_wrapper = PyTorchModelWrapper(model, tokenizer=lambda x: x.split())
-    attack = DeepWordBugGao2018.build(model_wrapper)
-    dataset = [(text, label) for text, label in zip(texts, labels)]
-    adv_texts = []
-    for result in attack.attack_dataset(Dataset(dataset)):
-        adv_texts.append(result.perturbed_text())
-    return adv_texts 
\ No newline at end of file
+register_attack('DeepWordBug', deepwordbug_attack)
@@ -2,6 +2,11 @@ import torch
 import torch.nn as nn
 import numpy as np
 
+from app.algorithms.utils.gradient_mode import ensemble_loss_and_grad, input_only_gradients
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.memory import resolve_memory_plan
+from app.algorithms.utils.registry import register_attack
+
 class FGSMAttack:
     """
     Fast Gradient Sign Method (FGSM) 攻击实现
@@ -10,39 +15,57 @@ class FGSMAttack:
     适用模型：针对CNN类图像分类模型（如ResNet50、VGG16）
     """
     
-    def __init__(self, epsilon=0.03, loss_fn=None):
+    def __init__(self, epsilon=0.03, loss_fn=None, monitor=None, targeted=False, memory=None):
         """
         Args:
             epsilon: 扰动强度，确保扰动"微小"（符合人类视觉不可察觉性）
             loss_fn: 损失函数（可选，默认交叉熵）
+            monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+            targeted: 是否为目标攻击（沿损失下降方向步进，使预测变为target_labels）
+            memory: 内存受限模式（MemoryPlan或其参数字典，为None时读取config.yml，为False时关闭）
         """
         self.epsilon = epsilon
         self.loss_fn = loss_fn if loss_fn is not None else nn.CrossEntropyLoss()
+        self.monitor = monitor
+        self.targeted = targeted
+        self.memory = memory
     
-    def attack(self, model, images, labels):
+    @input_only_gradients
+    def attack(self, model, images, labels, target_labels=None):
         """
         执行FGSM攻击
         Args:
-            model: 被攻击的CNN模型（如ResNet50、VGG16）
+            model: 被攻击的CNN模型（如ResNet50、VGG16），传入模型列表时使用各模型的平均梯度（集成迁移攻击）
             images: 输入图片 (batch, C, H, W)
             labels: 正确标签
+            target_labels: 目标标签（目标攻击时使用）
         Returns:
             adv_images: 对抗样本
         """
-        images = images.clone().detach().requires_grad_(True)
-        
-        # 前向传播
-        outputs = model(images)
-        loss = self.loss_fn(outputs, labels)
+        if self.targeted:
+            if target_labels is None:
+                raise ValueError("目标攻击需要提供target_labels")
+            labels = target_labels
+        monitor = resolve_monitor(self.monitor)
+        monitor.start(type(self).__name__)
+        images = images.clone().detach()
         
-        # 反向传播
-        model.zero_grad()
-        loss.backward()
-        grad = images.grad.data
+        # 前向、反向传播（只对输入求梯度；集成攻击时取各模型的平均梯度）
+        models = list(model) if isinstance(model, (list, tuple)) else [model]
+        plan = resolve_memory_plan(self.memory)
+        if plan is None:
+            _, loss, grad = ensemble_loss_and_grad(models, images, labels, self.loss_fn, monitor)
+        else:
+            with plan.checkpointing(models):
+                micro_batch = plan.micro_batch(models, images, labels, self.loss_fn)
+                _, loss, grad = ensemble_loss_and_grad(models, images, labels, self.loss_fn, monitor, micro_batch)
         
         # 生成对抗样本
-        adv_images = images + self.epsilon * grad.sign()
-        adv_images = torch.clamp(adv_images, 0, 1)
+        with monitor.phase('update'):
+            step = -self.epsilon if self.targeted else self.epsilon
+            adv_images = images + step * grad.sign()
+            adv_images = torch.clamp(adv_images, 0, 1)
+        monitor.record(0, loss=loss)
         
         return adv_images.detach()
     
@@ -50,9 +73,12 @@ class FGSMAttack:
         """设置扰动强度"""
         self.epsilon = epsilon
 
-def fgsm_attack(model, images, labels, epsilon=0.03, loss_fn=None):
+def fgsm_attack(model, images, labels, epsilon=0.03, loss_fn=None, monitor=None, targeted=False, target_labels=None,
+                memory=None):
     """
     兼容性函数，保持原有接口
     """
-    attacker = FGSMAttack(epsilon=epsilon, loss_fn=loss_fn)
-    return attacker.attack(model, images, labels) 
\ No newline at end of file
+    attacker = FGSMAttack(epsilon=epsilon, loss_fn=loss_fn, monitor=monitor, targeted=targeted, memory=memory)
+    return attacker.attack(model, images, labels, target_labels)
+
+register_attack('FGSM', FGSMAttack)
\ No newline at end of file
@@ -0,0 +1,150 @@
+import torch
+
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.registry import register_attack
+from app.algorithms.utils.score_oracle import ScoreOracle, margin_loss
+
+
+class NESAttack:
+    """
+    NES梯度估计攻击实现（L∞约束的基于分数的黑盒攻击）
+    任务书定位：面向ONNX等不可求导的已部署模型，只通过InferenceEngine.predict查询概率分布
+    每一步用对称高斯采样估计间隔损失的梯度，再做一次符号梯度步进并投影回L∞球；
+    当前对抗样本和它的全部采样点放在同一个批次中查询，同时用于早停判断和梯度估计。
+    预算不足以再做一步时，最后一次步进得到的样本用剩余预算单独查询一次确定是否成功，
+    预算已用尽时返回最后一次被查询过的样本，返回的成功标记总是与返回的样本一致
+    """
+
+    def __init__(self, epsilon=0.05, alpha=0.01, sigma=0.001, samples_per_draw=50, max_queries=10000,
+                 batch_size=256, targeted=False, seed=0, monitor=None):
+        """
+        Args:
+            epsilon: 扰动上限（L∞约束）
+            alpha: 每步步长
+            sigma: 采样扰动的标准差
+            samples_per_draw: 每步梯度估计的采样数（对称采样，取偶数）
+            max_queries: 每个样本的查询预算
+            batch_size: 每次推理调用的最大候选数
+            targeted: 是否为目标攻击（labels为目标类别）
+            seed: 随机种子
+            monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+        """
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.sigma = sigma
+        self.samples_per_draw = max(2, samples_per_draw - samples_per_draw % 2)
+        self.max_queries = max_queries
+        self.batch_size = batch_size
+        self.targeted = targeted
+        self.seed = seed
+        self.monitor = monitor
+
+    def attack(self, model, images, labels=None, target_labels=None):
+        """
+        执行NES攻击
+        Args:
+            model: 被攻击的模型（InferenceEngine、onnxruntime.InferenceSession或PyTorch模型）
+            images: 输入图片 (batch, C, H, W)
+            labels: 正确标签（为None时使用模型对原图的预测）
+            target_labels: 目标标签（目标攻击时使用，未提供时把labels视为目标类别）
+        Returns:
+            adv_images: 对抗样本
+        """
+        adv_images, _, _ = self.run(model, images, labels, target_labels)
+        return adv_images
+
+    def run(self, model, images, labels=None, target_labels=None):
+        """
+        执行NES攻击并返回查询统计
+        Returns:
+            adv_images: 对抗样本（位于输入所在的设备）
+            queries: 每个样本消耗的查询次数
+            success: 每个样本是否攻击成功
+        """
+        generator = torch.Generator().manual_seed(self.seed)
+        ori = images.detach().float().cpu()
+        batch_size = ori.size(0)
+        sample_shape = ori.shape[1:]
+        oracle = ScoreOracle(model, batch_size, batch_size=self.batch_size, max_queries=self.max_queries)
+        monitor = resolve_monitor(self.monitor)
+        monitor.start('NES')
+        all_idx = torch.arange(batch_size)
+
+        if self.targeted and target_labels is not None:
+            labels = target_labels
+        if labels is None:
+            labels = oracle.probabilities(ori, all_idx).argmax(dim=1)
+        labels = torch.as_tensor(labels).cpu().long()
+
+        adv = ori.clone()
+        # 最后一次被查询过的样本，以及adv是否在查询之后又步进过（成功标记已过期）
+        evaluated = ori.clone()
+        stale = torch.zeros(batch_size, dtype=torch.bool)
+        success = torch.zeros(batch_size, dtype=torch.bool)
+        half = self.samples_per_draw // 2
+        # 每个样本每步的查询数：当前对抗样本 + 全部采样点
+        cost = self.samples_per_draw + 1
+        samples_per_call = max(1, self.batch_size // cost)
+        step_count = 0
+
+        while True:
+            active = ((~success) & (oracle.remaining(all_idx) >= cost)).nonzero(as_tuple=False).flatten()
+            if active.numel() == 0:
+                break
+            for start in range(0, active.numel(), samples_per_call):
+                idx = active[start:start + samples_per_call]
+                k = idx.numel()
+                x = adv[idx]
+                noise = torch.randn(half, k, *sample_shape, generator=generator)
+                # 候选按 (当前样本, +采样, -采样) 分块排列，每块k个
+                candidates = torch.cat([x, (x + self.sigma * noise).flatten(0, 1),
+                                        (x - self.sigma * noise).flatten(0, 1)])
+                owners = idx.repeat(cost)
+                with monitor.phase('forward'):
+                    losses = margin_loss(oracle.probabilities(candidates, owners), labels[owners], self.targeted)
+
+                current = losses[:k]
+                success[idx] = current <= 0
+                evaluated[idx] = x
+                stale[idx] = False
+                with monitor.phase('backward'):
+                    plus = losses[k:k * (half + 1)].view(half, k)
+                    minus = losses[k * (half + 1):].view(half, k)
+                    weights = (plus - minus).view(half, k, *([1] * len(sample_shape)))
+                    grad = (weights * noise).sum(dim=0) / (2 * self.sigma * half)
+
+                # 沿间隔损失下降方向步进，已成功的样本保持不变
+                with monitor.phase('update'):
+                    step = current > 0
+                    x_new = x - self.alpha * grad.sign()
+                    x_new = torch.min(torch.max(x_new, ori[idx] - self.epsilon), ori[idx] + self.epsilon).clamp_(0, 1)
+                    adv[idx[step]] = x_new[step]
+                    stale[idx[step]] = True
+            if monitor.enabled:
+                monitor.record(step_count, success=success.clone(), active=active.numel(),
+                               queries=float(oracle.queries.float().mean()))
+            step_count += 1
+
+        # 最后一步的结果还有预算时查询一次，否则退回最后一次被查询过的样本
+        recheck = (stale & (oracle.remaining(all_idx) >= 1)).nonzero(as_tuple=False).flatten()
+        if recheck.numel():
+            with monitor.phase('forward'):
+                losses = margin_loss(oracle.probabilities(adv[recheck], recheck), labels[recheck], self.targeted)
+            success[recheck] = losses <= 0
+            stale[recheck] = False
+        adv[stale] = evaluated[stale]
+
+        return adv.to(images.device), oracle.queries, success
+
+
+def nes_attack(model, images, labels=None, epsilon=0.05, alpha=0.01, sigma=0.001, samples_per_draw=50,
+               max_queries=10000, batch_size=256, targeted=False, seed=0, monitor=None):
+    """
+    兼容性函数，与其他攻击模块保持一致的函数式接口
+    """
+    attacker = NESAttack(epsilon=epsilon, alpha=alpha, sigma=sigma, samples_per_draw=samples_per_draw,
+                         max_queries=max_queries, batch_size=batch_size, targeted=targeted, seed=seed,
+                         monitor=monitor)
+    return attacker.attack(model, images, labels)
+
+register_attack('NES', NESAttack)
@@ -1,63 +1,30 @@
-import torch
-import torch.nn as nn
-import numpy as np
+from app.algorithms.utils.iterative import IterativeAttack
+from app.algorithms.utils.registry import register_attack
 
-class PGDAttack:
+class PGDAttack(IterativeAttack):
     """
     Projected Gradient Descent (PGD) 攻击实现
     任务书定位：迭代式强对抗样本生成算法，支持L∞约束（任务书提及"扰动约束"相关概念）
     核心参数：
         - 迭代次数：任务书要求"多次迭代生成对抗样本"，需支持用户配置（如5~100次）
         - 投影约束：严格遵循L∞范数约束，确保扰动在预设范围内
+        - 集成攻击：attack传入源模型列表时使用各模型的平均梯度，提高对抗样本的可迁移性
     """
     
-    def __init__(self, epsilon=0.3, alpha=0.01, iters=40, loss_fn=None):
+    def __init__(self, epsilon=0.3, alpha=0.01, iters=40, loss_fn=None, early_stop=False, restarts=1,
+                 monitor=None, targeted=False, memory=None,
+                 compile_step=False, eot=None):
         """
         Args:
             epsilon: 扰动上限（L∞约束）
             alpha: 每步步长
             iters: 迭代次数（任务书要求支持5~100次配置）
-            loss_fn: 损失函数
+            其余参数与IterativeAttack相同
         """
-        self.epsilon = epsilon
-        self.alpha = alpha
-        self.iters = iters
-        self.loss_fn = loss_fn if loss_fn is not None else nn.CrossEntropyLoss()
-    
-    def attack(self, model, images, labels):
-        """
-        执行PGD攻击
-        Args:
-            model: 被攻击的模型
-            images: 输入图片
-            labels: 正确标签
-        Returns:
-            adv_images: 对抗样本
-        """
-        ori_images = images.clone().detach()
-        adv_images = ori_images.clone().detach()
-        
-        # 随机初始化扰动
-        adv_images = adv_images + torch.rand_like(adv_images) * 2 * self.epsilon - self.epsilon
-        adv_images = torch.clamp(adv_images, 0, 1)
-        
-        for i in range(self.iters):
-            adv_images.requires_grad = True
-            outputs = model(adv_images)
-            loss = self.loss_fn(outputs, labels)
-            
-            model.zero_grad()
-            loss.backward()
-            grad = adv_images.grad.data
-            
-            # 梯度更新
-            adv_images = adv_images + self.alpha * grad.sign()
-            
-            # L∞投影约束
-            eta = torch.clamp(adv_images - ori_images, min=-self.epsilon, max=self.epsilon)
-            adv_images = torch.clamp(ori_images + eta, 0, 1).detach()
-        
-        return adv_images
+        super().__init__(norm='linf', epsilon=epsilon, alpha=alpha, iters=iters, random_start=True,
+                         loss_fn=loss_fn, early_stop=early_stop, restarts=restarts, monitor=monitor,
+                         targeted=targeted, memory=memory,
+                         compile_step=compile_step, eot=eot)
     
     def set_iters(self, iters):
         """设置迭代次数"""
@@ -67,9 +34,56 @@ class PGDAttack:
         """设置扰动上限"""
         self.epsilon = epsilon
 
-def pgd_attack(model, images, labels, epsilon=0.3, alpha=0.01, iters=40, loss_fn=None):
+class PGDL2Attack(IterativeAttack):
+    """
+    PGD攻击的L2约束变体
+    """
+    
+    def __init__(self, epsilon=1.0, alpha=0.1, iters=40, loss_fn=None, early_stop=False, restarts=1,
+                 monitor=None, targeted=False, memory=None,
+                 compile_step=False, eot=None):
+        """
+        Args:
+            epsilon: 扰动上限（L2约束）
+            alpha: 每步步长（L2范数）
+            其余参数与IterativeAttack相同
+        """
+        super().__init__(norm='l2', epsilon=epsilon, alpha=alpha, iters=iters, random_start=True,
+                         loss_fn=loss_fn, early_stop=early_stop, restarts=restarts, monitor=monitor,
+                         targeted=targeted, memory=memory,
+                         compile_step=compile_step, eot=eot)
+
+class PGDL1Attack(IterativeAttack):
+    """
+    PGD攻击的L1约束变体（稀疏步进）
+    """
+    
+    def __init__(self, epsilon=10.0, alpha=1.0, iters=40, loss_fn=None, early_stop=False, restarts=1,
+                 sparsity=0.99, monitor=None, targeted=False, memory=None,
+                 compile_step=False, eot=None):
+        """
+        Args:
+            epsilon: 扰动上限（L1约束）
+            alpha: 每步步长（L1范数）
+            sparsity: 每步不更新的像素比例（即IterativeAttack的l1_sparsity）
+            其余参数与IterativeAttack相同
+        """
+        super().__init__(norm='l1', epsilon=epsilon, alpha=alpha, iters=iters, random_start=True,
+                         loss_fn=loss_fn, early_stop=early_stop, restarts=restarts, l1_sparsity=sparsity,
+                         monitor=monitor, targeted=targeted, memory=memory,
+                         compile_step=compile_step, eot=eot)
+
+def pgd_attack(model, images, labels, epsilon=0.3, alpha=0.01, iters=40, loss_fn=None,
+               early_stop=False, restarts=1, monitor=None, targeted=False, target_labels=None, memory=None,
+               compile_step=False, eot=None):
     """
     兼容性函数，保持原有接口
     """
-    attacker = PGDAttack(epsilon=epsilon, alpha=alpha, iters=iters, loss_fn=loss_fn)
-    return attacker.attack(model, images, labels) 
\ No newline at end of file
+    attacker = PGDAttack(epsilon=epsilon, alpha=alpha, iters=iters, loss_fn=loss_fn,
+                         early_stop=early_stop, restarts=restarts, monitor=monitor, targeted=targeted,
+                         memory=memory, compile_step=compile_step, eot=eot)
+    return attacker.attack(model, images, labels, target_labels)
+
+register_attack('PGD', PGDAttack)
+register_attack('PGD-L2', PGDL2Attack)
+register_attack('PGD-L1', PGDL1Attack)
\ No newline at end of file
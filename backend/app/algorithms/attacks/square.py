@@ -0,0 +1,141 @@
+import torch
+
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.registry import register_attack
+from app.algorithms.utils.score_oracle import ScoreOracle, margin_loss
+
+
+class SquareAttack:
+    """
+    Square Attack实现（L∞约束的基于分数的黑盒攻击）
+    任务书定位：面向ONNX等不可求导的已部署模型，只通过InferenceEngine.predict查询概率分布
+    每一轮为所有未成功的样本各生成num_candidates个随机方块扰动，打包成批次一起查询，
+    只接受使间隔损失下降的候选；样本攻击成功或用完查询预算后不再参与查询
+    """
+
+    def __init__(self, epsilon=0.05, max_queries=1000, p_init=0.05, num_candidates=1,
+                 batch_size=256, targeted=False, seed=0, monitor=None):
+        """
+        Args:
+            epsilon: 扰动上限（L∞约束）
+            max_queries: 每个样本的查询预算
+            p_init: 初始方块面积占图片面积的比例（随查询次数按原论文的分段策略减小）
+            num_candidates: 每个样本每轮生成的候选数
+            batch_size: 每次推理调用的最大候选数
+            targeted: 是否为目标攻击（labels为目标类别）
+            seed: 随机种子
+            monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+        """
+        self.epsilon = epsilon
+        self.max_queries = max_queries
+        self.p_init = p_init
+        self.num_candidates = num_candidates
+        self.batch_size = batch_size
+        self.targeted = targeted
+        self.seed = seed
+        self.monitor = monitor
+
+    def _p_selection(self, it):
+        """方块面积比例随迭代进度分段减半"""
+        it = int(it / self.max_queries * 10000)
+        for bound, divisor in ((10, 1), (50, 2), (200, 4), (500, 8), (1000, 16),
+                               (2000, 32), (4000, 64), (6000, 128), (8000, 256)):
+            if it <= bound:
+                return self.p_init / divisor
+        return self.p_init / 512
+
+    def attack(self, model, images, labels=None, target_labels=None):
+        """
+        执行Square攻击
+        Args:
+            model: 被攻击的模型（InferenceEngine、onnxruntime.InferenceSession或PyTorch模型）
+            images: 输入图片 (batch, C, H, W)
+            labels: 正确标签（为None时使用模型对原图的预测）
+            target_labels: 目标标签（目标攻击时使用，未提供时把labels视为目标类别）
+        Returns:
+            adv_images: 对抗样本
+        """
+        adv_images, _, _ = self.run(model, images, labels, target_labels)
+        return adv_images
+
+    def run(self, model, images, labels=None, target_labels=None):
+        """
+        执行Square攻击并返回查询统计
+        Returns:
+            adv_images: 对抗样本（位于输入所在的设备）
+            queries: 每个样本消耗的查询次数
+            success: 每个样本是否攻击成功
+        """
+        generator = torch.Generator().manual_seed(self.seed)
+        ori = images.detach().float().cpu()
+        batch_size, channels, height, width = ori.shape
+        oracle = ScoreOracle(model, batch_size, batch_size=self.batch_size, max_queries=self.max_queries)
+        monitor = resolve_monitor(self.monitor)
+        monitor.start('Square')
+        all_idx = torch.arange(batch_size)
+
+        if self.targeted and target_labels is not None:
+            labels = target_labels
+        if labels is None:
+            labels = oracle.probabilities(ori, all_idx).argmax(dim=1)
+        labels = torch.as_tensor(labels).cpu().long()
+
+        # 初始化：每列随机取±epsilon的竖条纹
+        stripes = torch.randint(0, 2, (batch_size, channels, 1, width), generator=generator).float() * 2 - 1
+        adv = (ori + self.epsilon * stripes).clamp_(0, 1)
+        margin = margin_loss(oracle.probabilities(adv, all_idx), labels, self.targeted)
+
+        q = self.num_candidates
+        rows_h = torch.arange(height)
+        rows_w = torch.arange(width)
+        samples_per_call = max(1, self.batch_size // q)
+        it = 0
+        while True:
+            active = ((margin > 0) & (oracle.remaining(all_idx) >= q)).nonzero(as_tuple=False).flatten()
+            if active.numel() == 0:
+                break
+            p = self._p_selection(it)
+            size = max(min(int(round((p * height * width) ** 0.5)), height - 1, width - 1), 1)
+            for start in range(0, active.numel(), samples_per_call):
+                idx = active[start:start + samples_per_call]
+                k = idx.numel()
+                with monitor.phase('update'):
+                    # 候选按 (num_candidates, k) 分块排列
+                    delta = (adv[idx] - ori[idx]).repeat(q, 1, 1, 1)
+                    top = torch.randint(0, height - size + 1, (q * k, 1), generator=generator)
+                    left = torch.randint(0, width - size + 1, (q * k, 1), generator=generator)
+                    window = (((rows_h >= top) & (rows_h < top + size)).unsqueeze(2)
+                              & ((rows_w >= left) & (rows_w < left + size)).unsqueeze(1)).unsqueeze(1)
+                    signs = torch.randint(0, 2, (q * k, channels, 1, 1), generator=generator).float() * 2 - 1
+                    delta = torch.where(window, self.epsilon * signs, delta)
+                    candidates = (ori[idx].repeat(q, 1, 1, 1) + delta).clamp_(0, 1)
+
+                owners = idx.repeat(q)
+                with monitor.phase('forward'):
+                    probs = oracle.probabilities(candidates, owners)
+                with monitor.phase('update'):
+                    cand_margin = margin_loss(probs, labels[owners], self.targeted)
+                    best_margin, best = cand_margin.view(q, k).min(dim=0)
+                    improved = best_margin < margin[idx]
+                    chosen = candidates.view(q, k, channels, height, width)[best, torch.arange(k)]
+                    adv[idx[improved]] = chosen[improved]
+                    margin[idx[improved]] = best_margin[improved]
+            if monitor.enabled:
+                monitor.record(it, loss=margin.mean(), success=margin <= 0, active=active.numel(),
+                               queries=float(oracle.queries.float().mean()))
+            it += q
+
+        return adv.to(images.device), oracle.queries, margin <= 0
+
+
+def square_attack(model, images, labels=None, epsilon=0.05, max_queries=1000, p_init=0.05,
+                  num_candidates=1, batch_size=256, targeted=False, seed=0, monitor=None):
+    """
+    兼容性函数，与其他攻击模块保持一致的函数式接口
+    """
+    attacker = SquareAttack(epsilon=epsilon, max_queries=max_queries, p_init=p_init,
+                            num_candidates=num_candidates, batch_size=batch_size,
+                            targeted=targeted, seed=seed, monitor=monitor)
+    return attacker.attack(model, images, labels)
+
+register_attack('Square', SquareAttack)
@@ -2,6 +2,11 @@ import torch
 import numpy as np
 from typing import List, Optional
 
+from app.algorithms.utils.registry import register_attack
+from app.algorithms.utils.synonym_index import EmbeddingSynonymIndex
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.text_victim import query_victim, resolve_query_cache
+
 class TextFoolerAttack:
     """
     TextFooler攻击实现
@@ -9,24 +14,43 @@ class TextFoolerAttack:
     核心方法：基于词向量相似度筛选替换词，确保对抗文本"人类难辨"（任务书要求"保持语义连贯性"）
     """
     
-    def __init__(self, word_embeddings=None, similarity_threshold=0.8, max_perturbations=3):
+    def __init__(self, word_embeddings=None, similarity_threshold=0.8, max_perturbations=3,
+                 max_candidates=50, batch_size=64, embedding_path=None, vocab_path=None,
+                 query_cache=None, monitor=None):
         """
         Args:
-            word_embeddings: 词向量模型（如Word2Vec、GloVe）
+            word_embeddings: 同义词索引（EmbeddingSynonymIndex，或任何提供synonyms(word, threshold, max_candidates)的对象）
             similarity_threshold: 词向量相似度阈值
             max_perturbations: 最大替换词数
+            max_candidates: 每个词最多尝试的同义词数
+            batch_size: 查询被攻击模型时每次前向的最大文本数
+            embedding_path: 词向量矩阵文件（.npy），未提供word_embeddings时据此构建同义词索引
+            vocab_path: 与词向量矩阵对应的词表文件
+            query_cache: 被攻击模型查询缓存（None使用共享默认缓存，False禁用）
+            monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
         """
+        if word_embeddings is None and embedding_path is not None:
+            word_embeddings = EmbeddingSynonymIndex(embedding_path, vocab_path, k=max_candidates)
         self.word_embeddings = word_embeddings
         self.similarity_threshold = similarity_threshold
         self.max_perturbations = max_perturbations
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self.query_cache = resolve_query_cache(query_cache)
+        self.monitor = monitor
+
+    def _query(self, model, texts):
+        """查询被攻击模型（计入监控的前向耗时）"""
+        with resolve_monitor(self.monitor).phase('forward'):
+            return query_victim(model, texts, self.batch_size, self.query_cache)
     
     def attack(self, model, texts, labels=None, tokenizer=None):
         """
         执行TextFooler攻击
         Args:
-            model: 文本分类模型
+            model: 文本分类模型（接收文本列表，返回logits）
             texts: 输入文本列表
-            labels: 标签列表
+            labels: 标签列表（为None时使用模型对原文的预测）
             tokenizer: 分词器
         Returns:
             adv_texts: 对抗文本列表
@@ -35,54 +59,93 @@ class TextFoolerAttack:
             # 简单的空格分词
             tokenizer = lambda x: x.split()
         
+        token_lists = [tokenizer(text) for text in texts]
+        # 所有原文的预测一次批量查询
+        orig_probs = self._query(model, [' '.join(tokens) for tokens in token_lists])
+        
+        monitor = resolve_monitor(self.monitor)
+        monitor.start('TextFooler')
         adv_texts = []
-        for i, text in enumerate(texts):
-            tokens = tokenizer(text)
-            label = labels[i] if labels is not None else None
+        succeeded = 0
+        for i, tokens in enumerate(token_lists):
+            label = int(labels[i]) if labels is not None else int(orig_probs[i].argmax())
             
-            # 获取重要词汇（基于梯度）
-            important_words = self._get_important_words(model, tokens, label)
+            # 获取重要词汇（基于删词后的置信度变化）
+            important_words = self._get_important_words(model, tokens, label, orig_probs[i])
             
             # 生成对抗文本
-            adv_text = self._generate_adversarial_text(tokens, important_words)
+            adv_text, flipped = self._generate_adversarial_text(model, tokens, important_words, label, orig_probs[i])
             adv_texts.append(adv_text)
+            succeeded += flipped
+            monitor.record(i, success=succeeded / (i + 1))
         
         return adv_texts
     
-    def _get_important_words(self, model, tokens, label):
-        """获取重要词汇"""
-        # 简化实现：返回所有词汇
-        return list(range(len(tokens)))
+    def _get_important_words(self, model, tokens, label, orig_prob):
+        """
+        获取重要词汇
+        把所有"删去一个词"的句子放进一个批次前向，按TextFooler的重要性得分从高到低排序
+        """
+        if len(tokens) <= 1:
+            return list(range(len(tokens)))
+        variants = [' '.join(tokens[:i] + tokens[i + 1:]) for i in range(len(tokens))]
+        probs = self._query(model, variants)
+        
+        scores = orig_prob[label] - probs[:, label]
+        # 删词后预测改变时，额外加上新类别置信度的提升
+        preds = probs.argmax(dim=1)
+        changed = preds != label
+        if changed.any():
+            rows = changed.nonzero(as_tuple=False).flatten()
+            scores[rows] += probs[rows, preds[rows]] - orig_prob[preds[rows]]
+        return scores.argsort(descending=True).tolist()
     
-    def _generate_adversarial_text(self, tokens, important_words):
-        """生成对抗文本"""
-        adv_tokens = tokens.copy()
+    def _generate_adversarial_text(self, model, tokens, important_words, label, orig_prob):
+        """
+        生成对抗文本
+        按重要性依次替换词汇：每个位置的所有同义词候选句放进一个批次查询，
+        出现使预测翻转的候选时选择相似度最高的一个并停止，否则保留使原类别置信度下降最多的替换
+        Returns:
+            (对抗文本, 是否攻击成功)
+        """
+        adv_tokens = list(tokens)
+        current_prob = float(orig_prob[label])
         perturbations = 0
         
         for word_idx in important_words:
             if perturbations >= self.max_perturbations:
                 break
                 
-            original_word = tokens[word_idx]
-            synonyms = self._get_synonyms(original_word)
+            synonyms = self._get_synonyms(tokens[word_idx])
+            if not synonyms:
+                continue
             
-            if synonyms:
-                # 选择最相似的同义词
-                best_synonym = synonyms[0]
-                adv_tokens[word_idx] = best_synonym
+            candidates = [adv_tokens[:word_idx] + [word] + adv_tokens[word_idx + 1:] for word, _ in synonyms]
+            probs = self._query(model, [' '.join(c) for c in candidates])
+            flipped = (probs.argmax(dim=1) != label).nonzero(as_tuple=False).flatten()
+            if flipped.numel() > 0:
+                # 同义词按相似度降序排列，第一个翻转的候选语义最接近
+                return ' '.join(candidates[int(flipped[0])]), True
+            
+            best = int(probs[:, label].argmin())
+            if float(probs[best, label]) < current_prob:
+                adv_tokens = candidates[best]
+                current_prob = float(probs[best, label])
                 perturbations += 1
         
-        return ' '.join(adv_tokens)
+        return ' '.join(adv_tokens), False
     
     def _get_synonyms(self, word):
-        """获取同义词（简化实现）"""
-        # 这里应该使用真实的同义词词典或词向量模型
-        # 简化实现返回空列表
-        return []
+        """获取同义词 [(词, 相似度)]，按相似度降序"""
+        if self.word_embeddings is None:
+            return []
+        return self.word_embeddings.synonyms(word, self.similarity_threshold, self.max_candidates)
 
 def textfooler_attack(model, texts, labels=None, **kwargs):
     """
     兼容性函数，保持原有接口
     """
     attacker = TextFoolerAttack(**kwargs)
-    return attacker.attack(model, texts, labels) 
\ No newline at end of file
+    return attacker.attack(model, texts, labels)
+
+register_attack('TextFooler', TextFoolerAttack)
\ No newline at end of file
@@ -1,31 +1,243 @@
+import os
+
 import torch
+import torch.nn.functional as F
+
+from app.algorithms.utils.detection import DetectionHarness
+from app.algorithms.utils.eot import resolve_eot
+from app.algorithms.utils.gradient_mode import input_grad, input_only_gradients
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.registry import register_attack
 
-def upc_attack(model, images, targets, iters=10, alpha=0.01, device='cpu'):
+
+@input_only_gradients
+def upc_attack(model, images, targets, iters=10, alpha=0.01, device='cpu', perturbation_limit=0.3, monitor=None,
+               eot=None, bucket_size=64):
     """
     UPC攻击实现（适用于Faster R-CNN等目标检测模型）
+    检测损失在损失模式（训练模式前向、BatchNorm保持推理行为）下计算；不同尺寸的图片按尺寸分桶，
+    每个桶补零为一个张量，一次前向、反向
     Args:
         model: 目标检测模型
-        images: 输入图片 (batch, C, H, W)
+        images: 输入图片 (batch, C, H, W) 或不同尺寸图片的列表
         targets: 目标检测标签（list[dict]，与torchvision格式一致）
         iters: 迭代次数
         alpha: 步长
         device: 设备
+        perturbation_limit: 扰动限制
+        monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+        eot: 期望变换（EOTTransform、其参数字典或采样数K，为None时只优化原始视角）
+        bucket_size: 尺寸分桶粒度（像素）
     Returns:
-        adv_images: 对抗样本
+        adv_images: 对抗样本（与输入格式一致）
+    """
+    eot = resolve_eot(eot)
+    harness = DetectionHarness(model, bucket_size=bucket_size)
+    clean = [img.detach().to(device) for img in images]
+    targets = [{k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in t.items()} for t in targets]
+    groups = []
+    for idx in harness.buckets(clean):
+        batch, sizes = harness.pad([clean[j] for j in idx])
+        # 补齐区域不属于图片，扰动始终保持为0
+        mask = harness.pad([torch.ones_like(clean[j]) for j in idx])[0]
+        groups.append((idx, batch, sizes, mask, torch.zeros_like(batch)))
+    monitor = resolve_monitor(monitor)
+    monitor.start('UPC')
+
+    with harness.loss_mode():
+        for i in range(iters):
+            total_loss = 0
+            for idx, batch, sizes, mask, perturbation in groups:
+                adv_batch = (batch + perturbation).detach().requires_grad_(True)
+                with monitor.phase('forward'):
+                    loss = harness.loss(adv_batch, sizes, [targets[j] for j in idx], eot)
+                with monitor.phase('backward'):
+                    grad = input_grad(loss, adv_batch)
+                with monitor.phase('update'):
+                    perturbation.add_(alpha * grad.sign())
+                    perturbation.clamp_(-perturbation_limit, perturbation_limit).mul_(mask)  # 限制扰动幅度
+                total_loss = total_loss + loss.detach()
+            monitor.record(i, loss=total_loss, buckets=len(groups))
+
+    adv_images = [None] * len(clean)
+    for idx, batch, sizes, _, perturbation in groups:
+        for j, adv in zip(idx, harness.unpad(torch.clamp(batch + perturbation, 0, 1), sizes)):
+            adv_images[j] = adv.detach()
+    if isinstance(images, torch.Tensor):
+        return torch.stack(adv_images)
+    return adv_images
+
+
+class UniversalPerturbation:
+    """
+    数据集级通用扰动（UPC的通用伪装模式）
+    用DataLoader遍历整个数据集，在多个epoch中持续更新同一个共享扰动，并定期写入检查点以便中断后续训；
+    数据集中的图片可以尺寸不同：扰动缩放到每张图片的尺寸后叠加，再与upc_attack一样按尺寸分桶、补齐后批量前向；
+    训练完成后可直接叠加到新图片上，不再需要任何梯度计算
     """
-    model.eval()
-    adv_images = images.clone().detach().to(device)
-    perturbation = torch.zeros_like(adv_images).to(device)
-
-    for i in range(iters):
-        adv_images = (images + perturbation).clone().detach().to(device)
-        adv_images.requires_grad = True
-        loss_dict = model(adv_images, targets)
-        loss = sum(loss for loss in loss_dict.values())
-        model.zero_grad()
-        loss.backward()
-        grad = adv_images.grad.data
-        perturbation = perturbation + alpha * grad.sign()
-        perturbation = torch.clamp(perturbation, -0.3, 0.3)  # 限制扰动幅度
-    adv_images = torch.clamp(images + perturbation, 0, 1).detach()
-    return adv_images 
\ No newline at end of file
+
+    def __init__(self, alpha=0.01, epochs=10, perturbation_limit=0.3, checkpoint_path=None, device='cpu',
+                 monitor=None, eot=None, bucket_size=64, checkpoint_every=None):
+        """
+        Args:
+            alpha: 每次更新的步长
+            epochs: 遍历数据集的轮数
+            perturbation_limit: 扰动限制（L∞）
+            checkpoint_path: 检查点文件路径（为None时不保存）
+            device: 设备
+            monitor: 训练过程监控器（AttackMonitor，每个批次记录一次）
+            eot: 期望变换（EOTTransform、其参数字典或采样数K，为None时只优化原始视角）
+            bucket_size: 尺寸分桶粒度（像素）
+            checkpoint_every: 每训练多少个批次写一次检查点（为None时只在每个epoch结束时写入）
+        """
+        if checkpoint_every is not None and int(checkpoint_every) < 1:
+            raise ValueError("检查点间隔必须为正整数")
+        self.alpha = alpha
+        self.epochs = epochs
+        self.perturbation_limit = perturbation_limit
+        self.checkpoint_path = checkpoint_path
+        self.device = device
+        self.monitor = monitor
+        self.eot = resolve_eot(eot)
+        self.bucket_size = bucket_size
+        self.checkpoint_every = int(checkpoint_every) if checkpoint_every is not None else None
+        self.perturbation = None
+        self.epoch = 0
+        # 当前epoch内已经训练的批次数（批次级检查点续训时跳过这些批次）
+        self.batch = 0
+
+    def save(self, path=None):
+        """保存扰动和训练进度（先写临时文件再替换，避免中断时损坏检查点）"""
+        path = path or self.checkpoint_path
+        if path is None or self.perturbation is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = path + '.tmp'
+        torch.save({
+            'perturbation': self.perturbation.detach().cpu(),
+            'epoch': self.epoch,
+            'batch': self.batch,
+            'alpha': self.alpha,
+            'perturbation_limit': self.perturbation_limit
+        }, tmp_path)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """加载检查点，返回是否加载成功"""
+        path = path or self.checkpoint_path
+        if path is None or not os.path.exists(path):
+            return False
+        checkpoint = torch.load(path, map_location=self.device)
+        self.perturbation = checkpoint['perturbation'].to(self.device)
+        self.epoch = checkpoint['epoch']
+        self.batch = checkpoint.get('batch', 0)
+        return True
+
+    @staticmethod
+    def _resize(perturbation, size):
+        """把扰动 (1, C, H, W) 缩放到指定的空间尺寸"""
+        if tuple(perturbation.shape[-2:]) != tuple(size):
+            perturbation = F.interpolate(perturbation, size=tuple(size), mode='bilinear', align_corners=False)
+        return perturbation
+
+    def _fit_to(self, images):
+        """把扰动缩放到与图片相同的空间尺寸"""
+        return self._resize(self.perturbation, images.shape[-2:])
+
+    def _batch_loss_grad(self, harness, perturbation, images, targets, monitor):
+        """
+        一个批次的检测损失对扰动的梯度
+        扰动缩放到每张图片的尺寸后叠加，图片按尺寸分桶、补齐，逐桶前向、反向并累加梯度（每个桶的计算图用完即释放）
+        """
+        grad = torch.zeros_like(perturbation)
+        total_loss = 0
+        for idx in harness.buckets(images):
+            leaf = perturbation.detach().requires_grad_(True)
+            with monitor.phase('forward'):
+                adv = [torch.clamp(images[j] + self._resize(leaf, images[j].shape[-2:])[0], 0, 1) for j in idx]
+                batch, sizes = harness.pad(adv)
+                loss = harness.loss(batch, sizes, [targets[j] for j in idx], self.eot)
+            with monitor.phase('backward'):
+                grad.add_(input_grad(loss, leaf))
+            total_loss = total_loss + loss.detach()
+        return total_loss, grad
+
+    @input_only_gradients
+    def fit(self, model, loader, resume=True):
+        """
+        在整个数据集上训练通用扰动
+        Args:
+            model: 目标检测模型
+            loader: 产生 (images, targets) 的DataLoader（images为批次张量或不同尺寸图片的列表，
+                    targets为检测目标字典列表）
+            resume: 是否从检查点继续训练（批次级检查点按批次数跳过本epoch已训练的批次，
+                    因此续训时loader应保持相同的遍历顺序）
+        Returns:
+            perturbation: 训练得到的扰动 (1, C, H, W)
+        """
+        harness = DetectionHarness(model, bucket_size=self.bucket_size)
+        if resume:
+            self.load()
+        monitor = resolve_monitor(self.monitor)
+        monitor.start('UPC-Universal')
+        step = 0
+
+        with harness.loss_mode():
+            for epoch in range(self.epoch, self.epochs):
+                for batch_idx, batch in enumerate(loader):
+                    if batch_idx < self.batch:
+                        continue
+                    images = [img.detach().to(self.device) for img in batch[0]]
+                    targets = [{k: v.to(self.device) if isinstance(v, torch.Tensor) else v for k, v in t.items()}
+                               for t in batch[1]]
+                    if self.perturbation is None:
+                        self.perturbation = torch.zeros_like(images[0]).unsqueeze(0)
+
+                    loss, grad = self._batch_loss_grad(harness, self.perturbation, images, targets, monitor)
+                    with monitor.phase('update'), torch.no_grad():
+                        self.perturbation.add_(self.alpha * grad.sign())
+                        self.perturbation.clamp_(-self.perturbation_limit, self.perturbation_limit)
+                    monitor.record(step, loss=loss, epoch=epoch)
+                    step += 1
+
+                    self.batch = batch_idx + 1
+                    if self.checkpoint_every and self.batch % self.checkpoint_every == 0:
+                        self.save()
+
+                self.epoch = epoch + 1
+                self.batch = 0
+                self.save()
+
+        return self.perturbation
+
+    @torch.no_grad()
+    def apply(self, images):
+        """
+        把已训练的扰动叠加到新图片上（无梯度计算）
+        Args:
+            images: 输入图片 (batch, C, H, W) 或不同尺寸图片的列表
+        Returns:
+            adv_images: 对抗样本（与输入格式一致）
+        """
+        if self.perturbation is None and not self.load():
+            raise ValueError("通用扰动尚未训练")
+        if not isinstance(images, torch.Tensor):
+            return [torch.clamp(img.to(self.device) + self._resize(self.perturbation, img.shape[-2:])[0], 0, 1)
+                    for img in images]
+        images = images.to(self.device)
+        return torch.clamp(images + self._fit_to(images), 0, 1)
+
+
+def upc_universal_attack(model, loader, alpha=0.01, epochs=10, perturbation_limit=0.3,
+                         checkpoint_path=None, device='cpu', monitor=None, eot=None, bucket_size=64,
+                         checkpoint_every=None):
+    """
+    兼容性函数：训练数据集级通用扰动并返回训练器（通过apply叠加到新图片）
+    """
+    trainer = UniversalPerturbation(alpha=alpha, epochs=epochs, perturbation_limit=perturbation_limit,
+                                    checkpoint_path=checkpoint_path, device=device, monitor=monitor,
+                                    eot=eot, bucket_size=bucket_size, checkpoint_every=checkpoint_every)
+    trainer.fit(model, loader)
+    return trainer
+
+register_attack('UPC', upc_attack)
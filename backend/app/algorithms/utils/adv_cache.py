@@ -0,0 +1,263 @@
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from app.algorithms.utils.fingerprint import model_fingerprint
+
+
+# 不影响攻击结果的参数（监控器、查询缓存、内存受限模式、编译模式），不参与缓存键的计算
+NON_SEMANTIC_PARAMS = ('monitor', 'query_cache', 'memory', 'compile_step')
+
+
+class UncacheableError(Exception):
+    """参数或输入无法规整为稳定的缓存键（此时不读写缓存，而不是退化为只按类型区分）"""
+
+
+def _qualified_name(value):
+    return f"{getattr(value, '__module__', None) or ''}.{value.__qualname__}"
+
+
+def _canonical(value, _active=None):
+    """
+    把攻击参数规整为可稳定序列化的形式（0.03与3e-2、1与1.0得到相同的键）
+    functools.partial按函数和绑定的参数规整，普通对象按类型和公开属性递归规整（跳过NON_SEMANTIC_PARAMS），
+    lambda、闭包、循环引用以及没有属性字典的对象无法从内容区分，抛出UncacheableError
+    """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, float)):
+        return repr(float(value))
+    if isinstance(value, np.generic):
+        return _canonical(value.item())
+    if isinstance(value, (torch.dtype, torch.device)):
+        return f"{type(value).__name__}:{value}"
+    if isinstance(value, (torch.Tensor, np.ndarray)):
+        digest = hashlib.sha1()
+        _update_digest(digest, torch.from_numpy(value) if isinstance(value, np.ndarray) else value)
+        return 'tensor:' + digest.hexdigest()
+    if isinstance(value, torch.nn.Module):
+        fingerprint = model_fingerprint(value)
+        if fingerprint is None:
+            raise UncacheableError(type(value).__qualname__)
+        # 参数和缓冲区由指纹覆盖；没有参数的模块（如损失函数）靠类名和公开配置属性（reduction、label_smoothing等）区分
+        state = {k: v for k, v in vars(value).items() if not k.startswith('_') and not isinstance(v, torch.Tensor)}
+        return {'module': _qualified_name(type(value)), 'fingerprint': fingerprint,
+                'state': _canonical(state, _active)}
+    if inspect.isfunction(value) or inspect.isbuiltin(value) or inspect.isclass(value):
+        name = value.__qualname__
+        if '<lambda>' in name or '<locals>' in name:
+            raise UncacheableError(name)
+        return f"callable:{_qualified_name(value)}"
+
+    _active = _active if _active is not None else set()
+    if id(value) in _active:
+        raise UncacheableError(f"循环引用: {type(value).__qualname__}")
+    _active.add(id(value))
+    try:
+        if isinstance(value, (list, tuple)):
+            return [_canonical(v, _active) for v in value]
+        if isinstance(value, (set, frozenset)):
+            return sorted((_canonical(v, _active) for v in value), key=json.dumps)
+        if isinstance(value, dict):
+            return {str(k): _canonical(v, _active) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+        if isinstance(value, functools.partial):
+            return {'partial': _canonical(value.func, _active), 'args': _canonical(value.args, _active),
+                    'keywords': _canonical(value.keywords, _active)}
+        if inspect.ismethod(value):
+            return {'method': _qualified_name(value.__func__), 'self': _canonical(value.__self__, _active)}
+        if hasattr(value, 'fingerprint'):
+            return f"object:{_qualified_name(type(value))}:{value.fingerprint}"
+        if hasattr(value, '__dict__'):
+            # 公开属性视为配置，下划线开头的属性（内部缓存、锁等）不参与
+            state = {k: v for k, v in vars(value).items() if not k.startswith('_') and k not in NON_SEMANTIC_PARAMS}
+            return {'object': _qualified_name(type(value)), 'state': _canonical(state, _active)}
+        raise UncacheableError(type(value).__qualname__)
+    finally:
+        _active.discard(id(value))
+
+
+def _update_digest(digest, value):
+    """按内容递归计算输入（张量、张量列表、文本列表、检测目标字典等）的哈希"""
+    if isinstance(value, torch.Tensor):
+        data = value.detach().cpu().contiguous()
+        if data.dtype == torch.bfloat16:
+            data = data.float()
+        digest.update(f"T{data.dtype}{tuple(data.shape)}".encode())
+        digest.update(data.numpy().tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"L{len(value)}".encode())
+        for item in value:
+            _update_digest(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f"D{len(value)}".encode())
+        for k in sorted(value, key=str):
+            digest.update(str(k).encode())
+            _update_digest(digest, value[k])
+    else:
+        digest.update(json.dumps(_canonical(value)).encode())
+
+
+def _to_cpu(value):
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu().contiguous()
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_cpu(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _to_cpu(v) for k, v in value.items()}
+    return value
+
+
+def _to_device(value, reference):
+    """把缓存结果移动到与输入相同的设备"""
+    if isinstance(value, torch.Tensor):
+        device = reference.device if isinstance(reference, torch.Tensor) else None
+        if device is None and isinstance(reference, (list, tuple)) and reference and isinstance(reference[0], torch.Tensor):
+            device = reference[0].device
+        return value.to(device) if device is not None else value
+    if isinstance(value, list) and isinstance(reference, (list, tuple)) and len(value) == len(reference):
+        return [_to_device(v, r) for v, r in zip(value, reference)]
+    return value
+
+
+class AdversarialCache:
+    """
+    对抗样本持久化缓存
+    以 (模型权重指纹, 攻击名, 规整后的参数, 输入批次哈希, 标签哈希) 为键，把对抗样本以张量分片文件保存在磁盘上；
+    总大小超过预算时按最近使用时间淘汰最旧的分片。同样的模型、攻击、参数和样本再次评估时直接读取，不再重新生成
+    """
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 键 -> 分片大小，按最近使用时间从旧到新排列
+        self._index = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """启动时按文件修改时间重建LRU索引"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.pt'):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-3], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.pt')
+
+    def make_key(self, model, attack_name, params, inputs, labels=None):
+        """
+        计算缓存键
+        Args:
+            model: 被攻击的模型
+            attack_name: 攻击注册名
+            params: 攻击参数
+            inputs: 输入批次
+            labels: 标签（无标签的攻击为None）
+        Returns:
+            键（十六进制SHA1）；模型没有稳定指纹或参数无法规整时返回None（不缓存）
+        """
+        fingerprint = model_fingerprint(model)
+        if fingerprint is None:
+            return None
+        digest = hashlib.sha1()
+        digest.update(fingerprint.encode())
+        digest.update(b'\x1f' + str(attack_name).encode() + b'\x1f')
+        params = {k: v for k, v in dict(params or {}).items() if k not in NON_SEMANTIC_PARAMS}
+        try:
+            digest.update(json.dumps(_canonical(params), sort_keys=True).encode())
+            _update_digest(digest, inputs)
+            _update_digest(digest, labels)
+        except UncacheableError:
+            return None
+        return digest.hexdigest()
+
+    def get(self, key):
+        """读取分片，未命中返回None"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                value = torch.load(path, map_location='cpu')
+            except (OSError, RuntimeError, EOFError):
+                # 分片被外部删除或写坏时视为未命中
+                self.total_bytes -= self._index.pop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            os.utime(path)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """写入分片（先写临时文件再原子替换），并按预算淘汰最久未使用的分片"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save(_to_cpu(value), tmp_path)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.total_bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            while self.total_bytes > self.max_bytes and len(self._index) > 1:
+                old_key, old_size = self._index.popitem(last=False)
+                self.total_bytes -= old_size
+                try:
+                    os.remove(self._path(old_key))
+                except FileNotFoundError:
+                    pass
+
+    def get_or_generate(self, model, attack_name, params, inputs, labels, generate):
+        """
+        查询缓存，未命中时调用generate()生成对抗样本并写入缓存；无法计算稳定的缓存键时直接生成，不读写缓存
+        Returns:
+            对抗样本（张量结果位于输入所在的设备）
+        """
+        key = self.make_key(model, attack_name, params, inputs, labels)
+        if key is None:
+            with self._lock:
+                self.bypassed += 1
+            return generate()
+        cached = self.get(key)
+        if cached is not None:
+            return _to_device(cached, inputs)
+        result = generate()
+        self.put(key, result)
+        return result
+
+    def stats(self):
+        """命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._index),
+            'total_bytes': self.total_bytes,
+            'max_bytes': self.max_bytes
+        }
@@ -1,6 +1,88 @@
+import torch
+
+
 class AttackBase:
-    def __init__(self, model):
+    """
+    攻击算法统一接口
+    所有注册的攻击都通过 generate(inputs, labels) 调用，并支持按DataLoader流式生成对抗样本
+    """
+
+    name = None
+
+    def __init__(self, model, **params):
+        """
+        Args:
+            model: 被攻击的模型
+            params: 攻击参数（未指定的参数使用config.yml中attack_algorithms的默认值）
+        """
         self.model = model
+        self.params = params
+
+    def generate(self, inputs, labels, target_labels=None, **kwargs):
+        raise NotImplementedError("子类需实现 generate 方法")
+
+    def _model_device(self):
+        """被攻击模型所在设备（无参数的模型默认CPU）"""
+        if isinstance(self.model, torch.nn.Module):
+            for param in self.model.parameters():
+                return param.device
+        return torch.device('cpu')
+
+    def generate_stream(self, loader, chunk_size=None, target_labels=None, **kwargs):
+        """
+        流式生成对抗样本
+        逐批读取DataLoader，并把每批再切成不超过chunk_size的块依次攻击，
+        任意时刻只有一个块驻留在内存中，适合无法一次性载入的大规模样本集
+        Args:
+            loader: DataLoader或任意产生 (inputs, labels, ...) 的可迭代对象
+            chunk_size: 每次攻击的最大样本数（为None时按DataLoader的批次大小）
+            target_labels: 目标标签（目标攻击时使用）：与整个样本流按顺序对应的张量，
+                           或根据每块标签返回目标标签的函数 target_labels(chunk_labels)
+            kwargs: 透传给generate的参数
+        Yields:
+            (adv_inputs, labels): 对抗样本块及对应标签，对抗样本位于输入原来所在的设备
+        """
+        device = self._model_device()
+        offset = 0
+        for batch in loader:
+            inputs, labels = batch[0], batch[1]
+            size = len(inputs)
+            step = chunk_size or size
+            for start in range(0, size, step):
+                chunk = inputs[start:start + step]
+                chunk_labels = labels[start:start + step]
+                chunk_targets = None
+                if callable(target_labels):
+                    chunk_targets = target_labels(chunk_labels)
+                elif target_labels is not None:
+                    chunk_targets = target_labels[offset + start:offset + start + len(chunk)]
+                if isinstance(chunk, torch.Tensor):
+                    source_device = chunk.device
+                    chunk = chunk.to(device)
+                    if isinstance(chunk_labels, torch.Tensor):
+                        chunk_labels = chunk_labels.to(device)
+                    if isinstance(chunk_targets, torch.Tensor):
+                        chunk_targets = chunk_targets.to(device)
+                    adv = self.generate(chunk, chunk_labels, target_labels=chunk_targets, **kwargs)
+                    yield adv.detach().to(source_device), labels[start:start + step]
+                else:
+                    yield self.generate(chunk, chunk_labels, target_labels=chunk_targets, **kwargs), chunk_labels
+            offset += size
 
-    def generate(self, inputs, labels, **kwargs):
-        raise NotImplementedError("子类需实现 generate 方法") 
\ No newline at end of file
+    def generate_to(self, loader, writer, chunk_size=None, **kwargs):
+        """
+        流式生成对抗样本并写入分片写入器（ShardedSampleWriter），
+        写盘在写入器的后台线程进行，与下一块的生成重叠；
+        无论生成是否出错，返回前都会关闭写入器（结束后台线程、写完最后一个分片和索引文件）
+        Args:
+            loader: DataLoader或任意产生 (inputs, labels, ...) 的可迭代对象
+            writer: 分片写入器（调用后即关闭，不能继续写入）
+            chunk_size: 每次攻击的最大样本数
+            kwargs: 透传给generate的参数
+        Returns:
+            写入的样本总数
+        """
+        with writer:
+            writer.consume(self.generate_stream(loader, chunk_size, **kwargs),
+                           sample_metadata={'attack': self.name} if self.name else None)
+        return writer.total
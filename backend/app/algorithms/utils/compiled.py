@@ -0,0 +1,125 @@
+import functools
+import threading
+import warnings
+
+import torch
+
+# 编译键 -> CompiledKernel；编译失败的键记录在_FAILED中，之后直接使用eager实现
+_KERNELS = {}
+_FAILED = set()
+_LOCK = threading.Lock()
+
+
+def compile_available():
+    """当前PyTorch是否支持torch.compile（2.0及以上）"""
+    return hasattr(torch, 'compile')
+
+
+def kernel_key(models, sample_shape, dtype, device, config):
+    """
+    编译缓存键：(模型类, 单个样本形状, 数据类型, 设备类型, 攻击配置)
+    批次维度不参与键的计算，早停压缩批次时由torch.compile的动态形状处理，不会重新创建内核
+    """
+    model_classes = tuple(f"{type(m).__module__}.{type(m).__qualname__}" for m in models)
+    return model_classes, tuple(sample_shape), str(dtype), torch.device(device).type, tuple(config)
+
+
+def _first_differentiable(result):
+    values = result if isinstance(result, (tuple, list)) else (result,)
+    for value in values:
+        if isinstance(value, torch.Tensor) and value.requires_grad:
+            return value
+    return None
+
+
+def _shape_signature(args):
+    return tuple(tuple(a.shape) for a in args if isinstance(a, torch.Tensor))
+
+
+class CompiledKernel:
+    """
+    torch.compile编译的攻击步进内核
+    每遇到一组新的输入形状（首次调用、早停压缩批次后的重新编译）都同时完成前向和反向图的编译并校验
+    （对第一个可求导的输出求一次输入梯度）；任何一次编译或执行失败（模型含有无法编译的算子、
+    PyTorch版本不支持torch.compile等），该键之后都回退到eager实现
+    """
+
+    def __init__(self, fn, key):
+        """
+        Args:
+            fn: 被编译的函数（模块级纯函数：结果只取决于参数，攻击配置也作为参数传入，不能是绑定方法）
+            key: 编译缓存键
+        """
+        self.fn = fn
+        self.key = key
+        self._compiled = torch.compile(fn) if compile_available() else None
+        self._verified = set()
+
+    @property
+    def compiled(self):
+        """该内核当前是否以编译模式运行"""
+        return self._compiled is not None and self.key not in _FAILED
+
+    def __call__(self, *args):
+        if not self.compiled:
+            return self.fn(*args)
+        signature = _shape_signature(args)
+        try:
+            result = self._compiled(*args)
+            if signature not in self._verified:
+                self._check_backward(args, result)
+                self._verified.add(signature)
+        except Exception as e:  # 编译失败不影响攻击本身，回退到eager
+            warnings.warn(f"攻击步进编译失败，回退到eager模式: {type(e).__name__}: {e}")
+            _FAILED.add(self.key)
+            return self.fn(*args)
+        return result
+
+    @staticmethod
+    def _check_backward(args, result):
+        """反向图在第一次反向传播时才编译，这里提前触发，保留计算图供攻击本身的反向使用"""
+        output = _first_differentiable(result)
+        inputs = [a for a in args if isinstance(a, torch.Tensor) and a.requires_grad]
+        if output is None or not inputs:
+            return
+        torch.autograd.grad(output.sum(), inputs, retain_graph=True, allow_unused=True)
+
+
+def compiled_kernel(fn, key):
+    """
+    获取fn的编译内核（按key缓存，同一键只编译一次）
+    Args:
+        fn: 被编译的模块级纯函数（结果只能依赖参数，键相同的后续调用复用第一次传入的fn，
+            因此不能传入绑定方法或捕获攻击器状态的闭包；攻击配置用functools.partial绑定到返回的内核上）
+        key: 编译缓存键（见kernel_key）
+    Returns:
+        可直接调用的内核，编译不可用或失败时等价于fn
+    """
+    with _LOCK:
+        kernel = _KERNELS.get(key)
+        if kernel is None:
+            kernel = _KERNELS[key] = CompiledKernel(fn, key)
+    return kernel
+
+
+def clear_compiled_kernels():
+    """清空编译缓存（包括编译失败记录）"""
+    with _LOCK:
+        _KERNELS.clear()
+        _FAILED.clear()
+
+
+def _model_forward(model, inputs):
+    return model(inputs)
+
+
+def compiled_forward(model, example):
+    """
+    被攻击模型前向的编译内核（按模型类和单个样本形状缓存），返回可替代model(x)的函数
+    前向图由torch.compile捕获，反向图由AOTAutograd生成，二者都融合为少量内核
+    Args:
+        model: 被攻击模型
+        example: 形状、类型与攻击输入一致的张量
+    """
+    key = kernel_key([model], example.shape[1:], example.dtype, example.device, ('forward',))
+    return functools.partial(compiled_kernel(_model_forward, key), model)
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch.nn as nn
+
+# 训练模式下计算损失时保持推理行为的层：BatchNorm不使用批统计量也不更新运行均值，Dropout不丢弃
+_FROZEN_LAYERS = (nn.modules.batchnorm._BatchNorm, nn.modules.dropout._DropoutNd)
+
+
+def _anchor_generators(model):
+    """模型中的锚框生成器（torchvision的AnchorGenerator、SSD的DefaultBoxGenerator等）"""
+    return [m for m in model.modules() if type(m).__name__ in ('AnchorGenerator', 'DefaultBoxGenerator')]
+
+
+class DetectionHarness:
+    """
+    目标检测攻击的批处理工具
+    - 尺寸分桶：不同尺寸的图片按补齐后的尺寸分组，每组补零为一个张量，同组图片共享一个求梯度的叶子张量，
+      检测模型内部批处理时补齐尺寸相同，减少无效计算
+    - 损失模式：torchvision检测模型只有在训练模式下才返回损失字典，这里切换到训练模式的同时
+      保持BatchNorm和Dropout的推理行为（攻击执行期间参数梯度由input_only_gradients关闭）
+    - 锚框复用：锚框只取决于补齐后的输入尺寸和特征图尺寸，同尺寸的批次在多次迭代间直接复用
+    """
+
+    def __init__(self, model, bucket_size=64, anchor_cache_size=32):
+        """
+        Args:
+            model: 目标检测模型
+            bucket_size: 分桶粒度（像素），图片高宽向上取整到该值的倍数后相同即分为一组
+            anchor_cache_size: 缓存的锚框尺寸组合数（为0时不缓存）
+        """
+        self.model = model
+        self.bucket_size = bucket_size
+        self.anchor_cache_size = anchor_cache_size
+        self.anchor_cache = OrderedDict()
+        self.anchor_hits = self.anchor_misses = 0
+        # torchvision检测模型接收图片列表并在内部完成缩放和补齐，其他模型直接接收补齐后的张量
+        self.accepts_list = hasattr(model, 'transform')
+
+    def _bucket_key(self, image):
+        b = self.bucket_size
+        height, width = image.shape[-2:]
+        return (image.shape[0], -(-height // b) * b, -(-width // b) * b)
+
+    def buckets(self, images):
+        """
+        按补齐后的尺寸分组
+        Args:
+            images: 图片列表（每张 (C, H, W)）或批次张量
+        Returns:
+            下标分组列表（组内保持输入顺序）
+        """
+        groups = OrderedDict()
+        for i, image in enumerate(images):
+            groups.setdefault(self._bucket_key(image), []).append(i)
+        return list(groups.values())
+
+    def pad(self, images):
+        """
+        把同一组图片补零为一个张量
+        Args:
+            images: 同一组的图片列表
+        Returns:
+            batch: 补齐后的张量 (k, C, H_bucket, W_bucket)
+            sizes: 每张图片的原始尺寸 [(H, W), ...]
+        """
+        _, height, width = self._bucket_key(images[0])
+        batch = images[0].new_zeros((len(images), images[0].size(0), height, width))
+        sizes = []
+        for k, image in enumerate(images):
+            h, w = image.shape[-2:]
+            batch[k, :, :h, :w] = image
+            sizes.append((h, w))
+        return batch, sizes
+
+    @staticmethod
+    def unpad(batch, sizes):
+        """按原始尺寸取回每张图片"""
+        return [batch[k, :, :h, :w] for k, (h, w) in enumerate(sizes)]
+
+    def inputs(self, batch, sizes):
+        """模型输入：torchvision检测模型使用各图片原始区域的视图列表（梯度回传到补齐张量），其他模型使用补齐张量"""
+        return self.unpad(batch, sizes) if self.accepts_list else batch
+
+    def _cached_forward(self, generator):
+        forward = generator.forward
+
+        def cached(image_list, feature_maps):
+            key = (type(generator).__name__, id(generator), tuple(image_list.tensors.shape[-2:]),
+                   tuple(tuple(f.shape[-2:]) for f in feature_maps), feature_maps[0].dtype, feature_maps[0].device)
+            anchors = self.anchor_cache.get(key)
+            if anchors is None:
+                self.anchor_misses += 1
+                anchors = forward(image_list, feature_maps)[0]
+                self.anchor_cache[key] = anchors
+                if len(self.anchor_cache) > self.anchor_cache_size:
+                    self.anchor_cache.popitem(last=False)
+            else:
+                self.anchor_hits += 1
+                self.anchor_cache.move_to_end(key)
+            # 同一批次内每张图片的锚框相同，只计算一份
+            return [anchors] * len(image_list.image_sizes)
+
+        return cached
+
+    @contextmanager
+    def _anchor_reuse(self):
+        patched = []
+        if self.anchor_cache_size > 0:
+            for generator in _anchor_generators(self.model):
+                patched.append((generator, generator.__dict__.get('forward')))
+                generator.forward = self._cached_forward(generator)
+        try:
+            yield
+        finally:
+            for generator, saved in reversed(patched):
+                if saved is None:
+                    del generator.forward
+                else:
+                    generator.forward = saved
+
+    @contextmanager
+    def _modes(self, training):
+        saved = [(m, m.training) for m in self.model.modules()]
+        self.model.train(training)
+        if training:
+            for m in self.model.modules():
+                if isinstance(m, _FROZEN_LAYERS):
+                    m.eval()
+        try:
+            with self._anchor_reuse():
+                yield
+        finally:
+            for m, mode in saved:
+                m.training = mode
+
+    def loss_mode(self):
+        """损失模式：训练模式前向返回损失字典，BatchNorm和Dropout保持推理行为，复用锚框"""
+        return self._modes(True)
+
+    def eval_mode(self):
+        """推理模式：前向返回检测结果，复用锚框"""
+        return self._modes(False)
+
+    def loss(self, batch, sizes, targets, eot=None):
+        """
+        一组图片的检测损失（损失字典求和），需要在loss_mode内调用
+        Args:
+            batch: 补齐后的图片张量（需要求梯度时为叶子张量）
+            sizes: 每张图片的原始尺寸
+            targets: 检测目标（list[dict]，与torchvision格式一致）
+            eot: 期望变换采样器（EOTTransform）；启用时对补齐后的整张图片展开K个随机视角，检测框同步变换
+        """
+        if eot is not None:
+            batch, matrix = eot.transform(batch)
+            targets = eot.expand_targets(targets, matrix, batch.size(-2), batch.size(-1))
+            sizes = [tuple(batch.shape[-2:])] * batch.size(0)
+        loss_dict = self.model(self.inputs(batch, sizes), targets)
+        return sum(loss for loss in loss_dict.values())
+
+    def stats(self):
+        """锚框缓存命中统计"""
+        return {'anchor_hits': self.anchor_hits, 'anchor_misses': self.anchor_misses,
+                'anchor_entries': len(self.anchor_cache)}
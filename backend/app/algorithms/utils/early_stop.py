@@ -0,0 +1,61 @@
+import torch
+import torch.nn.functional as F
+
+
+class BestAdversarialTracker:
+    """
+    逐样本攻击结果跟踪器
+    记录每个样本是否已攻击成功，并保存目前最好的对抗样本：
+    成功的样本保存第一次成功时的对抗样本；尚未成功的样本保存损失最大的对抗样本
+    """
+
+    def __init__(self, images, targeted=False):
+        """
+        Args:
+            images: 原始图片 (batch, C, H, W)，用于初始化最佳对抗样本
+            targeted: 是否为目标攻击（成功条件为预测等于目标标签）
+        """
+        batch_size = images.size(0)
+        self.targeted = targeted
+        self.best_adv = images.clone().detach()
+        self.best_loss = torch.full((batch_size,), float('-inf'), device=images.device)
+        self.success = torch.zeros(batch_size, dtype=torch.bool, device=images.device)
+
+    @torch.no_grad()
+    def update(self, sample_idx, adv_images, outputs, labels):
+        """
+        用一批对抗样本的前向结果更新跟踪状态
+        Args:
+            sample_idx: 当前活跃样本在原批次中的下标 (n,)
+            adv_images: 对抗样本，按重启次数分块排列 (restarts * n, C, H, W)
+            outputs: 模型输出 (restarts * n, num_classes)
+            labels: 活跃样本的标签（目标攻击时为目标标签）(n,)
+        Returns:
+            done: 活跃样本中已攻击成功的掩码 (n,)
+        """
+        n = sample_idx.size(0)
+        restarts = adv_images.size(0) // n
+        all_labels = labels.repeat(restarts)
+        loss = F.cross_entropy(outputs, all_labels, reduction='none')
+        pred = outputs.argmax(dim=1)
+        if self.targeted:
+            loss = -loss
+            fooled = pred == all_labels
+        else:
+            fooled = pred != all_labels
+
+        # 同一样本的多个重启位于不同分块中，逐块写入保证每次写入的下标唯一
+        for r in range(restarts):
+            block = slice(r * n, (r + 1) * n)
+            prev = self.success[sample_idx]
+            new_success = fooled[block] & ~prev
+            better = ~prev & ~fooled[block] & (loss[block] > self.best_loss[sample_idx])
+            take = new_success | better
+            if take.any():
+                idx = sample_idx[take]
+                self.best_adv[idx] = adv_images[block][take].detach()
+                self.best_loss[idx] = loss[block][take]
+            self.success[sample_idx[new_success]] = True
+
+        return self.success[sample_idx]
+
@@ -0,0 +1,225 @@
+import math
+
+import torch
+import torch.nn.functional as F
+
+from app.dataloader.loader import DataAugmentation
+
+# EOT默认采样的变换（对应物理世界中的视角、距离、光照和对焦变化）
+DEFAULT_TRANSFORMS = ('rotation', 'random_crop', 'color_jitter', 'gaussian_blur')
+SUPPORTED_TRANSFORMS = ('horizontal_flip', 'vertical_flip', 'rotation', 'random_crop', 'color_jitter', 'gaussian_blur')
+
+
+def _range(value, center=1.0):
+    """ColorJitter的参数可能是None、单个数值或(min, max)"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return (max(0.0, center - value), center + value)
+    return (float(value[0]), float(value[1]))
+
+
+class EOTTransform:
+    """
+    期望变换（Expectation over Transformation）采样器
+    变换种类和参数范围取自DataAugmentation中的图像增强（旋转角度、平移范围、模糊核、亮度/对比度/饱和度），
+    另加随机缩放。每次调用为 K×n 个视角逐行独立采样参数，整批用一次affine_grid/grid_sample、
+    一次分组卷积和逐行缩放完成，全部可求导：攻击每步只需对展开后的批次做一次前向和一次反向，
+    输入梯度自动对K个视角求平均
+    """
+
+    def __init__(self, num_samples=8, transforms=DEFAULT_TRANSFORMS, scale=(0.9, 1.1), seed=None):
+        """
+        Args:
+            num_samples: 每步采样的变换数K
+            transforms: 使用的DataAugmentation图像增强名称
+            scale: 随机缩放范围（为None时不缩放）
+            seed: 随机种子（为None时使用全局随机状态）
+        """
+        unsupported = [name for name in transforms if name not in SUPPORTED_TRANSFORMS]
+        if unsupported:
+            raise ValueError(f"EOT不支持的变换: {', '.join(unsupported)}")
+        if num_samples < 1:
+            raise ValueError("EOT采样数必须为正整数")
+        augmentations = DataAugmentation('image').augmentations
+        self.num_samples = int(num_samples)
+        self.transforms = tuple(transforms)
+        self.scale = tuple(scale) if scale is not None else None
+        self.generator = torch.Generator().manual_seed(seed) if seed is not None else None
+
+        self.hflip_p = augmentations['horizontal_flip'].p if 'horizontal_flip' in transforms else 0.0
+        self.vflip_p = augmentations['vertical_flip'].p if 'vertical_flip' in transforms else 0.0
+        self.degrees = tuple(augmentations['rotation'].degrees) if 'rotation' in transforms else None
+        self.translate = None
+        if 'random_crop' in transforms:
+            # RandomCrop的padding相对裁剪尺寸的比例作为最大平移比例
+            crop = augmentations['random_crop']
+            padding = crop.padding if isinstance(crop.padding, int) else crop.padding[0]
+            self.translate = (padding / crop.size[1], padding / crop.size[0])
+        self.brightness = self.contrast = self.saturation = None
+        if 'color_jitter' in transforms:
+            jitter = augmentations['color_jitter']
+            self.brightness = _range(jitter.brightness)
+            self.contrast = _range(jitter.contrast)
+            self.saturation = _range(jitter.saturation)
+        self.blur_kernel = self.blur_sigma = None
+        if 'gaussian_blur' in transforms:
+            blur = augmentations['gaussian_blur']
+            self.blur_kernel = int(blur.kernel_size[0])
+            self.blur_sigma = tuple(blur.sigma)
+
+    @property
+    def geometric(self):
+        return bool(self.degrees or self.translate or self.scale or self.hflip_p or self.vflip_p)
+
+    def _uniform(self, rows, bounds, device):
+        low, high = bounds
+        return (torch.rand(rows, generator=self.generator) * (high - low) + low).to(device)
+
+    def _bernoulli(self, rows, p, device):
+        return (torch.rand(rows, generator=self.generator) < p).to(device)
+
+    def _affine(self, rows, height, width, device):
+        """
+        逐行采样几何变换，返回像素坐标系（以图像中心为原点）下的正向变换矩阵 (rows, 2, 3)：
+        变换后坐标 = A · 原坐标 + t
+        """
+        if self.degrees:
+            angle = self._uniform(rows, self.degrees, device) * math.pi / 180
+        else:
+            angle = torch.zeros(rows, device=device)
+        scale = self._uniform(rows, self.scale, device) if self.scale else torch.ones(rows, device=device)
+        # 翻转即对应坐标轴的缩放取负
+        sx = scale * (1 - 2 * self._bernoulli(rows, self.hflip_p, device).float())
+        sy = scale * (1 - 2 * self._bernoulli(rows, self.vflip_p, device).float())
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        matrix = torch.zeros(rows, 2, 3, device=device)
+        matrix[:, 0, 0] = cos * sx
+        matrix[:, 0, 1] = -sin * sy
+        matrix[:, 1, 0] = sin * sx
+        matrix[:, 1, 1] = cos * sy
+        if self.translate:
+            matrix[:, 0, 2] = self._uniform(rows, (-self.translate[0], self.translate[0]), device) * width
+            matrix[:, 1, 2] = self._uniform(rows, (-self.translate[1], self.translate[1]), device) * height
+        return matrix
+
+    @staticmethod
+    def _sampling_grid(matrix, shape):
+        """把像素坐标系下的正向变换转换为grid_sample使用的归一化逆变换"""
+        rows, _, height, width = shape
+        full = torch.eye(3, device=matrix.device).repeat(rows, 1, 1)
+        full[:, :2] = matrix
+        inverse = torch.inverse(full)[:, :2]
+        scale = torch.tensor([width / 2, height / 2], device=matrix.device)
+        theta = inverse.clone()
+        # 归一化坐标 = 像素坐标 / (W/2, H/2)，非方形图像旋转时不会变形
+        theta[:, :, :2] = inverse[:, :, :2] * scale.view(1, 1, 2) / scale.view(1, 2, 1)
+        theta[:, :, 2] = inverse[:, :, 2] / scale.view(1, 2)
+        return F.affine_grid(theta, list(shape), align_corners=False)
+
+    def _blur(self, batch, device):
+        """逐行采样sigma的高斯模糊（可分离卷积，所有行和通道一次分组卷积完成）"""
+        rows, channels, height, width = batch.shape
+        radius = self.blur_kernel // 2
+        sigma = self._uniform(rows, self.blur_sigma, device)
+        offsets = torch.arange(-radius, radius + 1, device=device, dtype=batch.dtype)
+        kernel = torch.exp(-offsets.view(1, -1) ** 2 / (2 * sigma.view(-1, 1) ** 2))
+        kernel = (kernel / kernel.sum(dim=1, keepdim=True)).repeat_interleave(channels, dim=0)
+        x = F.pad(batch.reshape(1, rows * channels, height, width), (radius, radius, radius, radius), mode='reflect')
+        x = F.conv2d(x, kernel.view(-1, 1, 1, self.blur_kernel), groups=rows * channels)
+        x = F.conv2d(x, kernel.view(-1, 1, self.blur_kernel, 1), groups=rows * channels)
+        return x.view(rows, channels, height, width)
+
+    def transform(self, images):
+        """
+        把一批图片展开为K个随机视角
+        Args:
+            images: 输入图片 (n, C, H, W)
+        Returns:
+            batch: 变换后的图片 (K * n, C, H, W)，按 (变换, 样本) 分块排列，第 k * n + i 行对应样本i的第k个视角
+            matrix: 每行的几何变换矩阵 (K * n, 2, 3)（像素坐标系，以图像中心为原点；无几何变换时为None）
+        """
+        device = images.device
+        batch = images.repeat(self.num_samples, *([1] * (images.dim() - 1)))
+        rows = batch.size(0)
+        shape = (1,) * (batch.dim() - 1)
+
+        matrix = None
+        if self.geometric:
+            matrix = self._affine(rows, batch.size(-2), batch.size(-1), device)
+            grid = self._sampling_grid(matrix, batch.shape)
+            batch = F.grid_sample(batch, grid.to(batch.dtype), mode='bilinear', padding_mode='zeros',
+                                  align_corners=False)
+        if self.brightness:
+            batch = batch * self._uniform(rows, self.brightness, device).view(-1, *shape)
+        if batch.size(1) == 3 and (self.contrast or self.saturation):
+            weights = torch.tensor([0.299, 0.587, 0.114], device=device, dtype=batch.dtype).view(1, 3, 1, 1)
+            if self.contrast:
+                mean = (batch * weights).sum(dim=1, keepdim=True).mean(dim=(2, 3), keepdim=True)
+                factor = self._uniform(rows, self.contrast, device).view(-1, *shape)
+                batch = (batch - mean) * factor + mean
+            if self.saturation:
+                gray = (batch * weights).sum(dim=1, keepdim=True)
+                factor = self._uniform(rows, self.saturation, device).view(-1, *shape)
+                batch = (batch - gray) * factor + gray
+        if self.blur_kernel:
+            batch = self._blur(batch, device)
+        return batch.clamp(0, 1), matrix
+
+    def __call__(self, images):
+        return self.transform(images)[0]
+
+    def expand_labels(self, labels):
+        """与transform的展开顺序一致地复制分类标签"""
+        return labels.repeat(self.num_samples)
+
+    def expand_targets(self, targets, matrix, height, width):
+        """
+        按几何变换同步变换检测目标（与transform的展开顺序一致）
+        框的四个角点经正向变换后取外接矩形并截断到图像内，变换后过小的框连同其他逐框字段一起丢弃
+        Args:
+            targets: 检测目标（list[dict]，boxes为xyxy像素坐标）
+            matrix: transform返回的几何变换矩阵（为None时只复制目标）
+            height, width: 图像尺寸
+        Returns:
+            K * n 个检测目标
+        """
+        expanded = []
+        n = len(targets)
+        for row in range(self.num_samples * n):
+            target = targets[row % n]
+            if matrix is None or 'boxes' not in target or target['boxes'].numel() == 0:
+                expanded.append(dict(target))
+                continue
+            boxes = target['boxes']
+            x1, y1, x2, y2 = boxes.unbind(dim=1)
+            corners = torch.stack([torch.stack([x1, y1], 1), torch.stack([x2, y1], 1),
+                                   torch.stack([x1, y2], 1), torch.stack([x2, y2], 1)], dim=1)
+            center = torch.tensor([width / 2, height / 2], device=boxes.device, dtype=boxes.dtype)
+            m = matrix[row].to(boxes.device, boxes.dtype)
+            moved = (corners - center) @ m[:, :2].T + m[:, 2] + center
+            new_boxes = torch.cat([moved.min(dim=1)[0], moved.max(dim=1)[0]], dim=1)
+            new_boxes[:, 0::2] = new_boxes[:, 0::2].clamp(0, width)
+            new_boxes[:, 1::2] = new_boxes[:, 1::2].clamp(0, height)
+            keep = ((new_boxes[:, 2] - new_boxes[:, 0]) > 1) & ((new_boxes[:, 3] - new_boxes[:, 1]) > 1)
+            new_target = {}
+            for key, value in target.items():
+                if isinstance(value, torch.Tensor) and value.dim() > 0 and value.size(0) == boxes.size(0):
+                    value = value[keep]
+                new_target[key] = value
+            new_target['boxes'] = new_boxes[keep]
+            expanded.append(new_target)
+        return expanded
+
+
+def resolve_eot(eot):
+    """攻击参数约定：None或False不使用EOT，整数表示采样数，字典按EOTTransform参数创建，否则使用传入的采样器"""
+    if eot is None or eot is False:
+        return None
+    if isinstance(eot, bool):
+        return EOTTransform()
+    if isinstance(eot, int):
+        return EOTTransform(num_samples=eot)
+    if isinstance(eot, dict):
+        return EOTTransform(**eot)
+    return eot
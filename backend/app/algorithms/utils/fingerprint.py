@@ -0,0 +1,107 @@
+import hashlib
+import os
+import uuid
+import weakref
+from typing import Optional
+
+import torch
+
+# 模型 -> (参数版本签名, 指纹)，参数被原地修改后签名变化会触发重新计算
+_FINGERPRINTS = weakref.WeakKeyDictionary()
+# (模型文件绝对路径, 修改时间, 大小) -> 文件内容的SHA1
+_FILE_HASHES = {}
+# 没有稳定指纹的可调用对象 -> 进程内令牌（对象被回收时令牌随之失效，不会被新对象复用）
+_LOCAL_TOKENS = weakref.WeakKeyDictionary()
+
+# 进程内令牌的前缀，带该前缀的指纹不能写入跨进程共享的缓存
+LOCAL_PREFIX = 'local:'
+
+
+def _version_signature(model):
+    """参数与缓冲区的存储地址和版本号，用于廉价地判断权重是否变化"""
+    return tuple((t.data_ptr(), t._version) for t in list(model.parameters()) + list(model.buffers()))
+
+
+def _module_fingerprint(model):
+    signature = _version_signature(model)
+    cached = _FINGERPRINTS.get(model)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha1(type(model).__qualname__.encode())
+    for name, tensor in model.state_dict().items():
+        digest.update(name.encode())
+        digest.update(str(tuple(tensor.shape)).encode())
+        data = tensor.detach().cpu().contiguous()
+        if data.dtype == torch.bfloat16:
+            data = data.float()
+        digest.update(data.numpy().tobytes())
+    fingerprint = digest.hexdigest()
+    _FINGERPRINTS[model] = (signature, fingerprint)
+    return fingerprint
+
+
+def _file_fingerprint(path):
+    """模型文件内容的SHA1（按路径、修改时间和大小缓存，文件被替换后自动重新计算）"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    cached = _FILE_HASHES.get(key)
+    if cached is None:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        cached = _FILE_HASHES[key] = digest.hexdigest()
+    return cached
+
+
+def _session_fingerprint(session):
+    """onnxruntime.InferenceSession：按加载时的模型字节或模型文件内容计算"""
+    model_bytes = getattr(session, '_model_bytes', None)
+    if model_bytes:
+        return 'onnx:' + hashlib.sha1(bytes(model_bytes)).hexdigest()
+    model_path = getattr(session, '_model_path', None)
+    if isinstance(model_path, (str, os.PathLike)) and os.path.isfile(model_path):
+        return 'onnx:' + _file_fingerprint(model_path)
+    return None
+
+
+def model_fingerprint(model) -> Optional[str]:
+    """
+    计算模型的稳定指纹（只取决于模型内容，跨进程一致，可用于持久化缓存的键）
+    对象自带fingerprint属性时直接使用；nn.Module按参数和缓冲区内容计算SHA1（结果按模型缓存，权重变化时自动失效）；
+    onnxruntime会话按模型字节或模型文件内容计算；InferenceEngine按其包装的模型计算
+    Args:
+        model: 被攻击的模型
+    Returns:
+        指纹字符串；无法从内容确定指纹时（普通可调用对象、来源未知的会话等）返回None
+    """
+    if hasattr(model, 'fingerprint'):
+        return str(model.fingerprint)
+    if isinstance(model, torch.nn.Module):
+        return _module_fingerprint(model)
+    if hasattr(model, 'run') and hasattr(model, 'get_inputs'):
+        return _session_fingerprint(model)
+    framework = getattr(model, 'framework', None)
+    if isinstance(framework, str) and hasattr(model, 'model') and hasattr(model, 'predict'):
+        inner = model_fingerprint(model.model)
+        return f"{framework}:{inner}" if inner is not None else None
+    return None
+
+
+def local_fingerprint(model) -> Optional[str]:
+    """
+    进程内缓存使用的指纹：有稳定指纹时返回稳定指纹，否则返回绑定到对象生命周期的进程内令牌（带LOCAL_PREFIX前缀）
+    令牌不能写入跨进程共享的缓存；对象无法弱引用时返回None（不缓存）
+    """
+    fingerprint = model_fingerprint(model)
+    if fingerprint is not None:
+        return fingerprint
+    try:
+        token = _LOCAL_TOKENS.get(model)
+        if token is None:
+            token = _LOCAL_TOKENS[model] = LOCAL_PREFIX + uuid.uuid4().hex
+    except TypeError:
+        return None
+    return token
@@ -0,0 +1,139 @@
+import functools
+from contextlib import contextmanager
+
+import torch
+import torch.nn as nn
+
+
+def _collect_modules(objs):
+    """从参数中收集所有nn.Module（支持模型列表，便于集成攻击复用）"""
+    modules = []
+    for obj in objs:
+        if isinstance(obj, nn.Module):
+            modules.append(obj)
+        elif isinstance(obj, (list, tuple)):
+            modules.extend(m for m in obj if isinstance(m, nn.Module))
+    return modules
+
+
+@contextmanager
+def freeze_parameters(*models):
+    """
+    攻击执行期间冻结被攻击模型的参数
+    白盒攻击只需要输入的梯度，参数保持requires_grad=True时每一步反向传播都会额外计算并存储一整份权重梯度。
+    退出时恢复每个参数原有的requires_grad状态（支持嵌套调用）。
+    Args:
+        models: 一个或多个被攻击模型
+    """
+    saved = []
+    for model in _collect_modules(models):
+        for param in model.parameters():
+            saved.append((param, param.requires_grad))
+            param.requires_grad_(False)
+    try:
+        yield
+    finally:
+        for param, requires_grad in saved:
+            param.requires_grad_(requires_grad)
+
+
+def input_grad(loss, inputs, retain_graph=None):
+    """
+    只对输入求梯度
+    使用torch.autograd.grad代替loss.backward()，梯度不会累积到inputs.grad，也无需model.zero_grad()
+    Args:
+        loss: 标量损失
+        inputs: 需要求梯度的输入张量
+        retain_graph: 是否保留计算图
+    Returns:
+        grad: 与inputs同形状的梯度
+    """
+    return torch.autograd.grad(loss, inputs, retain_graph=retain_graph)[0]
+
+
+def input_only_gradients(func):
+    """
+    攻击执行包装器：自动冻结参数中出现的所有模型，攻击结束后恢复
+    适用于attack(self, model, ...)方法和xxx_attack(model, ...)函数
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with freeze_parameters(*args, *kwargs.values()):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _chunks(total, micro_batch):
+    step = micro_batch or total
+    return [slice(start, min(start + step, total)) for start in range(0, total, step)]
+
+
+def ensemble_loss_and_grad(models, inputs, labels, loss_fn, monitor, micro_batch=None, eot=None):
+    """
+    依次在每个模型上按微批次前向、反向，返回平均logits、平均损失和平均输入梯度
+    每个微批次反向后立即释放其计算图，峰值内存只取决于单个模型上一个微批次的激活；
+    微批次的损失按块大小加权，累加结果与整批平均损失（mean规约）的梯度一致；
+    启用EOT时每个微批次展开为K个随机视角做一次前向、反向，梯度即K个视角的平均梯度
+    Args:
+        models: 被攻击模型列表
+        inputs: 输入 (batch, ...)，不需要requires_grad
+        labels: 标签（目标攻击时为目标标签）
+        loss_fn: 损失函数
+        monitor: 攻击过程监控器（分段计时前向和反向）
+        micro_batch: 微批次大小（为None时整批计算）
+        eot: 期望变换采样器（EOTTransform，为None时不做变换）
+    Returns:
+        outputs: 平均logits（已detach；启用EOT时为K个视角的平均）
+        loss: 平均损失（已detach）
+        grad: 平均输入梯度，与inputs同形状
+    """
+    total = inputs.size(0)
+    chunks = _chunks(total, micro_batch)
+    outputs_sum = loss_sum = grad_sum = None
+    for m in models:
+        parts = []
+        model_loss = 0
+        grad = None if len(chunks) == 1 else torch.empty_like(inputs)
+        for chunk in chunks:
+            x = inputs[chunk].detach().requires_grad_(True)
+            with monitor.phase('forward'):
+                if eot is None:
+                    out = m(x)
+                    loss = loss_fn(out, labels[chunk])
+                else:
+                    out = m(eot(x))
+                    loss = loss_fn(out, eot.expand_labels(labels[chunk]))
+                    out = out.view(eot.num_samples, x.size(0), *out.shape[1:]).mean(dim=0)
+                if len(chunks) > 1:
+                    loss = loss * (x.size(0) / total)
+            with monitor.phase('backward'):
+                g = input_grad(loss, x)
+            if grad is None:
+                grad = g
+            else:
+                grad[chunk] = g
+            parts.append(out.detach())
+            model_loss = model_loss + loss.detach()
+        outputs = parts[0] if len(parts) == 1 else torch.cat(parts)
+        if grad_sum is None:
+            outputs_sum, loss_sum, grad_sum = outputs, model_loss, grad
+        else:
+            outputs_sum = outputs_sum + outputs
+            loss_sum = loss_sum + model_loss
+            grad_sum.add_(grad)
+    if len(models) > 1:
+        outputs_sum = outputs_sum / len(models)
+        loss_sum = loss_sum / len(models)
+        grad_sum.div_(len(models))
+    return outputs_sum, loss_sum, grad_sum
+
+
+@torch.no_grad()
+def ensemble_logits(models, inputs, micro_batch=None):
+    """各模型logits的平均（单模型时即模型输出），按微批次前向"""
+    outputs = None
+    for m in models:
+        parts = [m(inputs[chunk]) for chunk in _chunks(inputs.size(0), micro_batch)]
+        out = parts[0] if len(parts) == 1 else torch.cat(parts)
+        outputs = out if outputs is None else outputs + out
+    return outputs / len(models) if len(models) > 1 else outputs
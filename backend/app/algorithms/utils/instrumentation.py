@@ -0,0 +1,165 @@
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块
+    resource = None
+
+PHASES = ('forward', 'backward', 'update')
+
+
+def _to_float(value):
+    if isinstance(value, torch.Tensor):
+        value = value.detach()
+        return float(value.float().mean()) if value.numel() != 1 else float(value)
+    return None if value is None else float(value)
+
+
+class AttackMonitor:
+    """
+    攻击过程监控
+    攻击在每次迭代中用phase()分段计时前向、反向和投影/更新，用record()提交一条迭代记录；
+    记录写入定长环形缓冲区，损失和成功率以张量形式保存、读取时才转换为数值，
+    不会在迭代中强制GPU同步，开销足够小，可以常开
+    """
+
+    # 攻击据此跳过只为记录而构造的参数（如成功标记的拷贝、平均查询次数）
+    enabled = True
+
+    def __init__(self, capacity=1000, callbacks=None, sync_cuda=False):
+        """
+        Args:
+            capacity: 环形缓冲区保留的迭代记录数
+            callbacks: 回调函数列表，每提交一条记录调用一次 callback(record)（回调中读取数值会触发同步）
+            sync_cuda: 计时前后是否同步CUDA（为False时GPU上的计时只反映内核提交时间）
+        """
+        self.buffer = deque(maxlen=capacity)
+        self.callbacks = list(callbacks or [])
+        self.sync_cuda = sync_cuda and torch.cuda.is_available()
+        self.attack_name = None
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.iterations = 0
+        self._pending = dict.fromkeys(PHASES, 0.0)
+        self._started = None
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def start(self, attack_name):
+        """开始一次攻击（清空上一次攻击的记录）"""
+        self.attack_name = attack_name
+        self.buffer.clear()
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self._pending = dict.fromkeys(PHASES, 0.0)
+        self.iterations = 0
+        self._started = time.perf_counter()
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+
+    @contextmanager
+    def phase(self, name):
+        """对一个阶段（forward / backward / update）计时，同一迭代内多次进入时累加"""
+        if self.sync_cuda:
+            torch.cuda.synchronize()
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.sync_cuda:
+                torch.cuda.synchronize()
+            self._pending[name] = self._pending.get(name, 0.0) + time.perf_counter() - begin
+
+    @staticmethod
+    def _peak_memory():
+        peak = {}
+        if torch.cuda.is_available():
+            peak['peak_cuda_mb'] = torch.cuda.max_memory_allocated() / 1024 ** 2
+        if resource is not None:
+            peak['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak
+
+    def record(self, iteration, loss=None, success=None, **extra):
+        """
+        提交一条迭代记录
+        Args:
+            iteration: 迭代序号
+            loss: 本次迭代的损失（张量或数值）
+            success: 逐样本成功标记（布尔张量）或成功率
+            extra: 其他需要记录的字段（如活跃样本数、查询次数）
+        """
+        record = {'attack': self.attack_name, 'iteration': iteration, 'loss': loss, 'success': success}
+        record.update({f"{name}_time": elapsed for name, elapsed in self._pending.items()})
+        record.update(self._peak_memory())
+        record.update(extra)
+        for name, elapsed in self._pending.items():
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed
+        self._pending = dict.fromkeys(PHASES, 0.0)
+        self.iterations += 1
+        self.buffer.append(record)
+        for callback in self.callbacks:
+            callback(self._materialize(record))
+
+    @staticmethod
+    def _materialize(record):
+        record = dict(record)
+        record['loss'] = _to_float(record['loss'])
+        record['success_rate'] = _to_float(record.pop('success'))
+        return record
+
+    def records(self):
+        """环形缓冲区中的迭代记录（损失和成功率转换为数值）"""
+        return [self._materialize(record) for record in self.buffer]
+
+    def summary(self, saturation_tolerance=0.01):
+        """
+        汇总统计
+        Args:
+            saturation_tolerance: 成功率距最终值不超过该容差的第一次迭代记为饱和点
+        Returns:
+            各阶段总耗时、迭代次数、最终成功率、成功率饱和的迭代、峰值内存
+        """
+        records = self.records()
+        rates = [(r['iteration'], r['success_rate']) for r in records if r['success_rate'] is not None]
+        final_rate = rates[-1][1] if rates else None
+        saturated_at = None
+        if rates:
+            saturated_at = next(it for it, rate in rates if rate >= final_rate - saturation_tolerance)
+        total = time.perf_counter() - self._started if self._started is not None else 0.0
+        summary = {
+            'attack': self.attack_name,
+            'iterations': self.iterations,
+            'total_time': total,
+            'final_success_rate': final_rate,
+            'saturated_at': saturated_at
+        }
+        summary.update({f"{name}_time": elapsed for name, elapsed in self.totals.items()})
+        summary.update(self._peak_memory())
+        return summary
+
+
+class _NullMonitor:
+    """未启用监控时使用的空实现，所有调用都是空操作"""
+
+    _context = nullcontext()
+    enabled = False
+
+    def phase(self, name):
+        return self._context
+
+    def start(self, attack_name):
+        pass
+
+    def record(self, iteration, loss=None, success=None, **extra):
+        pass
+
+
+NULL_MONITOR = _NullMonitor()
+
+
+def resolve_monitor(monitor):
+    """攻击参数约定：monitor为None时不做任何记录"""
+    return NULL_MONITOR if monitor is None else monitor
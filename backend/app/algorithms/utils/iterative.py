@@ -0,0 +1,280 @@
+import functools
+
+import torch
+import torch.nn as nn
+
+from app.algorithms.utils.compiled import compiled_forward, compiled_kernel, kernel_key
+from app.algorithms.utils.early_stop import BestAdversarialTracker
+from app.algorithms.utils.eot import resolve_eot
+from app.algorithms.utils.gradient_mode import ensemble_logits, ensemble_loss_and_grad, input_only_gradients
+from app.algorithms.utils.instrumentation import resolve_monitor
+from app.algorithms.utils.memory import resolve_memory_plan
+
+
+def functional_update(norm, epsilon, alpha, x, delta, grad):
+    """IterativeAttack._step、_project和盒约束的函数式版本（L∞、L2），返回新的delta（供torch.compile融合为单个内核）"""
+    shape = (-1,) + (1,) * (delta.dim() - 1)
+    if norm == 'linf':
+        delta = (delta + alpha * grad.sign()).clamp(-epsilon, epsilon)
+    else:
+        grad_norms = grad.flatten(1).norm(p=2, dim=1).view(shape)
+        delta = delta + alpha * grad / (grad_norms + 1e-12)
+        norms = delta.flatten(1).norm(p=2, dim=1)
+        delta = delta * (epsilon / (norms + 1e-12)).clamp(max=1.0).view(shape)
+    return (x + delta).clamp(0, 1) - x
+
+
+class IterativeAttack:
+    """
+    迭代式梯度攻击引擎（PGD、BIM及其L2/L1变体共用）
+    扰动和步进方向缓冲区在攻击开始时一次性分配，之后每步都在no_grad下原地更新；
+    支持linf（符号梯度）、l2（归一化梯度）和l1（稀疏符号梯度）范数约束，
+    model传入模型列表时使用各模型的平均梯度执行集成攻击。可选功能见__init__的参数说明
+    """
+
+    NORMS = ('linf', 'l2', 'l1')
+
+    def __init__(self, norm='linf', epsilon=0.3, alpha=0.01, iters=40, random_start=True,
+                 loss_fn=None, early_stop=False, restarts=1, l1_sparsity=0.99, monitor=None, targeted=False,
+                 memory=None, compile_step=False, eot=None):
+        """
+        Args:
+            norm: 范数约束类型 ('linf', 'l2', 'l1')
+            epsilon: 扰动上限
+            alpha: 每步步长（步进方向的范数与约束范数一致）
+            iters: 迭代次数
+            random_start: 是否在约束球内随机初始化（为False时第一次重启从原图出发）
+            loss_fn: 损失函数
+            early_stop: 是否逐样本早停（已攻击成功的样本不再参与后续迭代）
+            restarts: 随机重启次数（作为额外的批次维度一起计算，大于1时自动启用逐样本跟踪）
+            l1_sparsity: L1步进时不更新的像素比例
+            monitor: 攻击过程监控器（AttackMonitor，为None时不记录）
+            targeted: 是否为目标攻击（沿损失下降方向步进，使预测变为target_labels）
+            memory: 内存受限模式（MemoryPlan或其参数字典，为None时读取config.yml，为False时关闭）
+            compile_step: 是否用torch.compile编译攻击步进（PyTorch 2.0以下或编译失败时使用eager）
+            eot: 期望变换（EOTTransform、其参数字典或采样数K，为None时只优化原始视角）；
+                 变换只用于求梯度，攻击成功、早停和最优样本都按未变换的对抗样本判断
+        """
+        if norm not in self.NORMS:
+            raise ValueError(f"不支持的范数类型: {norm}")
+        self.norm = norm
+        self.epsilon = epsilon
+        self.alpha = alpha
+        self.iters = iters
+        self.random_start = random_start
+        self.loss_fn = loss_fn if loss_fn is not None else nn.CrossEntropyLoss()
+        self.early_stop = early_stop
+        self.restarts = restarts
+        self.l1_sparsity = l1_sparsity
+        self.monitor = monitor
+        self.targeted = targeted
+        self.memory = memory
+        self.compile_step = compile_step
+        self.eot = eot
+
+    @input_only_gradients
+    def attack(self, model, images, labels, target_labels=None):
+        """
+        执行迭代攻击
+        Args:
+            model: 被攻击的模型（或集成攻击的源模型列表）
+            images: 输入图片 (batch, C, H, W)
+            labels: 正确标签
+            target_labels: 目标标签（目标攻击时使用）
+        Returns:
+            adv_images: 对抗样本
+        """
+        adv_images, _ = self.run(model, images, labels, target_labels)
+        return adv_images
+
+    @input_only_gradients
+    def run(self, model, images, labels, target_labels=None):
+        """
+        执行迭代攻击并返回逐样本攻击结果
+        Returns:
+            adv_images: 对抗样本
+            success: 每个样本是否攻击成功（仅在启用逐样本跟踪时返回，否则为None）
+        """
+        if self.targeted:
+            if target_labels is None:
+                raise ValueError("目标攻击需要提供target_labels")
+            # 目标攻击时损失和成功判定都针对目标标签
+            labels = target_labels.to(images.device)
+        models = list(model) if isinstance(model, (list, tuple)) else [model]
+        plan = resolve_memory_plan(self.memory)
+        eot = resolve_eot(self.eot)
+        if plan is None:
+            return self._iterate(models, images, labels, eot=eot)
+        with plan.checkpointing(models):
+            ori = images.detach().repeat(self.restarts, *([1] * (images.dim() - 1)))
+            micro_batch = plan.micro_batch(models, ori, labels.repeat(self.restarts), self.loss_fn)
+            if eot is not None:
+                # EOT把每个微批次展开为K倍，按展开后的批次控制内存
+                micro_batch = max(1, micro_batch // eot.num_samples)
+            return self._iterate(models, images, labels, micro_batch, eot)
+
+    def _iterate(self, models, images, labels, micro_batch=None, eot=None):
+        """迭代主循环（micro_batch为None时整批前向、反向；eot为None时不做变换）"""
+        batch_size = images.size(0)
+        sample_shape = images.shape[1:]
+        restarts = self.restarts
+        tracked = self.early_stop or restarts > 1
+
+        # 一次性分配的缓冲区，按 (restarts, batch) 分块排列；样本被淘汰时压缩到前缀
+        ori = images.detach().repeat(restarts, *([1] * len(sample_shape)))
+        delta = torch.zeros_like(ori)
+        adv = torch.empty_like(ori)
+        direction = torch.empty_like(ori)
+        self._init_delta(delta, ori, batch_size)
+
+        if self.compile_step:
+            forwards = [compiled_forward(m, ori) for m in models]
+            update = self._compiled_update(models, ori)
+        else:
+            forwards, update = models, None
+
+        tracker = BestAdversarialTracker(images, targeted=self.targeted) if tracked else None
+        monitor = resolve_monitor(self.monitor)
+        monitor.start(type(self).__name__)
+        sample_idx = torch.arange(batch_size, device=images.device)
+        active_labels = labels
+        n = batch_size
+
+        for i in range(self.iters + 1):
+            total = restarts * n
+            x, d, a, g = ori[:total], delta[:total], adv[:total], direction[:total]
+            with torch.no_grad():
+                torch.add(x, d, out=a)
+
+            if i == self.iters:
+                # 最后一次前向只用于检查最终对抗样本
+                if tracked:
+                    with torch.no_grad():
+                        with monitor.phase('forward'):
+                            outputs = ensemble_logits(models, a, micro_batch)
+                        tracker.update(sample_idx, a, outputs, active_labels)
+                    if self.monitor is not None:
+                        monitor.record(i, success=tracker.success.clone(), active=n)
+                break
+
+            outputs, loss, grad = ensemble_loss_and_grad(forwards, a, active_labels.repeat(restarts), self.loss_fn,
+                                                         monitor, micro_batch, eot)
+            if self.targeted:
+                grad.neg_()
+            if eot is not None and (tracked or self.monitor is not None):
+                # EOT返回的是K个视角的平均logits，成功判定改用未变换的对抗样本的前向
+                with torch.no_grad():
+                    with monitor.phase('forward'):
+                        outputs = ensemble_logits(models, a, micro_batch)
+
+            with monitor.phase('update'):
+                done = tracker.update(sample_idx, a, outputs, active_labels) if tracked else None
+                if not (tracked and done.all()):
+                    with torch.no_grad():
+                        if update is not None:
+                            d.copy_(update(x, d, grad))
+                        else:
+                            self._step(d, grad, g)
+                            self._project(d)
+                            # 盒约束：保证 x + delta 落在[0, 1]内
+                            d.add_(x).clamp_(0, 1).sub_(x)
+            if self.monitor is not None:
+                if tracked:
+                    success = tracker.success.clone()
+                else:
+                    pred = outputs.detach().argmax(dim=1)
+                    target = active_labels.repeat(restarts)
+                    success = pred == target if self.targeted else pred != target
+                monitor.record(i, loss=loss, success=success, active=n)
+            if tracked and done.all():
+                break
+
+            if tracked and done.any():
+                keep = ~done
+                new_n = int(keep.sum())
+                for buf in (ori, delta):
+                    compacted = buf[:total].view(restarts, n, *sample_shape)[:, keep]
+                    buf[:restarts * new_n].view(restarts, new_n, *sample_shape).copy_(compacted)
+                sample_idx = sample_idx[keep]
+                active_labels = active_labels[keep]
+                n = new_n
+
+        if tracked:
+            return tracker.best_adv, tracker.success
+        return adv[:batch_size].clamp_(0, 1).detach(), None
+
+    def _compiled_update(self, models, ori):
+        """步进、投影和盒约束的编译内核（L1步进含数据相关的排序和掩码索引，保持eager原地实现）"""
+        if self.norm == 'l1':
+            return None
+        # 攻击配置在本次攻击开始时绑定为参数，共享内核不持有攻击器实例
+        config = (self.norm, self.epsilon, self.alpha)
+        key = kernel_key(models, ori.shape[1:], ori.dtype, ori.device, ('update',) + config)
+        return functools.partial(compiled_kernel(functional_update, key), *config)
+
+    def _init_delta(self, delta, ori, batch_size):
+        """在约束球内随机初始化扰动（原地写入delta）"""
+        if self.norm == 'linf':
+            delta.uniform_(-self.epsilon, self.epsilon)
+        else:
+            delta.normal_()
+            norms = self._flat_norm(delta)
+            radius = torch.rand_like(norms) * self.epsilon
+            delta.mul_((radius / (norms + 1e-12)).view(-1, *([1] * (delta.dim() - 1))))
+        if not self.random_start:
+            # BIM语义：第一次重启从原图出发
+            delta[:batch_size].zero_()
+        delta.add_(ori).clamp_(0, 1).sub_(ori)
+
+    def _flat_norm(self, t):
+        """逐样本计算与约束一致的范数"""
+        flat = t.view(t.size(0), -1)
+        if self.norm == 'l2':
+            return flat.norm(p=2, dim=1)
+        if self.norm == 'l1':
+            return flat.norm(p=1, dim=1)
+        return flat.abs().max(dim=1)[0]
+
+    def _step(self, delta, grad, direction):
+        """沿梯度方向原地更新delta，direction为预分配的步进方向缓冲区"""
+        shape = (-1,) + (1,) * (delta.dim() - 1)
+        if self.norm == 'linf':
+            torch.sign(grad, out=direction)
+        elif self.norm == 'l2':
+            norms = grad.view(grad.size(0), -1).norm(p=2, dim=1)
+            torch.div(grad, (norms + 1e-12).view(shape), out=direction)
+        else:
+            flat_abs = torch.abs(grad, out=direction).view(grad.size(0), -1)
+            k = max(1, int(round(flat_abs.size(1) * self.l1_sparsity)))
+            k = min(k, flat_abs.size(1))
+            threshold = flat_abs.kthvalue(k, dim=1)[0]
+            direction.ge_(threshold.view(shape)).mul_(grad.sign_())
+            counts = direction.view(grad.size(0), -1).abs().sum(dim=1)
+            direction.div_((counts + 1e-12).view(shape))
+        delta.add_(direction, alpha=self.alpha)
+
+    def _project(self, delta):
+        """原地投影回约束球"""
+        shape = (-1,) + (1,) * (delta.dim() - 1)
+        if self.norm == 'linf':
+            delta.clamp_(-self.epsilon, self.epsilon)
+        elif self.norm == 'l2':
+            norms = delta.view(delta.size(0), -1).norm(p=2, dim=1)
+            factor = (self.epsilon / (norms + 1e-12)).clamp_(max=1.0)
+            delta.mul_(factor.view(shape))
+        else:
+            flat = delta.view(delta.size(0), -1)
+            norms = flat.abs().sum(dim=1)
+            exceeds = norms > self.epsilon
+            if not exceeds.any():
+                return
+            # Duchi等人的L1球精确投影：只对超出约束的样本求阈值theta
+            sub = flat[exceeds]
+            mags = sub.abs()
+            sorted_mags = mags.sort(dim=1, descending=True)[0]
+            cssv = sorted_mags.cumsum(dim=1) - self.epsilon
+            ind = torch.arange(1, sub.size(1) + 1, device=delta.device, dtype=delta.dtype)
+            cond = (sorted_mags - cssv / ind) > 0
+            rho = (cond.sum(dim=1) - 1).clamp_(min=0)
+            theta = cssv.gather(1, rho.unsqueeze(1)) / (rho + 1).to(delta.dtype).unsqueeze(1)
+            flat[exceeds] = sub.sign() * (mags - theta).clamp_(min=0)
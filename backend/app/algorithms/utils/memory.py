@@ -0,0 +1,182 @@
+import math
+from contextlib import contextmanager, nullcontext
+
+import torch
+import torch.nn as nn
+import torch.utils.checkpoint
+
+from app.algorithms.utils.gradient_mode import _collect_modules
+from app.algorithms.utils.registry import coerce_value, load_config
+
+
+def _outermost_sequentials(model):
+    """模型中不被其他nn.Sequential包含的顺序块（如ResNet的layer1~layer4、VGG的features）"""
+    blocks = []
+    prefixes = []
+    for name, module in model.named_modules():
+        if any(name.startswith(prefix) for prefix in prefixes):
+            continue
+        if isinstance(module, nn.Sequential) and len(module) > 1:
+            blocks.append(module)
+            prefixes.append(f"{name}." if name else '')
+    return blocks
+
+
+def _checkpointed_forward(block, segments):
+    """把顺序块切分为segments段，除最后一段外只保存段的输入，反向时重新计算段内激活"""
+    children = list(block)
+    size = math.ceil(len(children) / segments)
+    parts = [children[i:i + size] for i in range(0, len(children), size)]
+
+    def run_part(modules):
+        def run(x):
+            for module in modules:
+                x = module(x)
+            return x
+        return run
+
+    runners = [run_part(part) for part in parts]
+
+    def forward(x):
+        # 不需要梯度时（最终检查、推理）直接前向，不做重计算
+        if not (torch.is_grad_enabled() and x.requires_grad):
+            for runner in runners:
+                x = runner(x)
+            return x
+        for runner in runners[:-1]:
+            x = torch.utils.checkpoint.checkpoint(runner, x, use_reentrant=False)
+        return runners[-1](x)
+
+    return forward
+
+
+@contextmanager
+def checkpoint_sequential_blocks(*models, segments=None):
+    """
+    攻击执行期间对被攻击模型的顺序块启用激活检查点，退出时恢复原有的forward
+    检查点用重计算换内存：前向时只保存每段的输入，反向时逐段重新前向
+    Args:
+        models: 一个或多个被攻击模型
+        segments: 每个顺序块切分的段数（为None时取块长度的平方根）
+    """
+    patched = []
+    for model in _collect_modules(models):
+        for block in _outermost_sequentials(model):
+            n = segments or max(2, round(math.sqrt(len(block))))
+            patched.append((block, block.__dict__.get('forward')))
+            block.forward = _checkpointed_forward(block, min(n, len(block)))
+    try:
+        yield
+    finally:
+        for block, saved in reversed(patched):
+            if saved is None:
+                del block.forward
+            else:
+                block.forward = saved
+
+
+def _saved_activation_bytes(model, inputs, labels, loss_fn):
+    """一次前向为反向传播保存的张量字节数（不执行反向）"""
+    total = [0]
+
+    def pack(tensor):
+        total[0] += tensor.numel() * tensor.element_size()
+        return tensor
+
+    x = inputs.detach().requires_grad_(True)
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor):
+        loss = loss_fn(model(x), labels)
+    del loss
+    return total[0]
+
+
+class MemoryPlan:
+    """
+    梯度攻击的内存受限模式
+    攻击批次按微批次切分，逐块前向、反向后立即释放计算图并累加输入梯度，
+    峰值内存只取决于微批次大小而不是攻击批次大小；可选地对被攻击模型的顺序块启用激活检查点，
+    进一步降低每个样本保存的激活。
+    微批次大小未指定时按内存预算自动选择：用1个和2个样本各前向一次，统计为反向保存的张量字节数，
+    两者之差即每个样本的激活开销（与样本数无关的部分如卷积权重不计入逐样本开销）
+    """
+
+    def __init__(self, micro_batch_size=None, budget_mb=2048, checkpoint=False, checkpoint_segments=None):
+        """
+        Args:
+            micro_batch_size: 微批次大小（为None时按budget_mb自动选择）
+            budget_mb: 单次前向、反向允许保存的激活内存（MB）
+            checkpoint: 是否对被攻击模型的顺序块启用激活检查点
+            checkpoint_segments: 每个顺序块切分的段数（为None时取块长度的平方根）
+        """
+        if micro_batch_size is not None and int(micro_batch_size) < 1:
+            raise ValueError("微批次大小必须为正整数")
+        self.micro_batch_size = int(micro_batch_size) if micro_batch_size is not None else None
+        self.budget_mb = float(budget_mb)
+        self.checkpoint = checkpoint
+        self.checkpoint_segments = checkpoint_segments
+
+    def checkpointing(self, models):
+        """按配置启用激活检查点的上下文"""
+        if not self.checkpoint:
+            return nullcontext()
+        return checkpoint_sequential_blocks(models, segments=self.checkpoint_segments)
+
+    def estimate_bytes_per_sample(self, models, images, labels, loss_fn):
+        """
+        估计每个样本的激活开销和与样本数无关的固定开销（集成攻击时取各模型的最大值）
+        需要在checkpointing上下文内调用，估计结果才反映检查点的效果
+        Returns:
+            (per_sample, fixed): 字节数
+        """
+        per_sample = fixed = 0
+        for model in models:
+            one = _saved_activation_bytes(model, images[:1], labels[:1], loss_fn)
+            two = _saved_activation_bytes(model, images[:2], labels[:2], loss_fn)
+            per_sample = max(per_sample, two - one)
+            fixed = max(fixed, one - (two - one))
+        return per_sample, fixed
+
+    def micro_batch(self, models, images, labels, loss_fn):
+        """
+        本次攻击使用的微批次大小
+        Args:
+            models: 被攻击模型列表
+            images: 攻击批次（含重启维度）
+            labels: 对应的标签
+            loss_fn: 攻击使用的损失函数
+        Returns:
+            微批次大小（不小于1，不超过批次大小）
+        """
+        total = images.size(0)
+        if self.micro_batch_size is not None:
+            return min(self.micro_batch_size, total)
+        if total < 2:
+            return total
+        per_sample, fixed = self.estimate_bytes_per_sample(models, images, labels, loss_fn)
+        if per_sample <= 0:
+            return total
+        budget = self.budget_mb * 1024 ** 2 - fixed
+        return max(1, min(total, int(budget // per_sample)))
+
+
+def default_memory_plan():
+    """按config.yml中的attack_memory配置创建内存受限模式（未启用时返回None）"""
+    config = load_config().get('attack_memory') or {}
+    if not config.get('enabled', False):
+        return None
+    micro_batch_size = config.get('micro_batch_size')
+    return MemoryPlan(micro_batch_size=int(coerce_value(micro_batch_size)) if micro_batch_size is not None else None,
+                      budget_mb=coerce_value(config.get('budget_mb', 2048)),
+                      checkpoint=config.get('checkpoint', False),
+                      checkpoint_segments=config.get('checkpoint_segments'))
+
+
+def resolve_memory_plan(memory):
+    """攻击参数约定：None使用config.yml配置，False关闭内存受限模式，字典按MemoryPlan参数创建，否则使用传入的配置"""
+    if memory is None:
+        return default_memory_plan()
+    if memory is False:
+        return None
+    if isinstance(memory, dict):
+        return MemoryPlan(**memory)
+    return memory
@@ -0,0 +1,228 @@
+import importlib
+import inspect
+import os
+import pkgutil
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from app.algorithms.utils.adv_cache import AdversarialCache
+from app.algorithms.utils.attack_base import AttackBase
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'config.yml')
+# backend目录，config.yml中的相对路径都相对于该目录解析（与工作目录无关）
+PROJECT_ROOT = os.path.dirname(os.path.dirname(CONFIG_PATH))
+ATTACKS_PACKAGE = 'app.algorithms.attacks'
+
+# 注册名 -> 攻击实现（带attack(model, inputs, labels)方法的类，或 xxx_attack(model, inputs, labels, ...) 函数）
+_REGISTRY: Dict[str, Any] = {}
+
+
+def register_attack(name: str, target):
+    """
+    注册攻击算法
+    Args:
+        name: 注册名（与config.yml中attack_algorithms的键一致时自动读取默认参数）
+        target: 攻击类或攻击函数
+    Returns:
+        target（便于作为装饰器使用）
+    """
+    _REGISTRY[name] = target
+    return target
+
+
+def coerce_value(value):
+    """YAML会把1e-4等写法解析为字符串，这里统一转换为数值"""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+@lru_cache(maxsize=None)
+def load_config(path: str = CONFIG_PATH) -> Dict[str, Any]:
+    """读取整个config.yml（只读取一次）"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+
+@lru_cache(maxsize=None)
+def load_attack_config(path: str = CONFIG_PATH) -> Dict[str, Dict[str, Any]]:
+    """读取config.yml中的attack_algorithms配置（只读取一次）"""
+    attacks = load_config(path).get('attack_algorithms') or {}
+    return {name: {k: coerce_value(v) for k, v in (params or {}).items()} for name, params in attacks.items()}
+
+
+_DEFAULT_CACHE = None
+
+
+def default_adversarial_cache() -> Optional[AdversarialCache]:
+    """按config.yml中的adversarial_cache配置创建进程内共享的对抗样本缓存（未启用时返回None）"""
+    global _DEFAULT_CACHE
+    config = load_config().get('adversarial_cache') or {}
+    if not config.get('enabled', False):
+        return None
+    if _DEFAULT_CACHE is None:
+        cache_dir = config.get('dir', './data/adversarial_cache')
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.normpath(os.path.join(PROJECT_ROOT, cache_dir))
+        max_bytes = int(coerce_value(config.get('max_size_mb', 2048)) * 1024 ** 2)
+        _DEFAULT_CACHE = AdversarialCache(cache_dir, max_bytes=max_bytes)
+    return _DEFAULT_CACHE
+
+
+def resolve_adversarial_cache(cache) -> Optional[AdversarialCache]:
+    """缓存参数约定：None使用config.yml配置的共享缓存，False禁用缓存，否则使用传入的缓存"""
+    if cache is None:
+        return default_adversarial_cache()
+    if cache is False:
+        return None
+    return cache
+
+
+_discovered = False
+
+
+def discover_attacks():
+    """导入attacks包下的所有模块，各模块在导入时完成注册（只执行一次）"""
+    global _discovered
+    if _discovered:
+        return
+    package = importlib.import_module(ATTACKS_PACKAGE)
+    for module_info in pkgutil.iter_modules(package.__path__):
+        importlib.import_module(f"{ATTACKS_PACKAGE}.{module_info.name}")
+    _discovered = True
+
+
+def available_attacks() -> List[str]:
+    """列出所有已注册的攻击"""
+    discover_attacks()
+    return sorted(_REGISTRY)
+
+
+def _accepted_params(target):
+    """
+    攻击实现能接收的命名参数（不含model/inputs/labels/target_labels）
+    Returns:
+        names: 命名参数列表
+        var_keyword: 是否还通过**kwargs接收其他参数
+    """
+    func = target.__init__ if inspect.isclass(target) else target
+    names = []
+    var_keyword = False
+    for i, (name, param) in enumerate(inspect.signature(func).parameters.items()):
+        if param.kind == param.VAR_KEYWORD:
+            var_keyword = True
+            continue
+        if param.kind == param.VAR_POSITIONAL or name == 'target_labels':
+            continue
+        if inspect.isclass(target) and i == 0:
+            continue
+        if not inspect.isclass(target) and i < 3:
+            continue
+        names.append(name)
+    return names, var_keyword
+
+
+def _accepts_target_labels(target) -> bool:
+    """攻击实现（类的attack方法或攻击函数）是否接收target_labels"""
+    func = target.attack if inspect.isclass(target) else target
+    parameters = inspect.signature(func).parameters
+    return 'target_labels' in parameters
+
+
+def _hashable(params):
+    """攻击器缓存键（参数不可哈希时返回None，不缓存）"""
+    key = tuple(sorted(params.items()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class RegisteredAttack(AttackBase):
+    """
+    把已有攻击类/函数适配为AttackBase统一接口
+    参数优先级：调用时参数 > 创建时参数 > config.yml默认值；config.yml中实现不接受的键（如description）会被忽略，
+    实现带**kwargs时调用方显式传入的其他参数原样透传；
+    攻击类按参数缓存构造好的攻击器，流式生成时各块复用同一个实例（如TextFooler的同义词索引只加载一次）；
+    启用对抗样本缓存时，相同模型、参数、输入和目标标签的结果直接从缓存读取
+    """
+
+    def __init__(self, name, target, model, adv_cache=None, **params):
+        defaults = load_attack_config().get(name, {})
+        accepted, var_keyword = _accepted_params(target)
+        merged = {k: v for k, v in defaults.items() if k in accepted}
+        merged.update(self._filter(params, accepted, var_keyword))
+        super().__init__(model, **merged)
+        self.name = name
+        self.target = target
+        self.accepted = accepted
+        self.var_keyword = var_keyword
+        self.accepts_target_labels = _accepts_target_labels(target)
+        self.adv_cache = resolve_adversarial_cache(adv_cache)
+        self._attackers = {}
+
+    @staticmethod
+    def _filter(params, accepted, var_keyword):
+        return {k: v for k, v in params.items() if var_keyword or k in accepted}
+
+    def _attacker(self, params):
+        """按参数缓存的攻击器实例（参数不可哈希时每次新建）"""
+        key = _hashable(params)
+        if key is None:
+            return self.target(**params)
+        attacker = self._attackers.get(key)
+        if attacker is None:
+            attacker = self._attackers[key] = self.target(**params)
+        return attacker
+
+    def _run(self, inputs, labels, params, target_labels=None):
+        extra = {'target_labels': target_labels} if target_labels is not None else {}
+        if inspect.isclass(self.target):
+            return self._attacker(params).attack(self.model, inputs, labels, **extra)
+        return self.target(self.model, inputs, labels, **params, **extra)
+
+    def generate(self, inputs, labels, target_labels=None, **kwargs):
+        """
+        生成对抗样本
+        Args:
+            inputs: 输入批次
+            labels: 标签
+            target_labels: 目标标签（提供时执行目标攻击，实现带targeted参数时自动设为True）
+            kwargs: 覆盖创建时参数的攻击参数
+        """
+        params = {**self.params, **self._filter(kwargs, self.accepted, self.var_keyword)}
+        if target_labels is not None:
+            if not self.accepts_target_labels:
+                raise ValueError(f"攻击算法{self.name}不支持目标攻击（target_labels）")
+            if 'targeted' in self.accepted:
+                params['targeted'] = True
+        if self.adv_cache is None:
+            return self._run(inputs, labels, params, target_labels)
+        key_params = {**params, 'target_labels': target_labels} if target_labels is not None else params
+        return self.adv_cache.get_or_generate(self.model, self.name, key_params, inputs, labels,
+                                              lambda: self._run(inputs, labels, params, target_labels))
+
+
+def create_attack(name: str, model, adv_cache=None, **params) -> AttackBase:
+    """
+    按注册名创建攻击
+    Args:
+        name: 注册名（如 'FGSM'、'PGD'、'C&W'）
+        model: 被攻击的模型
+        adv_cache: 对抗样本缓存（None使用config.yml配置的共享缓存，False禁用）
+        params: 覆盖默认值的攻击参数
+    Returns:
+        AttackBase实例
+    """
+    discover_attacks()
+    if name not in _REGISTRY:
+        raise ValueError(f"未注册的攻击算法: {name}")
+    return RegisteredAttack(name, _REGISTRY[name], model, adv_cache=adv_cache, **params)
@@ -0,0 +1,74 @@
+import numpy as np
+import torch
+
+from app.models.inference.inference_engine import InferenceEngine
+
+
+def as_inference_engine(model):
+    """
+    把被攻击模型统一为InferenceEngine
+    支持已有的InferenceEngine、ModelManager加载的onnxruntime.InferenceSession以及PyTorch模型
+    """
+    if isinstance(model, InferenceEngine):
+        return model
+    if isinstance(model, torch.nn.Module):
+        device = next((p.device for p in model.parameters()), torch.device('cpu'))
+        return InferenceEngine(model, device=device, framework='pytorch')
+    if hasattr(model, 'run') and hasattr(model, 'get_inputs'):
+        return InferenceEngine(model, framework='onnx')
+    raise ValueError(f"不支持的黑盒模型类型: {type(model).__name__}")
+
+
+class ScoreOracle:
+    """
+    基于分数的黑盒查询接口
+    只通过InferenceEngine.predict获取概率分布；每次调用把所有样本的全部候选打包成批次查询，
+    并逐样本累计查询次数，供黑盒攻击执行查询预算
+    """
+
+    def __init__(self, model, num_samples, batch_size=256, max_queries=10000):
+        """
+        Args:
+            model: 被攻击的模型（InferenceEngine、onnxruntime.InferenceSession或PyTorch模型）
+            num_samples: 样本数
+            batch_size: 每次推理调用的最大候选数
+            max_queries: 每个样本的查询预算
+        """
+        self.engine = as_inference_engine(model)
+        self.batch_size = batch_size
+        self.max_queries = max_queries
+        self.queries = torch.zeros(num_samples, dtype=torch.long)
+
+    def probabilities(self, candidates, owners):
+        """
+        查询一批候选
+        Args:
+            candidates: 候选输入 (m, C, H, W)，位于CPU
+            owners: 每个候选所属的样本下标 (m,)
+        Returns:
+            probs: 概率分布 (m, num_classes)
+        """
+        inputs = candidates.float().contiguous()
+        if self.engine.framework == 'onnx':
+            inputs = inputs.numpy().astype(np.float32)
+        output = self.engine.predict(inputs, batch_size=self.batch_size, return_probabilities=True)
+        self.queries.index_add_(0, owners, torch.ones_like(owners))
+        return torch.as_tensor(np.asarray(output['probabilities']), dtype=torch.float32)
+
+    def remaining(self, idx):
+        """指定样本剩余的查询次数"""
+        return self.max_queries - self.queries[idx]
+
+
+def margin_loss(probs, labels, targeted=False):
+    """
+    对数概率间隔（等价于logits间隔）：正值表示仍被正确分类（目标攻击时表示尚未达到目标类）
+    Args:
+        probs: 概率分布 (m, num_classes)
+        labels: 真实标签（目标攻击时为目标类别）
+        targeted: 是否为目标攻击
+    """
+    log_probs = probs.clamp_min(1e-12).log()
+    label_log = log_probs.gather(1, labels.unsqueeze(1)).squeeze(1)
+    others = log_probs.scatter(1, labels.unsqueeze(1), float('-inf')).max(dim=1)[0]
+    return others - label_log if targeted else label_log - others
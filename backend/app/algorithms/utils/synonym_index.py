@@ -0,0 +1,141 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+
+
+class EmbeddingSynonymIndex:
+    """
+    基于词向量的近邻同义词索引
+    词向量矩阵 (vocab_size, dim) 以.npy格式内存映射加载；首次使用时用分块矩阵乘法预计算每个词的
+    top-k余弦近邻表并缓存到磁盘，之后每次查询只是一次字典查找加一行表读取
+    缓存文件名包含实际的k和词向量、词表的指纹，替换词向量或词表后不会读到旧的近邻表
+    """
+
+    # 读取词向量文件开头多少字节参与指纹计算（.npy头部和前若干行）
+    FINGERPRINT_BYTES = 1 << 20
+
+    def __init__(self,
+                 embedding_path: str,
+                 vocab: Union[str, Sequence[str]],
+                 k: int = 50,
+                 cache_dir: Optional[str] = None,
+                 chunk_size: Optional[int] = None,
+                 chunk_memory_mb: int = 256):
+        """
+        Args:
+            embedding_path: 词向量矩阵文件（.npy）
+            vocab: 词表文件路径（每行一个词，与矩阵行对应）或词列表
+            k: 每个词保留的近邻数
+            cache_dir: 近邻表缓存目录（默认与词向量文件相同目录）
+            chunk_size: 预计算时每次矩阵乘法的查询词数（为None时按chunk_memory_mb计算）
+            chunk_memory_mb: 预计算时每块相似度矩阵 (chunk_size, vocab_size) 的内存上限
+        """
+        if int(chunk_memory_mb) <= 0:
+            raise ValueError("近邻表预计算的内存上限必须为正数")
+        self.embedding_path = embedding_path
+        self.k = k
+        self.chunk_size = chunk_size
+        self.chunk_memory_mb = int(chunk_memory_mb)
+        if isinstance(vocab, str):
+            with open(vocab, 'r', encoding='utf-8') as f:
+                vocab = [line.rstrip('\n') for line in f]
+        self.vocab: List[str] = list(vocab)
+        self.word2idx: Dict[str, int] = {w: i for i, w in enumerate(self.vocab)}
+
+        self.embeddings = np.load(embedding_path, mmap_mode='r')
+        if self.embeddings.shape[0] != len(self.vocab):
+            raise ValueError(f"词表大小({len(self.vocab)})与词向量行数({self.embeddings.shape[0]})不一致")
+
+        base = os.path.splitext(os.path.basename(embedding_path))[0]
+        cache_dir = cache_dir or os.path.dirname(os.path.abspath(embedding_path))
+        prefix = f"{base}.top{self._effective_k()}.{self._fingerprint()}"
+        self.neighbor_path = os.path.join(cache_dir, f"{prefix}.idx.npy")
+        self.similarity_path = os.path.join(cache_dir, f"{prefix}.sim.npy")
+        self.neighbors, self.similarities = self._load_or_build()
+
+    def _effective_k(self) -> int:
+        """实际保留的近邻数（不超过词表大小减一）"""
+        return max(0, min(self.k, self.embeddings.shape[0] - 1))
+
+    def _fingerprint(self) -> str:
+        """词向量文件大小、矩阵形状和类型、文件开头若干字节以及词表内容的廉价指纹"""
+        digest = hashlib.sha1()
+        digest.update(repr((os.path.getsize(self.embedding_path), self.embeddings.shape,
+                            str(self.embeddings.dtype))).encode('utf-8'))
+        with open(self.embedding_path, 'rb') as f:
+            digest.update(f.read(self.FINGERPRINT_BYTES))
+        digest.update('\n'.join(self.vocab).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _chunk_rows(self) -> int:
+        """每块的查询词数：显式指定的chunk_size，或使 (行数, vocab_size) 的float32相似度块不超过chunk_memory_mb"""
+        if self.chunk_size is not None:
+            return max(1, int(self.chunk_size))
+        return max(1, self.chunk_memory_mb * 1024 ** 2 // (4 * max(1, self.embeddings.shape[0])))
+
+    def _cache_valid(self) -> bool:
+        """缓存存在且不早于词向量文件时有效"""
+        if not (os.path.exists(self.neighbor_path) and os.path.exists(self.similarity_path)):
+            return False
+        source_mtime = os.path.getmtime(self.embedding_path)
+        return min(os.path.getmtime(self.neighbor_path), os.path.getmtime(self.similarity_path)) >= source_mtime
+
+    def _load_or_build(self) -> Tuple[np.ndarray, np.ndarray]:
+        """加载缓存的近邻表，不存在时预计算"""
+        if not self._cache_valid():
+            neighbors, similarities = self._build()
+            os.makedirs(os.path.dirname(self.neighbor_path), exist_ok=True)
+            for path, array in ((self.neighbor_path, neighbors), (self.similarity_path, similarities)):
+                tmp_path = path + '.tmp.npy'
+                np.save(tmp_path, array)
+                os.replace(tmp_path, path)
+        return np.load(self.neighbor_path, mmap_mode='r'), np.load(self.similarity_path, mmap_mode='r')
+
+    def _build(self) -> Tuple[np.ndarray, np.ndarray]:
+        """分块计算归一化词向量的相似度矩阵，只保留每行的top-k"""
+        vocab_size = self.embeddings.shape[0]
+        k = self._effective_k()
+        chunk_rows = self._chunk_rows()
+        matrix = torch.from_numpy(np.asarray(self.embeddings, dtype=np.float32))
+        matrix = matrix / (matrix.norm(dim=1, keepdim=True) + 1e-12)
+
+        neighbors = np.empty((vocab_size, k), dtype=np.int32)
+        similarities = np.empty((vocab_size, k), dtype=np.float16)
+        with torch.no_grad():
+            for start in range(0, vocab_size, chunk_rows):
+                end = min(start + chunk_rows, vocab_size)
+                sims = matrix[start:end] @ matrix.t()
+                # 排除词本身
+                rows = torch.arange(end - start)
+                sims[rows, rows + start] = float('-inf')
+                values, indices = sims.topk(k, dim=1)
+                neighbors[start:end] = indices.numpy()
+                similarities[start:end] = values.numpy()
+        return neighbors, similarities
+
+    def synonyms(self, word: str, threshold: float = 0.0, max_candidates: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        查询同义词
+        Args:
+            word: 原词
+            threshold: 余弦相似度阈值
+            max_candidates: 最多返回的候选数
+        Returns:
+            [(同义词, 相似度)]，按相似度从高到低排列；词不在词表中时返回空列表
+        """
+        idx = self.word2idx.get(word)
+        if idx is None:
+            return []
+        neighbors = self.neighbors[idx]
+        similarities = self.similarities[idx]
+        result = []
+        for n, s in zip(neighbors, similarities):
+            if s < threshold:
+                break
+            result.append((self.vocab[n], float(s)))
+            if max_candidates is not None and len(result) >= max_candidates:
+                break
+        return result
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from app.algorithms.utils.fingerprint import LOCAL_PREFIX, local_fingerprint
+
+
+class VictimQueryCache:
+    """
+    文本攻击的被攻击模型查询缓存
+    以 (模型指纹, 文本) 为键缓存模型输出的概率分布；内存部分是有界LRU，
+    可选把被淘汰的条目落盘到SQLite文件，内存未命中时再查磁盘。
+    落盘文件可能被其他进程共享，因此只有具有稳定指纹的模型（nn.Module、带fingerprint属性的对象等）的条目会落盘，
+    普通可调用对象的进程内令牌条目只保存在内存中。
+    TextFooler、BERT-Attack、DeepWordBug共享同一个缓存时，同一句内和跨攻击重复出现的扰动句都只前向一次
+    """
+
+    def __init__(self, max_entries=100000, spill_path=None):
+        """
+        Args:
+            max_entries: 内存中最多保留的条目数
+            spill_path: 落盘文件路径（为None时被淘汰的条目直接丢弃）
+        """
+        self.max_entries = max_entries
+        self.spill_path = spill_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if spill_path:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS victim_cache (key TEXT PRIMARY KEY, value BLOB)")
+        self.lookups = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.forward_batches = 0
+
+    def get(self, key):
+        """查询单个条目，未命中返回None"""
+        with self._lock:
+            self.lookups += 1
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+            if self._db is not None and not key.startswith(LOCAL_PREFIX):
+                row = self._db.execute("SELECT value FROM victim_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    value = torch.from_numpy(np.frombuffer(row[0], dtype=np.float32).copy())
+                    self._put_locked(key, value)
+                    return value
+        return None
+
+    def put(self, key, value):
+        """写入单个条目"""
+        with self._lock:
+            self._put_locked(key, value)
+
+    def _put_locked(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        spilled = []
+        while len(self._memory) > self.max_entries:
+            old_key, old_value = self._memory.popitem(last=False)
+            if old_key.startswith(LOCAL_PREFIX):
+                continue
+            spilled.append((old_key, old_value.numpy().astype(np.float32).tobytes()))
+        if spilled and self._db is not None:
+            self._db.executemany("INSERT OR REPLACE INTO victim_cache (key, value) VALUES (?, ?)", spilled)
+            self._db.commit()
+
+    def count_forward(self, batches):
+        """记录实际执行的前向批次数"""
+        with self._lock:
+            self.forward_batches += batches
+
+    def stats(self):
+        """命中统计：hits即节省的单句前向次数"""
+        hits = self.memory_hits + self.disk_hits
+        return {
+            'lookups': self.lookups,
+            'hits': hits,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.lookups - hits,
+            'hit_rate': hits / self.lookups if self.lookups else 0.0,
+            'forward_batches': self.forward_batches,
+            'entries': len(self._memory)
+        }
+
+    def clear(self):
+        """清空内存部分并重置统计"""
+        with self._lock:
+            self._memory.clear()
+            self.lookups = self.memory_hits = self.disk_hits = self.forward_batches = 0
+
+
+_DEFAULT_CACHE = None
+
+
+def default_query_cache():
+    """进程内共享的默认查询缓存（供所有文本攻击复用）"""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = VictimQueryCache()
+    return _DEFAULT_CACHE
+
+
+def resolve_query_cache(query_cache):
+    """攻击参数约定：None使用共享默认缓存，False禁用缓存，否则使用传入的缓存"""
+    if query_cache is None:
+        return default_query_cache()
+    if query_cache is False:
+        return None
+    return query_cache
+
+
+def _forward(model, texts, batch_size):
+    probs = []
+    with torch.no_grad():
+        for start in range(0, len(texts), batch_size):
+            outputs = torch.as_tensor(model(list(texts[start:start + batch_size])))
+            probs.append(torch.softmax(outputs.float(), dim=1).cpu())
+    return torch.cat(probs, dim=0)
+
+
+def query_victim(model, texts, batch_size=64, cache=None):
+    """
+    批量查询文本分类模型
+    模型约定为接收文本列表、返回logits张量 (batch, num_classes) 的可调用对象；
+    启用缓存时先查缓存，所有未命中（去重后）的文本合并成批次前向
+    Args:
+        model: 文本分类模型
+        texts: 文本列表
+        batch_size: 每次前向的最大文本数
+        cache: VictimQueryCache（为None时不缓存）
+    Returns:
+        probs: 概率分布 (len(texts), num_classes)，位于CPU
+    """
+    texts = list(texts)
+    fingerprint = local_fingerprint(model) if cache is not None else None
+    if fingerprint is None:
+        return _forward(model, texts, batch_size)
+
+    prefix = fingerprint + '\x1f'
+    results = [cache.get(prefix + text) for text in texts]
+    missing = list(OrderedDict.fromkeys(text for text, r in zip(texts, results) if r is None))
+    if missing:
+        probs = _forward(model, missing, batch_size)
+        cache.count_forward((len(missing) + batch_size - 1) // batch_size)
+        fresh = {}
+        for text, p in zip(missing, probs):
+            fresh[text] = p.clone()
+            cache.put(prefix + text, fresh[text])
+        results = [r if r is not None else fresh[text] for text, r in zip(texts, results)]
+    return torch.stack(results) if results else torch.zeros(0, 0)
@@ -4,10 +4,13 @@ import numpy as np
 from typing import List, Dict, Any, Optional, Callable
 import os
 import json
+import shutil
 from PIL import Image
 import torchvision.transforms as transforms
 import time
 
+from app.dataloader.shards import ShardedSampleDataset, ShardedSampleWriter
+
 class CustomDataset(Dataset):
     """
     自定义数据集
@@ -199,6 +202,16 @@ class SampleLibrary:
             'created_at': str(time.time())
         }
         
+        self._register_sample(sample_info)
+        
+        print(f"样本已添加到库: {sample_id} (版本: {version}, 类别: {category})")
+        return sample_path
+    
+    def _register_sample(self, sample_info: Dict[str, Any]):
+        """把样本信息写入元数据的样本、类别和版本索引"""
+        sample_id = sample_info['id']
+        category = sample_info['category']
+        version = sample_info['version']
         self.metadata['samples'][sample_id] = sample_info
         
         if category not in self.metadata['categories']:
@@ -210,9 +223,37 @@ class SampleLibrary:
         self.metadata['versions'][version].append(sample_id)
         
         self._save_metadata()
-        
-        print(f"样本已添加到库: {sample_id} (版本: {version}, 类别: {category})")
-        return sample_path
+    
+    def open_shard_writer(self,
+                          sample_id: str,
+                          category: str = 'adversarial',
+                          version: str = 'v1.0',
+                          shard_size: int = 1024,
+                          metadata: Optional[Dict[str, Any]] = None) -> ShardedSampleWriter:
+        """
+        以分片格式流式添加样本集（适用于无法一次性放入内存的大规模对抗样本集）
+        Args:
+            sample_id: 样本ID
+            category: 类别（clean, adversarial, augmented）
+            version: 版本
+            shard_size: 每个分片的样本数
+            metadata: 额外元数据（如攻击名称和参数）
+        Returns:
+            分片写入器（写完后调用close，或作为上下文管理器使用）
+        """
+        sample_dir = os.path.join(self.library_path, version, sample_id)
+        writer = ShardedSampleWriter(sample_dir, shard_size=shard_size, metadata=metadata)
+        self._register_sample({
+            'id': sample_id,
+            'path': sample_dir,
+            'format': 'shards',
+            'category': category,
+            'version': version,
+            'labels': [],
+            'metadata': metadata or {},
+            'created_at': str(time.time())
+        })
+        return writer
     
     def get_sample(self, sample_id: str, version: str = None) -> Dict[str, Any]:
         """获取样本"""
@@ -224,8 +265,16 @@ class SampleLibrary:
         if version and sample_info['version'] != version:
             raise ValueError(f"版本不匹配: 请求 {version}, 实际 {sample_info['version']}")
         
-        # 加载样本数据
-        sample_data = torch.load(sample_info['path'])
+        # 加载样本数据（分片格式返回内存映射数据集）
+        if sample_info.get('format') == 'shards':
+            sample_data = {
+                'data': ShardedSampleDataset(sample_info['path']),
+                'labels': None,
+                'category': sample_info['category'],
+                'metadata': sample_info['metadata']
+            }
+        else:
+            sample_data = torch.load(sample_info['path'])
         sample_data['info'] = sample_info
         
         return sample_data
@@ -253,7 +302,9 @@ class SampleLibrary:
         sample_info = self.metadata['samples'][sample_id]
         
         # 删除文件
-        if os.path.exists(sample_info['path']):
+        if os.path.isdir(sample_info['path']):
+            shutil.rmtree(sample_info['path'])
+        elif os.path.exists(sample_info['path']):
             os.remove(sample_info['path'])
         
         # 更新元数据
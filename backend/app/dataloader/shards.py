@@ -0,0 +1,269 @@
+import json
+import os
+import queue
+import threading
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+INDEX_FILE = 'index.json'
+
+
+class ShardedSampleWriter:
+    """
+    分片流式写入器
+    攻击逐块产生的对抗样本、标签和逐样本元数据写入定长的二进制分片（.npy，可内存映射读取）并维护索引文件；
+    写盘在后台线程完成，主线程可以同时生成下一批对抗样本。待写队列有上限，
+    生成速度超过写盘速度时write会阻塞，因此无论样本集多大，内存占用都保持不变
+    """
+
+    def __init__(self, root: str, shard_size: int = 1024, max_pending: int = 2,
+                 metadata: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            root: 分片目录
+            shard_size: 每个分片的样本数
+            max_pending: 后台线程待写的最大块数
+            metadata: 整个样本集的元数据（如攻击名称和参数），写入索引文件
+        """
+        self.root = root
+        self.shard_size = shard_size
+        self.metadata = metadata or {}
+        os.makedirs(root, exist_ok=True)
+
+        self.shards: List[Dict[str, Any]] = []
+        self.total = 0
+        self.sample_shape = None
+        self.dtype = None
+        self._images = None
+        self._labels = None
+        self._meta_file = None
+        self._fill = 0
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def write(self, images: torch.Tensor, labels=None, metadata: Optional[List[Dict[str, Any]]] = None):
+        """
+        写入一块样本（立即拷贝到CPU，实际写盘在后台线程）
+        Args:
+            images: 对抗样本 (n, ...)
+            labels: 标签 (n,)（为None时记为-1）
+            metadata: 逐样本元数据列表（长度为n的字典列表）
+        """
+        self._raise_pending_error()
+        if self._closed:
+            raise ValueError("写入器已关闭")
+        if not isinstance(images, torch.Tensor):
+            raise ValueError("分片写入器只支持张量样本")
+        # 显式拷贝：调用方之后复用或原地修改输入张量时不影响待写数据
+        data = images.detach().to('cpu', copy=True).numpy()
+        if labels is None:
+            label_array = np.full(len(data), -1, dtype=np.int64)
+        else:
+            label_array = torch.as_tensor(labels).detach().cpu().numpy().astype(np.int64).reshape(-1)
+        if len(label_array) != len(data) or (metadata is not None and len(metadata) != len(data)):
+            raise ValueError("样本、标签和元数据的数量不一致")
+        self._queue.put((data, label_array, metadata))
+
+    def consume(self, stream, sample_metadata: Optional[Dict[str, Any]] = None):
+        """
+        写入AttackBase.generate_stream等产生 (adv, labels) 的迭代器
+        Args:
+            stream: 产生 (adv, labels) 的迭代器
+            sample_metadata: 附加到每个样本的元数据（如攻击名称）
+        Returns:
+            写入的样本总数
+        """
+        for adv, labels in stream:
+            metadata = [dict(sample_metadata) for _ in range(len(adv))] if sample_metadata else None
+            self.write(adv, labels, metadata)
+        self.flush()
+        return self.total
+
+    def flush(self):
+        """等待后台线程写完所有已提交的块，并更新索引文件"""
+        self._queue.join()
+        self._raise_pending_error()
+        if self._images is not None:
+            self._images.flush()
+            self._labels.flush()
+            self._meta_file.flush()
+        self._write_index()
+
+    def close(self):
+        """写完所有数据并结束后台线程"""
+        if self._closed:
+            return
+        self._queue.join()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._finish_shard()
+        self._raise_pending_error()
+        self._write_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+            return
+        try:
+            self.close()
+        except Exception:
+            # with块内已有异常时，关闭失败不能覆盖原始异常
+            pass
+
+    def _raise_pending_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    self._append(*item)
+            except Exception as e:  # 异常交给主线程在下一次调用时抛出
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _shard_paths(self, shard_id):
+        prefix = os.path.join(self.root, f"shard_{shard_id:05d}")
+        return f"{prefix}.images.npy", f"{prefix}.labels.npy", f"{prefix}.meta.jsonl"
+
+    def _open_shard(self):
+        images_path, labels_path, meta_path = self._shard_paths(len(self.shards))
+        self._images = np.lib.format.open_memmap(images_path, mode='w+', dtype=self.dtype,
+                                                 shape=(self.shard_size,) + self.sample_shape)
+        self._labels = np.lib.format.open_memmap(labels_path, mode='w+', dtype=np.int64, shape=(self.shard_size,))
+        self._meta_file = open(meta_path, 'w', encoding='utf-8')
+        self._fill = 0
+        self.shards.append({
+            'images': os.path.basename(images_path),
+            'labels': os.path.basename(labels_path),
+            'metadata': os.path.basename(meta_path),
+            'count': 0
+        })
+
+    def _finish_shard(self):
+        if self._images is None:
+            return
+        self._images.flush()
+        self._labels.flush()
+        self._meta_file.close()
+        arrays = {'images': self._images, 'labels': self._labels}
+        fill = self._fill
+        self._images = self._labels = self._meta_file = None
+        if fill < self.shard_size:
+            # 最后一个分片没有写满：分片按shard_size预分配，截断为实际样本数，不在磁盘上留下未初始化的行
+            shard = self.shards[-1]
+            paths = {name: os.path.join(self.root, shard[name]) for name in arrays}
+            for name, path in paths.items():
+                np.save(path + '.tmp.npy', arrays[name][:fill])
+            arrays.clear()  # 先释放内存映射再替换文件
+            for path in paths.values():
+                os.replace(path + '.tmp.npy', path)
+
+    def _append(self, data, labels, metadata):
+        if self.sample_shape is None:
+            self.sample_shape = tuple(data.shape[1:])
+            self.dtype = data.dtype
+        elif tuple(data.shape[1:]) != self.sample_shape:
+            raise ValueError(f"样本形状不一致: {tuple(data.shape[1:])} != {self.sample_shape}")
+
+        start = 0
+        while start < len(data):
+            if self._images is None:
+                self._open_shard()
+            n = min(self.shard_size - self._fill, len(data) - start)
+            self._images[self._fill:self._fill + n] = data[start:start + n]
+            self._labels[self._fill:self._fill + n] = labels[start:start + n]
+            for i in range(start, start + n):
+                self._meta_file.write(json.dumps(metadata[i] if metadata is not None else {}, ensure_ascii=False) + '\n')
+            self._fill += n
+            self.total += n
+            self.shards[-1]['count'] = self._fill
+            start += n
+            if self._fill == self.shard_size:
+                self._finish_shard()
+                self._write_index()
+
+    def _write_index(self):
+        """原子地写入索引文件（已完成的分片在写入过程中即可被读取）"""
+        index = {
+            'total': self.total,
+            'shard_size': self.shard_size,
+            'sample_shape': list(self.sample_shape) if self.sample_shape is not None else None,
+            'dtype': str(self.dtype) if self.dtype is not None else None,
+            'shards': [dict(shard) for shard in self.shards],
+            'metadata': self.metadata
+        }
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class ShardedSampleDataset(Dataset):
+    """
+    按索引文件内存映射读取分片样本的数据集，可直接交给DataLoader做下游评估
+    """
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: 分片目录（包含index.json）
+        """
+        self.root = root
+        with open(os.path.join(root, INDEX_FILE), 'r', encoding='utf-8') as f:
+            self.index = json.load(f)
+        self.shards = [shard for shard in self.index['shards'] if shard['count'] > 0]
+        self.offsets = np.cumsum([0] + [shard['count'] for shard in self.shards]).tolist()
+        self._arrays = {}
+
+    def _shard_arrays(self, k):
+        if k not in self._arrays:
+            shard = self.shards[k]
+            images = np.load(os.path.join(self.root, shard['images']), mmap_mode='r')
+            labels = np.load(os.path.join(self.root, shard['labels']), mmap_mode='r')
+            self._arrays[k] = (images, labels)
+        return self._arrays[k]
+
+    def _locate(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        k = bisect_right(self.offsets, idx) - 1
+        return k, idx - self.offsets[k]
+
+    def __getitem__(self, idx):
+        k, j = self._locate(idx)
+        images, labels = self._shard_arrays(k)
+        return torch.from_numpy(np.array(images[j])), int(labels[j])
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def sample_metadata(self, idx) -> Dict[str, Any]:
+        """读取单个样本的元数据"""
+        k, j = self._locate(idx)
+        with open(os.path.join(self.root, self.shards[k]['metadata']), 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f):
+                if line_no == j:
+                    return json.loads(line)
+        return {}
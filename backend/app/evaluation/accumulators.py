@@ -0,0 +1,140 @@
+import torch
+from typing import Any, Dict, Iterable, Optional
+
+# 累加器状态中的计数项与求和项（全部为Python数值，可直接JSON序列化）
+_FIELDS = (
+    'total',            # 样本数
+    'clean_correct',    # 干净样本预测正确数
+    'adv_correct',      # 对抗样本预测正确数
+    'attack_success',   # 干净样本正确且对抗样本错误的样本数（ASR分子）
+    'l2_sum',           # 逐样本L2扰动之和
+    'linf_sum',         # 逐样本L∞扰动之和
+    'transfer_total',   # 提供了目标模型预测的样本数
+    'source_success',   # 其中源模型攻击成功的样本数（TASR分母）
+    'transfer_success'  # 其中目标模型也被攻击成功的样本数（TASR分子）
+)
+_COUNT_FIELDS = ('total', 'clean_correct', 'adv_correct', 'attack_success', 'transfer_total', 'source_success',
+                 'transfer_success')
+
+
+class MetricAccumulator:
+    """
+    流式、可合并的安全性指标累加器
+    逐批次update只累加计数和逐样本扰动范数之和，内存占用与样本总数无关；
+    多个分片（多进程、多节点）各自累加后用merge合并，state_dict可序列化后跨进程传递，
+    compute的结果与SecurityEvaluator.evaluate_predictions在完整数据集上的结果一致
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """清空累加状态"""
+        for name in _FIELDS:
+            setattr(self, name, 0 if name in _COUNT_FIELDS else 0.0)
+        return self
+
+    @torch.no_grad()
+    def update(self,
+               clean_data: torch.Tensor,
+               adv_data: torch.Tensor,
+               pred_clean: torch.Tensor,
+               pred_adv: torch.Tensor,
+               labels: torch.Tensor,
+               pred_adv_target: Optional[torch.Tensor] = None) -> 'MetricAccumulator':
+        """
+        累加一个批次
+        Args:
+            clean_data: 干净样本
+            adv_data: 对抗样本
+            pred_clean: 干净样本预测结果
+            pred_adv: 对抗样本预测结果
+            labels: 真实标签
+            pred_adv_target: 目标模型对对抗样本的预测结果（用于迁移攻击成功率，可选）
+        Returns:
+            self
+        """
+        labels = labels.to(pred_clean.device)
+        clean_correct = pred_clean == labels
+        adv_correct = pred_adv == labels
+        diff = (clean_data - adv_data).flatten(1).float()
+        values = [
+            clean_correct.sum(),
+            adv_correct.sum(),
+            (clean_correct & ~adv_correct).sum(),
+            diff.norm(p=2, dim=1).sum().to(clean_correct.device),
+            diff.abs().max(dim=1)[0].sum().to(clean_correct.device) if diff.numel() else diff.new_zeros(()),
+        ]
+        if pred_adv_target is not None:
+            source_success = clean_correct & ~adv_correct
+            values.append(source_success.sum())
+            values.append((source_success & (pred_adv_target.to(labels.device) != labels)).sum())
+        # 一次性取回所有数值，每个批次只同步一次
+        numbers = torch.stack([v.double() for v in values]).tolist()
+
+        self.total += labels.numel()
+        self.clean_correct += int(numbers[0])
+        self.adv_correct += int(numbers[1])
+        self.attack_success += int(numbers[2])
+        self.l2_sum += numbers[3]
+        self.linf_sum += numbers[4]
+        if pred_adv_target is not None:
+            self.transfer_total += labels.numel()
+            self.source_success += int(numbers[5])
+            self.transfer_success += int(numbers[6])
+        return self
+
+    def merge(self, other: 'MetricAccumulator') -> 'MetricAccumulator':
+        """合并另一个分片的累加状态（满足交换律和结合律）"""
+        for name in _FIELDS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def compute(self) -> Dict[str, float]:
+        """
+        计算各项指标
+        Returns:
+            评估结果字典（键与SecurityEvaluator.evaluate_predictions一致，提供了目标模型预测时
+            附加transfer_attack_success_rate）
+        """
+        total = max(self.total, 1)
+        clean_acc = self.clean_correct / total
+        robust_acc = self.adv_correct / total
+        results = {
+            'attack_success_rate': self.attack_success / self.clean_correct if self.clean_correct else 0.0,
+            'perturbation_l2': self.l2_sum / total,
+            'perturbation_linf': self.linf_sum / total,
+            'robust_accuracy': robust_acc,
+            'clean_accuracy': clean_acc,
+            'adversarial_gap': clean_acc - robust_acc
+        }
+        if self.transfer_total:
+            results['transfer_attack_success_rate'] = (self.transfer_success / self.source_success
+                                                       if self.source_success else 0.0)
+        return results
+
+    def state_dict(self) -> Dict[str, Any]:
+        """可序列化的累加状态"""
+        return {name: getattr(self, name) for name in _FIELDS}
+
+    def load_state_dict(self, state: Dict[str, Any]) -> 'MetricAccumulator':
+        """从state_dict恢复累加状态"""
+        missing = [name for name in _FIELDS if name not in state]
+        if missing:
+            raise ValueError(f"累加器状态缺少字段: {', '.join(missing)}")
+        for name in _FIELDS:
+            value = state[name]
+            setattr(self, name, int(value) if name in _COUNT_FIELDS else float(value))
+        return self
+
+    @classmethod
+    def from_state_dict(cls, state: Dict[str, Any]) -> 'MetricAccumulator':
+        return cls().load_state_dict(state)
+
+    @classmethod
+    def merge_all(cls, parts: Iterable[Any]) -> 'MetricAccumulator':
+        """合并多个分片（累加器或其state_dict）"""
+        merged = cls()
+        for part in parts:
+            merged.merge(part if isinstance(part, MetricAccumulator) else cls.from_state_dict(part))
+        return merged
@@ -0,0 +1,118 @@
+import torch
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.algorithms.attacks.cw import CWAttack
+from app.algorithms.attacks.deepfool import deepfool_attack
+from app.algorithms.attacks.fgsm import FGSMAttack
+from app.algorithms.attacks.pgd import PGDAttack
+from app.algorithms.utils.registry import resolve_adversarial_cache
+from app.evaluation.metrics import SecurityEvaluator
+
+
+class AttackCascade:
+    """
+    攻击级联评估
+    按从弱到强的顺序依次执行攻击（默认FGSM → PGD → C&W/DeepFool），
+    每一级只攻击前面各级都没有攻破的样本，开销大的攻击只作用于最难攻破的剩余样本；
+    最终合并各级结果，报告每个样本被哪一级攻破以及整体鲁棒精度；
+    启用对抗样本缓存时，各级对相同样本子集的攻击结果直接从缓存读取
+    """
+
+    CLEAN = 'clean'
+
+    def __init__(self, stages: Optional[List[Tuple[str, Any]]] = None, final_attack: str = 'cw', adv_cache=None):
+        """
+        Args:
+            stages: 攻击级列表 [(名称, 攻击器)]，攻击器为带attack(model, images, labels)方法的对象或同签名的函数
+            final_attack: 使用默认级联时的最后一级 ('cw', 'deepfool')
+            adv_cache: 对抗样本缓存（None使用config.yml配置的共享缓存，False禁用）
+        """
+        if stages is None:
+            stages = [('FGSM', FGSMAttack()), ('PGD', PGDAttack(early_stop=True))]
+            if final_attack == 'cw':
+                stages.append(('C&W', CWAttack()))
+            elif final_attack == 'deepfool':
+                stages.append(('DeepFool', deepfool_attack))
+            else:
+                raise ValueError(f"不支持的最后一级攻击: {final_attack}")
+        self.stages = stages
+        self.evaluator = SecurityEvaluator()
+        self.adv_cache = resolve_adversarial_cache(adv_cache)
+
+    @staticmethod
+    def _call_stage(attacker, model, images, labels):
+        if hasattr(attacker, 'attack'):
+            return attacker.attack(model, images, labels)
+        return attacker(model, images, labels)
+
+    def _run_stage(self, name, attacker, model, images, labels):
+        """
+        调用单级攻击
+        攻击器整体作为缓存键中的参数：对象按类型和公开属性、functools.partial按函数和绑定参数区分，
+        lambda等无法区分配置的攻击器不使用缓存
+        """
+        if self.adv_cache is None:
+            return self._call_stage(attacker, model, images, labels)
+        return self.adv_cache.get_or_generate(model, name, {'attacker': attacker}, images, labels,
+                                              lambda: self._call_stage(attacker, model, images, labels))
+
+    def run(self, model, images: torch.Tensor, labels: torch.Tensor) -> Dict[str, Any]:
+        """
+        执行级联攻击
+        Args:
+            model: 被攻击的模型
+            images: 输入图片 (batch, C, H, W)
+            labels: 正确标签
+        Returns:
+            结果字典：
+                adv_images: 合并后的对抗样本（未攻破的样本为最后一次尝试的结果，干净样本就已分类错误的保持原图）
+                broken_by: 每个样本被哪一级攻破（'clean'表示原图即分类错误，None表示所有攻击都未攻破）
+                stage_counts: 每一级攻破的样本数
+                metrics: 在合并结果上计算的SecurityEvaluator指标
+        """
+        model.eval()
+        pred_clean = self.evaluator.clean_logits(model, images).argmax(dim=1)
+
+        adv_images = images.clone().detach()
+        pred_adv = pred_clean.clone()
+        broken_by: List[Optional[str]] = [None] * images.size(0)
+        for i in (pred_clean != labels).nonzero(as_tuple=False).flatten().tolist():
+            broken_by[i] = self.CLEAN
+
+        survivors = pred_clean == labels
+        stage_counts = {}
+        for name, attacker in self.stages:
+            idx = survivors.nonzero(as_tuple=False).flatten()
+            stage_counts[name] = 0
+            if idx.numel() == 0:
+                continue
+
+            stage_adv = self._run_stage(name, attacker, model, images[idx], labels[idx]).detach()
+            with torch.no_grad():
+                stage_pred = model(stage_adv).argmax(dim=1)
+            fooled = stage_pred != labels[idx]
+
+            # 攻破的样本保留本级结果；未攻破的样本也记录本次尝试，便于统计扰动幅度
+            adv_images[idx] = stage_adv
+            pred_adv[idx] = stage_pred
+            survivors[idx[fooled]] = False
+            stage_counts[name] = int(fooled.sum())
+            for i in idx[fooled].tolist():
+                broken_by[i] = name
+
+        metrics = self.evaluator.evaluate_predictions(images, adv_images, pred_clean, pred_adv, labels)
+
+        return {
+            'adv_images': adv_images,
+            'broken_by': broken_by,
+            'stage_counts': stage_counts,
+            'metrics': metrics
+        }
+
+
+def attack_cascade(model, images, labels, stages=None, final_attack='cw', adv_cache=None):
+    """
+    兼容性函数，与其他攻击模块保持一致的函数式接口
+    """
+    cascade = AttackCascade(stages=stages, final_attack=final_attack, adv_cache=adv_cache)
+    return cascade.run(model, images, labels)
@@ -0,0 +1,148 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import torch
+
+from app.algorithms.utils.adv_cache import _update_digest
+from app.algorithms.utils.fingerprint import local_fingerprint
+from app.algorithms.utils.registry import coerce_value, load_config
+
+# 数据集张量 -> (版本签名, 哈希)，同一张量被原地修改后签名变化会触发重新计算
+_DATASET_HASHES = weakref.WeakKeyDictionary()
+
+_DEFAULT_CACHE = None
+
+
+def _tensor_signature(tensor):
+    """存储地址、版本号、形状、类型和设备，用于廉价地判断张量内容是否可能变化"""
+    return tensor.data_ptr(), tensor._version, tuple(tensor.shape), tensor.dtype, tensor.device
+
+
+def dataset_hash(data) -> str:
+    """
+    计算评估数据的内容哈希
+    张量的哈希按张量对象缓存（内容被原地修改后自动失效），同一干净样本集在多次攻击评估之间只计算一次；
+    推理张量（torch.inference_mode中创建）没有版本号，无法判断是否被原地修改，每次都重新计算
+    Args:
+        data: 干净样本（张量，或_update_digest支持的张量列表等）
+    Returns:
+        哈希字符串
+    """
+    if not isinstance(data, torch.Tensor) or data.is_inference():
+        digest = hashlib.sha1()
+        _update_digest(digest, data)
+        return digest.hexdigest()
+
+    signature = _tensor_signature(data)
+    cached = _DATASET_HASHES.get(data)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    digest = hashlib.sha1()
+    _update_digest(digest, data)
+    value = digest.hexdigest()
+    _DATASET_HASHES[data] = (signature, value)
+    return value
+
+
+class CleanLogitsCache:
+    """
+    干净样本logits缓存
+    键为 (模型指纹, 数据集哈希)：同一模型在同一干净样本集上的logits只推理一次，
+    之后针对不同攻击、不同评估器的评估直接复用；模型权重或数据内容变化时指纹/哈希随之变化，不会命中旧结果。
+    logits以CPU张量保存，按最近最少使用淘汰
+    """
+
+    def __init__(self, max_entries: int = 32):
+        """
+        Args:
+            max_entries: 最多缓存的 (模型, 数据集) 组合数
+        """
+        if int(max_entries) < 1:
+            raise ValueError("干净样本logits缓存容量必须为正整数")
+        self.max_entries = int(max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def key(model, data) -> Optional[Tuple[str, str]]:
+        """缓存键：(模型指纹, 数据集哈希)；模型无法标识时返回None（不缓存）"""
+        fingerprint = local_fingerprint(model)
+        if fingerprint is None:
+            return None
+        return fingerprint, dataset_hash(data)
+
+    def get(self, key) -> Optional[torch.Tensor]:
+        with self._lock:
+            logits = self._entries.get(key)
+            if logits is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return logits
+
+    def put(self, key, logits: torch.Tensor):
+        with self._lock:
+            self._entries[key] = logits.detach().cpu()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, model, data, forward: Callable[[], torch.Tensor]) -> torch.Tensor:
+        """
+        读取缓存的干净样本logits，未命中时调用forward推理并写入缓存
+        Args:
+            model: 被评估模型
+            data: 干净样本
+            forward: 无参推理函数，返回data上的logits
+        Returns:
+            logits（与forward的结果位于同一设备；命中时移动到data所在设备）
+        """
+        key = self.key(model, data)
+        if key is None:
+            return forward()
+        logits = self.get(key)
+        if logits is not None:
+            device = data.device if isinstance(data, torch.Tensor) else logits.device
+            return logits.to(device)
+        logits = forward()
+        self.put(key, logits)
+        return logits
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+def evaluation_config() -> Dict:
+    """config.yml中evaluation.inference的配置"""
+    return (load_config().get('evaluation') or {}).get('inference') or {}
+
+
+def default_clean_cache() -> Optional[CleanLogitsCache]:
+    """按config.yml中evaluation.inference的配置创建进程内共享的干净样本logits缓存（未启用时返回None）"""
+    global _DEFAULT_CACHE
+    config = evaluation_config()
+    if not config.get('clean_cache', False):
+        return None
+    if _DEFAULT_CACHE is None:
+        _DEFAULT_CACHE = CleanLogitsCache(max_entries=int(coerce_value(config.get('clean_cache_entries', 32))))
+    return _DEFAULT_CACHE
+
+
+def resolve_clean_cache(cache) -> Optional[CleanLogitsCache]:
+    """缓存参数约定：None使用config.yml配置的共享缓存，False禁用缓存，否则使用传入的缓存"""
+    if cache is None:
+        return default_clean_cache()
+    if cache is False:
+        return None
+    return cache
@@ -1,17 +1,57 @@
 import torch
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional
 import matplotlib.pyplot as plt
 
+from app.algorithms.utils.registry import coerce_value
+from app.evaluation.accumulators import MetricAccumulator
+from app.evaluation.clean_cache import evaluation_config, resolve_clean_cache
+
 class SecurityEvaluator:
     """
     AI模型安全性评估器
     任务书要求：实现攻击成功率（ASR）、扰动幅度、鲁棒精度、对抗精度差距、迁移攻击成功率（TASR）等指标
     """
     
-    def __init__(self):
-        """初始化评估器"""
-        pass
+    def __init__(self, batch_size: Optional[int] = None, clean_cache=None):
+        """
+        初始化评估器
+        Args:
+            batch_size: 模型推理的批次大小（为None时使用config.yml中evaluation.inference.batch_size）
+            clean_cache: 干净样本logits缓存（None使用config.yml配置的共享缓存，False禁用）
+        """
+        if batch_size is None:
+            batch_size = coerce_value(evaluation_config().get('batch_size', 256))
+        if int(batch_size) < 1:
+            raise ValueError("评估批次大小必须为正整数")
+        self.batch_size = int(batch_size)
+        self.clean_cache = resolve_clean_cache(clean_cache)
+    
+    def predict(self, model, data: torch.Tensor) -> torch.Tensor:
+        """
+        分批推理（inference_mode，不记录计算图和版本计数）
+        Args:
+            model: 被评估模型（调用方负责切换到eval模式）
+            data: 输入样本
+        Returns:
+            logits（与data位于同一设备）
+        """
+        with torch.inference_mode():
+            return torch.cat([model(chunk) for chunk in data.split(self.batch_size)])
+    
+    def clean_logits(self, model, clean_data: torch.Tensor) -> torch.Tensor:
+        """
+        干净样本logits：按 (模型指纹, 数据集哈希) 从缓存读取，未命中时分批推理并写入缓存
+        同一干净样本集针对多个攻击评估时只推理一次
+        Args:
+            model: 被评估模型（调用方负责切换到eval模式）
+            clean_data: 干净样本
+        Returns:
+            logits
+        """
+        if self.clean_cache is None:
+            return self.predict(model, clean_data)
+        return self.clean_cache.get_or_compute(model, clean_data, lambda: self.predict(model, clean_data))
     
     def attack_success_rate(self, pred_clean: torch.Tensor, pred_adv: torch.Tensor, labels: torch.Tensor) -> float:
         """
@@ -105,6 +145,70 @@ class SecurityEvaluator:
         tasr = (source_success & target_success).sum().item() / source_success_count
         return tasr
     
+    def evaluate_predictions(self,
+                             clean_data: torch.Tensor,
+                             adv_data: torch.Tensor,
+                             pred_clean: torch.Tensor,
+                             pred_adv: torch.Tensor,
+                             labels: torch.Tensor) -> Dict[str, float]:
+        """
+        根据已有的预测结果计算各项指标（不再调用模型）
+        Args:
+            clean_data: 干净样本
+            adv_data: 对抗样本
+            pred_clean: 干净样本预测结果
+            pred_adv: 对抗样本预测结果
+            labels: 真实标签
+        Returns:
+            评估结果字典
+        """
+        return MetricAccumulator().update(clean_data, adv_data, pred_clean, pred_adv, labels).compute()
+    
+    def accumulate(self,
+                   model,
+                   batches: Iterable,
+                   target_model=None,
+                   accumulator: Optional[MetricAccumulator] = None,
+                   device=None) -> MetricAccumulator:
+        """
+        流式评估：逐批次推理并累加指标，内存占用与数据集大小无关
+        分片评估时每个分片各自调用并返回累加器，最后用MetricAccumulator.merge（或merge_all）合并
+        Args:
+            model: 被评估模型
+            batches: 产生 (clean_data, adv_data, labels) 的迭代器（如DataLoader）
+            target_model: 目标模型（用于迁移攻击评估）
+            accumulator: 继续累加的累加器（为None时新建）
+            device: 批次数据移动到的设备（为None时不移动）
+        Returns:
+            累加器
+        """
+        accumulator = accumulator if accumulator is not None else MetricAccumulator()
+        model.eval()
+        if target_model is not None:
+            target_model.eval()
+        with torch.inference_mode():
+            for clean_data, adv_data, labels in batches:
+                if device is not None:
+                    clean_data, adv_data, labels = clean_data.to(device), adv_data.to(device), labels.to(device)
+                pred_clean = model(clean_data).argmax(dim=1)
+                pred_adv = model(adv_data).argmax(dim=1)
+                pred_adv_target = target_model(adv_data).argmax(dim=1) if target_model is not None else None
+                accumulator.update(clean_data, adv_data, pred_clean, pred_adv, labels, pred_adv_target)
+        return accumulator
+    
+    def streaming_evaluation(self, model, batches: Iterable, target_model=None, device=None) -> Dict[str, float]:
+        """
+        流式综合安全性评估（comprehensive_evaluation的逐批次版本）
+        Args:
+            model: 被评估模型
+            batches: 产生 (clean_data, adv_data, labels) 的迭代器（如DataLoader）
+            target_model: 目标模型（用于迁移攻击评估）
+            device: 批次数据移动到的设备（为None时不移动）
+        Returns:
+            评估结果字典
+        """
+        return self.accumulate(model, batches, target_model=target_model, device=device).compute()
+    
     def comprehensive_evaluation(self, 
                                model, 
                                clean_data: torch.Tensor, 
@@ -125,37 +229,19 @@ class SecurityEvaluator:
         """
         model.eval()
         
-        with torch.no_grad():
-            # 模型推理
-            pred_clean = model(clean_data).argmax(dim=1)
-            pred_adv = model(adv_data).argmax(dim=1)
-            
-            # 计算各项指标
-            asr = self.attack_success_rate(pred_clean, pred_adv, labels)
-            pert_l2 = self.perturbation_magnitude(clean_data, adv_data, 'l2')
-            pert_linf = self.perturbation_magnitude(clean_data, adv_data, 'linf')
-            robust_acc = self.robust_accuracy(pred_adv, labels)
-            clean_acc = (pred_clean == labels).float().mean().item()
-            adv_gap = self.adversarial_gap(clean_acc, robust_acc)
-            
-            results = {
-                'attack_success_rate': asr,
-                'perturbation_l2': pert_l2,
-                'perturbation_linf': pert_linf,
-                'robust_accuracy': robust_acc,
-                'clean_accuracy': clean_acc,
-                'adversarial_gap': adv_gap
-            }
-            
-            # 迁移攻击评估
-            if target_model is not None:
-                target_model.eval()
-                with torch.no_grad():
-                    pred_adv_target = target_model(adv_data).argmax(dim=1)
-                    tasr = self.transfer_attack_success_rate(pred_clean, pred_adv, pred_adv_target, labels)
-                    results['transfer_attack_success_rate'] = tasr
+        # 模型推理（分批；干净样本logits在相同模型和数据集上复用）
+        pred_clean = self.clean_logits(model, clean_data).argmax(dim=1)
+        pred_adv = self.predict(model, adv_data).argmax(dim=1)
+        
+        # 迁移攻击评估
+        pred_adv_target = None
+        if target_model is not None:
+            target_model.eval()
+            pred_adv_target = self.predict(target_model, adv_data).argmax(dim=1)
         
-        return results
+        # 计算各项指标（提供目标模型预测时附加迁移攻击成功率）
+        return MetricAccumulator().update(clean_data, adv_data, pred_clean, pred_adv, labels,
+                                          pred_adv_target).compute()
     
     def visualize_results(self, 
                          results: Dict[str, float], 
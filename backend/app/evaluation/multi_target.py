@@ -0,0 +1,103 @@
+import torch
+from typing import Any, Dict, Optional, Sequence
+
+
+class MultiTargetAttack:
+    """
+    批量多目标攻击评估
+    把每个输入按请求的目标类别展开为 (样本 × 目标) 的网格，按块放进同一批次做目标攻击，
+    避免逐个目标调用attack的开销；返回逐目标的攻击成功矩阵（目标鲁棒性矩阵）。
+    对抗样本默认不保留：需要时可以逐块写入分片写入器（内存占用只取决于chunk_size），
+    或者显式要求返回完整网格（需要 n × T 份图片的内存）
+    """
+
+    def __init__(self, attacker, chunk_size: int = 256, return_images: bool = False, writer=None):
+        """
+        Args:
+            attacker: 目标攻击器（targeted=True的PGDAttack、FGSMAttack、CWAttack等，
+                      提供attack(model, images, labels, target_labels)方法）
+            chunk_size: 每次攻击的最大 (样本, 目标) 组合数
+            return_images: 是否返回对抗样本网格（在内存中分配完整的 n × T 网格，只适合小规模评估）
+            writer: 分片写入器（ShardedSampleWriter，为None时不写盘）；每块对抗样本攻击完成后立即写入，
+                    标签记为目标类别，逐样本元数据记录样本下标、目标类别和正确标签
+        """
+        if not getattr(attacker, 'targeted', False):
+            raise ValueError("多目标攻击需要targeted=True的攻击器")
+        self.attacker = attacker
+        self.chunk_size = chunk_size
+        self.return_images = return_images
+        self.writer = writer
+
+    def run(self, model, images: torch.Tensor, labels: torch.Tensor,
+            targets: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+        """
+        执行多目标攻击
+        Args:
+            model: 被攻击的模型
+            images: 输入图片 (n, C, H, W)
+            labels: 正确标签 (n,)
+            targets: 目标类别列表（为None时使用模型输出的全部类别）
+        Returns:
+            结果字典：
+                targets: 目标类别 (T,)
+                adv_images: 对抗样本网格 (n, T, C, H, W)（return_images为False时为None）
+                success: 逐样本逐目标是否攻击成功 (n, T)（目标类别等于正确标签的位置为False）
+                success_rate: 每个目标类别的攻击成功率 (T,)
+        """
+        device = images.device
+        n = images.size(0)
+        labels = labels.to(device)
+        if targets is None:
+            model.eval()
+            with torch.no_grad():
+                num_classes = model(images[:1]).size(1)
+            targets = range(num_classes)
+        targets = torch.as_tensor(list(targets), dtype=torch.long, device=device)
+        num_targets = targets.numel()
+
+        # 网格按 (样本, 目标) 行优先展开，第 i*T + t 行对应样本i、目标t；
+        # 目标等于正确标签的组合不需要攻击，只对其余组合按块攻击
+        total = n * num_targets
+        sample_of = torch.arange(n, device=device).repeat_interleave(num_targets)
+        target_of = targets.repeat(n)
+        pending = (target_of != labels[sample_of]).nonzero(as_tuple=False).flatten()
+        success = torch.zeros(total, dtype=torch.bool, device=device)
+        adv_grid = images[sample_of].clone() if self.return_images else None
+
+        for start in range(0, pending.numel(), self.chunk_size):
+            rows = pending[start:start + self.chunk_size]
+            chunk_targets = target_of[rows]
+            adv = self.attacker.attack(model, images[sample_of[rows]], labels[sample_of[rows]],
+                                       target_labels=chunk_targets).detach()
+            with torch.no_grad():
+                success[rows] = model(adv).argmax(dim=1) == chunk_targets
+            if adv_grid is not None:
+                adv_grid[rows] = adv
+            if self.writer is not None:
+                owners = sample_of[rows]
+                metadata = [{'sample': s, 'target': t, 'label': l} for s, t, l in
+                            zip(owners.tolist(), chunk_targets.tolist(), labels[owners].tolist())]
+                self.writer.write(adv, chunk_targets, metadata)
+
+        if self.writer is not None:
+            self.writer.flush()
+
+        success = success.view(n, num_targets)
+        # 目标类别等于正确标签的组合不计入该目标的成功率
+        valid = targets.unsqueeze(0) != labels.unsqueeze(1)
+        success_rate = success.sum(dim=0).float() / valid.sum(dim=0).clamp(min=1).float()
+        return {
+            'targets': targets,
+            'adv_images': adv_grid.view(n, num_targets, *images.shape[1:]) if adv_grid is not None else None,
+            'success': success,
+            'success_rate': success_rate
+        }
+
+
+def multi_target_attack(attacker, model, images, labels, targets=None, chunk_size=256, return_images=False,
+                        writer=None):
+    """
+    兼容性函数，与其他攻击模块保持一致的函数式接口
+    """
+    runner = MultiTargetAttack(attacker, chunk_size=chunk_size, return_images=return_images, writer=writer)
+    return runner.run(model, images, labels, targets)
@@ -0,0 +1,39 @@
+"""
+对抗样本缓存测试
+"""
+
+import pytest
+
+torch = pytest.importorskip('torch')
+nn = torch.nn
+
+from app.algorithms.utils.adv_cache import AdversarialCache
+
+
+def _batch():
+    torch.manual_seed(0)
+    return nn.Linear(4, 3), torch.rand(2, 4), torch.tensor([0, 1])
+
+
+def test_loss_modules_with_different_config_get_different_keys(tmp_path):
+    """没有参数的损失函数模块按配置区分，不同的损失配置不能共享缓存键"""
+    cache = AdversarialCache(str(tmp_path))
+    model, x, y = _batch()
+    default_key = cache.make_key(model, 'PGD', {'loss_fn': nn.CrossEntropyLoss()}, x, y)
+    smoothed_key = cache.make_key(model, 'PGD', {'loss_fn': nn.CrossEntropyLoss(label_smoothing=0.9,
+                                                                                 reduction='sum')}, x, y)
+    assert default_key is not None and smoothed_key is not None
+    assert default_key != smoothed_key
+    assert default_key == cache.make_key(model, 'PGD', {'loss_fn': nn.CrossEntropyLoss()}, x, y)
+
+
+def test_different_loss_config_misses(tmp_path):
+    cache = AdversarialCache(str(tmp_path))
+    model, x, y = _batch()
+    first = cache.get_or_generate(model, 'PGD', {'loss_fn': nn.CrossEntropyLoss()}, x, y, lambda: x + 1)
+    second = cache.get_or_generate(model, 'PGD', {'loss_fn': nn.CrossEntropyLoss(label_smoothing=0.9)}, x, y,
+                                   lambda: x + 2)
+    assert torch.equal(first, x + 1)
+    assert torch.equal(second, x + 2)
+    assert cache.stats()['hits'] == 0
+    assert cache.stats()['misses'] == 2
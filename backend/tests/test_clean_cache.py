@@ -0,0 +1,31 @@
+"""
+干净样本logits缓存测试
+"""
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from app.evaluation.clean_cache import CleanLogitsCache, dataset_hash
+
+
+def test_dataset_hash_accepts_inference_tensors():
+    """推理张量没有版本号，哈希按内容计算且不缓存"""
+    with torch.inference_mode():
+        data = torch.rand(4, 3)
+    assert data.is_inference()
+    assert dataset_hash(data) == dataset_hash(data.clone())
+    with torch.inference_mode():
+        data.add_(1)
+    assert dataset_hash(data) == dataset_hash(data.clone())
+
+
+def test_clean_cache_with_inference_tensor():
+    model = torch.nn.Linear(3, 2)
+    with torch.inference_mode():
+        data = torch.rand(4, 3)
+        cache = CleanLogitsCache()
+        first = cache.get_or_compute(model, data, lambda: model(data))
+        second = cache.get_or_compute(model, data, lambda: model(data))
+    assert torch.equal(first, second)
+    assert cache.stats()['hits'] == 1
@@ -0,0 +1,36 @@
+"""
+分片写入器测试
+"""
+
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+torch = pytest.importorskip('torch')
+
+from app.dataloader.shards import ShardedSampleDataset, ShardedSampleWriter
+
+
+def test_last_shard_is_truncated_on_close(tmp_path):
+    root = str(tmp_path)
+    images = torch.rand(12, 3, 8, 8)
+    with ShardedSampleWriter(root, shard_size=10) as writer:
+        writer.write(images, torch.arange(12))
+
+    assert np.load(os.path.join(root, 'shard_00000.images.npy')).shape == (10, 3, 8, 8)
+    assert np.load(os.path.join(root, 'shard_00001.images.npy')).shape == (2, 3, 8, 8)
+    assert np.load(os.path.join(root, 'shard_00001.labels.npy')).tolist() == [10, 11]
+    dataset = ShardedSampleDataset(root)
+    assert len(dataset) == 12
+    assert torch.allclose(torch.as_tensor(dataset[11][0]), images[11])
+
+
+def test_exit_keeps_the_original_exception(tmp_path):
+    with pytest.raises(KeyError):
+        with ShardedSampleWriter(str(tmp_path), shard_size=4) as writer:
+            writer.write(torch.rand(2, 3))
+            # 后台线程写入失败的样本，close时会再抛出
+            writer.write(torch.rand(2, 5))
+            writer._queue.join()
+            raise KeyError('attack failed')
@@ -0,0 +1,40 @@
+"""
+词向量同义词索引测试
+"""
+
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('torch')
+
+from app.algorithms.utils.synonym_index import EmbeddingSynonymIndex
+
+
+def _write(path, seed):
+    np.save(path, np.random.RandomState(seed).rand(6, 4).astype(np.float32))
+
+
+def test_cache_file_tracks_embeddings_vocab_and_clamped_k(tmp_path):
+    path = str(tmp_path / 'emb.npy')
+    vocab = ['a', 'b', 'c', 'd', 'e', 'f']
+    _write(path, 0)
+    first = EmbeddingSynonymIndex(path, vocab, k=50, chunk_size=2)
+    assert '.top5.' in os.path.basename(first.neighbor_path)
+    assert first.neighbors.shape == (6, 5)
+
+    # 同样的词向量和词表复用缓存；词表或词向量变化后使用新的缓存文件
+    assert EmbeddingSynonymIndex(path, vocab, k=50).neighbor_path == first.neighbor_path
+    assert EmbeddingSynonymIndex(path, vocab[::-1], k=50).neighbor_path != first.neighbor_path
+    _write(path, 1)
+    assert EmbeddingSynonymIndex(path, vocab, k=50).neighbor_path != first.neighbor_path
+
+
+def test_chunked_build_matches_single_chunk(tmp_path):
+    path = str(tmp_path / 'emb.npy')
+    _write(path, 0)
+    vocab = list('abcdef')
+    small = EmbeddingSynonymIndex(path, vocab, k=3, cache_dir=str(tmp_path / 'small'), chunk_size=1)
+    whole = EmbeddingSynonymIndex(path, vocab, k=3, cache_dir=str(tmp_path / 'whole'), chunk_size=6)
+    assert np.array_equal(np.asarray(small.neighbors), np.asarray(whole.neighbors))